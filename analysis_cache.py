@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from peakAnalyzer import PeakResult
+
+# Default memory budget of the stage cache
+DEFAULT_CACHE_BYTES = 1 << 30  # 1 GiB
+
+
+def estimate_nbytes(value):
+    """Approximate memory held by a cached stage result"""
+    if isinstance(value, np.ndarray) or hasattr(value, "nbytes"):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=True, deep=False)))
+    if isinstance(value, PeakResult):
+        return value.table.nbytes
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(item) for item in value)
+    return 64  # Scalars and small objects
+
+
+class StageCache:
+    """
+    Thread-safe LRU cache for results of the analysis pipeline stages.
+
+    Keys are tuples starting with the identity of the loaded recording,
+    followed by the stage name and every parameter the stage depends on, e.g.
+    (recording_id, "filter", "adc1", downsample_rate, window, poly_order).
+    Entries are evicted least recently used first once the total estimated
+    size exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, default=None):
+        """Return a cached value and mark it as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Store a value, evicting least recently used entries if over budget"""
+        size = estimate_nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return  # Would evict everything else and still not fit
+
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing and storing it if missing"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def discard(self, recording_id, stages=None):
+        """Drop all entries of a recording, or only those of the named stages"""
+        with self._lock:
+            for key in [
+                key
+                for key in self._entries
+                if key[0] == recording_id and (stages is None or key[1] in stages)
+            ]:
+                self.total_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
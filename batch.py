@@ -0,0 +1,402 @@
+"""
+Headless batch analysis of many recordings.
+
+Runs load -> downsample -> filter -> peak detection -> export for every input
+recording on a process pool, without Tk. Writes one peaks CSV per input and a
+summary table with per-file timings.
+
+Usage:
+    python batch.py recordings/ "more/*.npy" --params params.json --output-dir out/
+
+With --block-size every channel is streamed through filtering and peak
+detection in blocks of that many samples instead of being loaded whole, for
+recordings larger than RAM. The peaks are then not always identical to a
+whole-file run: the filter window and detection thresholds are derived from
+the first 100 expected periods only, so peaks near the prominence threshold
+can be added or dropped, shift by a sample, or change class
+(see PeakDetector.detect_peaks_chunked).
+
+The parameter file is JSON with the same settings and units as the GUI
+sliders, any missing setting uses the GUI default:
+    {"window_length": 31, "poly_order": 2, "prominence_threshold": 40,
+     "amplitude_tolerance": 6.0, "high_threshold": 30, "medium_threshold": 9,
+     "auto_period": false, "refine_peaks": false}
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from file_operations import (
+    iter_adc_blocks,
+    output_names,
+    read_recording,
+    write_peaks_csv,
+)
+from filter_engine import savgol
+from recording_container import CONTAINER_EXTENSION
+from refinement import decimate, refine_result
+from signal_processing import (
+    check_filter_params,
+    detect_signal_peaks,
+    detect_signal_peaks_chunked,
+    filter_blocks,
+)
+from tracing import NULL_TRACER, Tracer
+
+DEFAULT_PARAMS = {
+    "window_length": 31,
+    "poly_order": 2,
+    "prominence_threshold": 40,
+    "amplitude_tolerance": 6.0,
+    "high_threshold": 30,
+    "medium_threshold": 9,
+    "auto_period": False,
+    "refine_peaks": False,
+}
+
+SAMPLE_RATE = 50000
+DOWNSAMPLE_RATE = 10
+RECORDING_EXTENSIONS = (".csv", ".npy", CONTAINER_EXTENSION)
+
+
+def load_params(path):
+    """Read a JSON parameter file on top of the defaults"""
+    params = dict(DEFAULT_PARAMS)
+    if path:
+        with open(path) as f:
+            params.update(json.load(f))
+
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    if params["window_length"] % 2 == 0:  # Ensure window length is odd
+        params["window_length"] += 1
+    check_filter_params(params["window_length"], params["poly_order"])
+    return params
+
+
+def peak_params(params):
+    """Detection parameters in the form used by detect_signal_peaks"""
+    return {
+        "prominence_threshold": float(params["prominence_threshold"]),
+        "amplitude_tolerance": float(params["amplitude_tolerance"]),
+        "high_threshold": float(params["high_threshold"]) / 100,
+        "medium_threshold": float(params["medium_threshold"]) / 100,
+        "auto_period": bool(params["auto_period"]),
+    }
+
+
+def find_recordings(patterns):
+    """Expand directories and glob patterns into a sorted list of recordings"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*")
+        for path in glob.glob(pattern):
+            if path.lower().endswith(RECORDING_EXTENSIONS) and os.path.isfile(path):
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def output_path(name, output_dir, suffix="_peaks.csv"):
+    return os.path.join(output_dir, name + suffix)
+
+
+def downsample_blocks(blocks, step, sizes=None):
+    """
+    Every step-th sample of a signal delivered as blocks, as signal[::step].
+
+    Args:
+        sizes: optional list the length of every input block is appended to
+    """
+    consumed = 0
+    for block in blocks:
+        yield block[-consumed % step :: step]
+        consumed += len(block)
+        if sizes is not None:
+            sizes.append(len(block))
+
+
+def add_channel_properties(row, name, properties, params):
+    """Peak count, frequency and quality of a channel in a summary row"""
+    row[f"{name}_peaks"] = properties.get("peak_count", 0)
+    row[f"{name}_frequency"] = properties.get("actual_frequency", np.nan)
+    row[f"{name}_quality"] = properties.get("signal_quality", np.nan)
+    if params["auto_period"]:
+        row[f"{name}_period"] = properties.get("expected_period", np.nan)
+        row[f"{name}_period_confidence"] = properties.get("period_confidence", np.nan)
+
+
+def detect_file(input_path, params, row, tracer=NULL_TRACER):
+    """
+    Load, filter and detect the peaks of a whole recording for analyze_file.
+
+    Returns:
+        PeakResult of every channel
+    """
+    start = perf_counter()
+    with tracer.span("load", file=os.path.basename(input_path)):
+        data = read_recording(input_path)
+        if params["refine_peaks"]:  # Anti-aliased, peaks are refined below
+            downsampled_data = pd.DataFrame(
+                {
+                    name: decimate(data[name].to_numpy(), DOWNSAMPLE_RATE)
+                    for name in ("adc1", "adc2")
+                }
+            )
+        else:
+            downsampled_data = data.iloc[::DOWNSAMPLE_RATE]
+        time = np.arange(len(downsampled_data)) / (SAMPLE_RATE / DOWNSAMPLE_RATE)
+    row["samples"] = len(data)
+    row["load_s"] = perf_counter() - start
+
+    results = []
+    row["filter_s"] = row["detect_s"] = 0.0
+    for name in ("adc1", "adc2"):
+        stage = perf_counter()
+        with tracer.span("filter", channel=name, samples=len(downsampled_data)):
+            filtered = savgol(
+                downsampled_data[name],
+                params["window_length"],
+                params["poly_order"],
+            )
+        row["filter_s"] += perf_counter() - stage
+
+        stage = perf_counter()
+        with tracer.span("detect", channel=name, samples=len(filtered)):
+            _, properties = detect_signal_peaks(
+                filtered, peak_params(params), time, tracer
+            )
+        row["detect_s"] += perf_counter() - stage
+
+        result = properties["result"]
+        if params["refine_peaks"]:
+            with tracer.span("refine", channel=name, peaks=len(result)):
+                result = refine_result(
+                    result,
+                    data[name].to_numpy(),
+                    DOWNSAMPLE_RATE,
+                    SAMPLE_RATE,
+                    params["window_length"],
+                    params["poly_order"],
+                )
+        results.append(result)
+        add_channel_properties(row, name, properties, params)
+    return results
+
+
+def detect_chunked(input_path, params, block_size, row, tracer=NULL_TRACER):
+    """
+    Streamed detection of analyze_file, holding about one block at a time.
+
+    Every channel is read with iter_adc_blocks, downsampled, filtered with
+    filter_blocks and searched with detect_peaks_chunked in one pass, so
+    the time of all of it is reported as detect_s.
+
+    Returns:
+        PeakResult of every channel
+    """
+    results = []
+    row["load_s"] = row["filter_s"] = row["detect_s"] = 0.0
+    for name in ("adc1", "adc2"):
+        stage = perf_counter()
+        sizes = []
+        with tracer.span("detect", channel=name, block_size=block_size):
+            blocks = downsample_blocks(
+                iter_adc_blocks(input_path, name, block_size), DOWNSAMPLE_RATE, sizes
+            )
+            properties = detect_signal_peaks_chunked(
+                filter_blocks(blocks, params["window_length"], params["poly_order"]),
+                peak_params(params),
+                SAMPLE_RATE / DOWNSAMPLE_RATE,
+                tracer,
+            )
+        row["detect_s"] += perf_counter() - stage
+        row["samples"] = sum(sizes)
+        results.append(properties["result"])
+        add_channel_properties(row, name, properties, params)
+    return results
+
+
+def analyze_file(
+    input_path, output_dir, params, trace=False, name=None, block_size=None
+):
+    """
+    Analyze one recording and return its summary row.
+
+    With trace, the stage timings are also written as a Chrome trace JSON
+    file next to the peaks (see tracing.Tracer).
+
+    Args:
+        name: output file name without suffix, see output_names; the
+            stem of input_path by default
+        block_size: stream the recording in blocks of this many samples,
+            see detect_chunked; refine_peaks is not supported then
+    """
+    if name is None:
+        name = output_names([input_path])[0]
+    row = {"file": input_path, "output": output_path(name, output_dir)}
+    tracer = Tracer() if trace else NULL_TRACER
+    start = perf_counter()
+    try:
+        if block_size:
+            results = detect_chunked(input_path, params, block_size, row, tracer)
+        else:
+            results = detect_file(input_path, params, row, tracer)
+
+        stage = perf_counter()
+        with tracer.span("export"):
+            row["exported_peaks"] = write_peaks_csv(row["output"], results)
+        row["export_s"] = perf_counter() - stage
+        row["status"] = "ok"
+
+    except Exception as e:
+        row["status"] = f"error: {e}"
+
+    row["total_s"] = perf_counter() - start
+    if trace:
+        tracer.write_json(output_path(name, output_dir, "_trace.json"))
+    return row
+
+
+def run_batch(
+    inputs,
+    output_dir,
+    params,
+    workers=None,
+    trace=False,
+    progress=print,
+    block_size=None,
+):
+    """
+    Analyze all inputs on a process pool, returns the summary DataFrame.
+
+    With block_size the recordings are streamed, see analyze_file.
+
+    Raises:
+        ValueError: if the output names of the inputs cannot be made unique
+    """
+    names = output_names(inputs)
+    os.makedirs(output_dir, exist_ok=True)
+    rows = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                analyze_file, path, output_dir, params, trace, name, block_size
+            ): path
+            for path, name in zip(inputs, names)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            row = future.result()
+            rows[futures[future]] = row
+            progress(
+                f"[{done}/{len(inputs)}] {os.path.basename(row['file'])}: "
+                f"{row['status']} ({row['total_s']:.2f} s)"
+            )
+
+    # Keep the input order in the summary
+    columns = [
+        "file",
+        "status",
+        "samples",
+        "adc1_peaks",
+        "adc2_peaks",
+        "exported_peaks",
+        "adc1_frequency",
+        "adc2_frequency",
+        "adc1_quality",
+        "adc2_quality",
+        "load_s",
+        "filter_s",
+        "detect_s",
+        "export_s",
+        "total_s",
+        "output",
+    ]
+    if params["auto_period"]:
+        position = columns.index("load_s")
+        columns[position:position] = [
+            "adc1_period",
+            "adc2_period",
+            "adc1_period_confidence",
+            "adc2_period_confidence",
+        ]
+    summary = pd.DataFrame([rows[path] for path in inputs], columns=columns)
+    counts = ["samples", "adc1_peaks", "adc2_peaks", "exported_peaks"]
+    summary[counts] = summary[counts].astype("Int64")  # Failed files leave gaps
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analyze CSV/NPY recordings without the GUI"
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="recording files, directories or glob patterns"
+    )
+    parser.add_argument("--params", help="JSON parameter file")
+    parser.add_argument(
+        "--output-dir", default="peaks_output", help="directory for the results"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="worker processes (default: CPUs)"
+    )
+    parser.add_argument(
+        "--summary", default=None, help="summary CSV path (default: in output dir)"
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="write the stage timings of every file as <name>_trace.json",
+    )
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=None,
+        help="stream every channel in blocks of this many samples, for "
+        "recordings larger than RAM; thresholds come from the start of the "
+        "recording, so peaks near them can differ from a whole-file run",
+    )
+    args = parser.parse_args(argv)
+    if args.block_size is not None and args.block_size < 1:
+        parser.error("--block-size must be positive")
+
+    try:
+        params = load_params(args.params)
+    except (OSError, ValueError) as e:
+        parser.error(f"Invalid parameter file: {e}")
+    if args.block_size and params["refine_peaks"]:
+        parser.error("refine_peaks needs whole recordings, it cannot use --block-size")
+
+    inputs = find_recordings(args.inputs)
+    if not inputs:
+        parser.error("No .csv, .npy or .adcz recordings found")
+
+    try:
+        summary = run_batch(
+            inputs,
+            args.output_dir,
+            params,
+            args.workers,
+            args.trace,
+            block_size=args.block_size,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    summary_path = args.summary or os.path.join(args.output_dir, "summary.csv")
+    summary.to_csv(summary_path, index=False, float_format="%.4f")
+    print(f"Summary written to {summary_path}")
+
+    return 0 if (summary["status"] == "ok").all() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
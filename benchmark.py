@@ -0,0 +1,330 @@
+"""
+Benchmarks of the loading and analysis stages on synthetic recordings.
+
+Every stage is timed on recordings of several durations and its peak memory
+is traced in a separate run. Results are written as JSON so runs of
+different revisions can be compared, e.g.
+
+    python benchmark.py --output base.json
+    (change something)
+    python benchmark.py --output new.json --baseline base.json
+
+exits with status 1 if any stage became slower or uses more memory than the
+baseline by more than the threshold.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+from statistics import median
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from file_operations import read_csv_file, read_npy_file, write_npy_file
+from peakAnalyzer import PeakDetector
+from signal_processing import detect_signal_peaks, process_signal
+from synthetic import SyntheticRecording
+
+# Durations in seconds, from one second to one hour
+DEFAULT_SIZES = (1, 10, 60, 600, 3600)
+
+# CSV files of longer recordings take minutes to write and gigabytes of disk
+DEFAULT_CSV_MAX_DURATION = 600
+
+# Analysis settings of the GUI defaults
+DOWNSAMPLE_RATE = 10
+WINDOW_LENGTH = 31
+POLY_ORDER = 2
+PEAK_PARAMS = {
+    "prominence_threshold": 40.0,
+    "amplitude_tolerance": 6.0,
+    "high_threshold": 0.3,
+    "medium_threshold": 0.09,
+}
+
+# Changes smaller than these are treated as noise when comparing runs
+MIN_TIME_CHANGE = 0.005  # seconds
+MIN_MEMORY_CHANGE = 1 << 20  # bytes
+
+STAGES = (
+    "load_csv",
+    "convert_to_npy",
+    "load_npy",
+    "load_npy_mmap",
+    "process_signal",
+    "prepare_signal",
+    "filter_peaks",
+    "detect_peaks",
+)
+
+
+class StageInputs:
+    """Files and intermediate results a recording's stages start from"""
+
+    def __init__(self, recording, data_dir, csv_max_duration):
+        stem = f"synthetic_{recording.duration:g}s_seed{recording.seed}"
+        self.npy_path = os.path.join(data_dir, stem + ".npy")
+        self.csv_path = None
+        self.output_path = os.path.join(data_dir, stem + "_converted.npy")
+
+        if not os.path.exists(self.npy_path):
+            recording.write_npy(self.npy_path)
+        if recording.duration <= csv_max_duration:
+            self.csv_path = os.path.join(data_dir, stem + ".csv")
+            if not os.path.exists(self.csv_path):
+                recording.write_csv(self.csv_path)
+
+        self.data = read_npy_file(self.npy_path)
+        self.signal = self.data["adc1"].values[::DOWNSAMPLE_RATE]
+        self.filtered = process_signal(self.signal, WINDOW_LENGTH, POLY_ORDER)
+
+        self.detector = PeakDetector(sample_rate=50000, target_frequency=50)
+        self.normalized = self.detector._prepare_signal(self.filtered)
+        noise_floor = np.median(self.normalized) + 0.5 * (
+            np.percentile(self.normalized, 75) - np.percentile(self.normalized, 25)
+        )
+        self.peaks = self.detector._find_initial_peaks(
+            self.normalized, PEAK_PARAMS["prominence_threshold"], noise_floor
+        )
+
+    def stage(self, name):
+        """Callable running one stage, or None if it can't run for this size"""
+        if name == "load_csv":
+            if self.csv_path is None:
+                return None
+            return lambda: read_csv_file(self.csv_path)
+        if name == "convert_to_npy":
+            return lambda: write_npy_file(self.output_path, self.data)
+        if name == "load_npy":
+            return lambda: read_npy_file(self.npy_path)
+        if name == "load_npy_mmap":
+            return lambda: read_npy_file(self.npy_path, mmap=True)
+        if name == "process_signal":
+            return lambda: process_signal(self.signal, WINDOW_LENGTH, POLY_ORDER)
+        if name == "prepare_signal":
+            return lambda: self.detector._prepare_signal(self.filtered)
+        if name == "filter_peaks":
+            return lambda: self.detector._filter_peaks(
+                self.normalized, self.peaks, PEAK_PARAMS["amplitude_tolerance"]
+            )
+        if name == "detect_peaks":
+            return lambda: detect_signal_peaks(self.filtered, PEAK_PARAMS)
+        raise ValueError(f"Unknown stage: {name}")
+
+    def cleanup(self):
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+
+def measure(run, repeat):
+    """Wall times of `repeat` runs, followed by the peak traced memory of one run"""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        run()
+        times.append(perf_counter() - start)
+
+    # Tracing slows down allocations, so memory is measured in a separate run
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak_memory
+
+
+def run_benchmarks(
+    sizes=DEFAULT_SIZES,
+    stages=STAGES,
+    repeat=3,
+    seed=0,
+    data_dir=None,
+    csv_max_duration=DEFAULT_CSV_MAX_DURATION,
+    progress=print,
+):
+    """
+    Time and memory-profile the stages on synthetic recordings of every size.
+
+    Args:
+        sizes: recording durations in seconds
+        stages: names of the stages to run, see STAGES
+        repeat: timed runs per stage
+        seed: seed of the synthetic recordings
+        data_dir: directory keeping the generated files between runs, a
+            temporary directory is used if None
+        csv_max_duration: longest recording for which CSV loading is measured
+
+    Returns:
+        list of result dicts, one per stage and size
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = data_dir or temp_dir
+        os.makedirs(data_dir, exist_ok=True)
+
+        for duration in sizes:
+            recording = SyntheticRecording(duration, seed=seed)
+            progress(f"Preparing {duration:g} s ({len(recording):,} samples)")
+            inputs = StageInputs(recording, data_dir, csv_max_duration)
+            try:
+                for name in stages:
+                    run = inputs.stage(name)
+                    if run is None:
+                        progress(f"  {name:<16} skipped")
+                        continue
+
+                    times, peak_memory = measure(run, repeat)
+                    results.append(
+                        {
+                            "stage": name,
+                            "duration_s": duration,
+                            "samples": len(recording),
+                            "times_s": times,
+                            "min_s": min(times),
+                            "median_s": median(times),
+                            "peak_memory_bytes": peak_memory,
+                        }
+                    )
+                    progress(
+                        f"  {name:<16} {median(times):10.4f} s "
+                        f"{peak_memory / 2**20:10.1f} MiB"
+                    )
+            finally:
+                inputs.cleanup()
+    return results
+
+
+def environment():
+    """Description of the revision and machine the benchmarks ran on"""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+
+    return {
+        "revision": revision,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare_results(baseline, current, threshold=0.15):
+    """
+    Stages that got slower or use more memory than in the baseline.
+
+    A stage regresses when its median time or peak memory grew by more than
+    `threshold` (relative) and by more than MIN_TIME_CHANGE / MIN_MEMORY_CHANGE.
+
+    Returns:
+        list of (stage, duration_s, metric, baseline value, current value)
+    """
+    previous = {(r["stage"], r["duration_s"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get((result["stage"], result["duration_s"]))
+        if old is None:
+            continue
+        for metric, min_change in (
+            ("median_s", MIN_TIME_CHANGE),
+            ("peak_memory_bytes", MIN_MEMORY_CHANGE),
+        ):
+            before, after = old[metric], result[metric]
+            if after > before * (1 + threshold) and after - before > min_change:
+                regressions.append(
+                    (result["stage"], result["duration_s"], metric, before, after)
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(f"{size:g}" for size in DEFAULT_SIZES),
+        help="comma separated recording durations in seconds",
+    )
+    parser.add_argument(
+        "--stages", default=",".join(STAGES), help="comma separated stage names"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--data-dir", help="keep generated recordings here to reuse them"
+    )
+    parser.add_argument(
+        "--csv-max-duration",
+        type=float,
+        default=DEFAULT_CSV_MAX_DURATION,
+        help="longest recording (s) to benchmark CSV loading on",
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results of an earlier run to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.15,
+        help="relative change counted as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    stages = [name.strip() for name in args.stages.split(",") if name.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+    sizes = [float(size) for size in args.sizes.split(",") if size.strip()]
+
+    report = {
+        "environment": environment(),
+        "settings": {"repeat": args.repeat, "seed": args.seed},
+        "results": run_benchmarks(
+            sizes,
+            stages,
+            args.repeat,
+            args.seed,
+            args.data_dir,
+            args.csv_max_duration,
+        ),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_results(baseline, report, args.threshold)
+    for stage, duration, metric, before, after in regressions:
+        print(
+            f"REGRESSION {stage} at {duration:g} s: {metric} "
+            f"{before:.4g} -> {after:.4g} ({after / before - 1:+.0%})"
+        )
+    if not regressions:
+        print(f"No regressions against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
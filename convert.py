@@ -0,0 +1,78 @@
+"""
+Convert ADC CSV captures to int16 .npy files without loading them into memory.
+
+Usage:
+    python convert.py captures/*.csv --output-dir npy/ [--scale 1.0] [--offset 0]
+                      [--format npy|adcz]
+
+Every sample is stored as round(value * scale + offset), values outside the
+int16 range are clipped and counted in the printed report. With --format adcz
+the files are written as compressed recording containers with per-block
+statistics (see recording_container.py).
+"""
+
+import argparse
+import os
+import sys
+
+from file_operations import (
+    convert_csv_files,
+    format_conversion_report,
+    output_names,
+)
+from recording_container import CONTAINER_EXTENSION
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert ADC CSV files to int16 NPY files"
+    )
+    parser.add_argument("inputs", nargs="+", help="CSV files to convert")
+    parser.add_argument(
+        "--output-dir", help="directory for the NPY files (default: next to the CSV)"
+    )
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--offset", type=float, default=0.0)
+    parser.add_argument(
+        "--format",
+        choices=("npy", CONTAINER_EXTENSION[1:]),
+        default="npy",
+        help="output file format",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="files converted at the same time"
+    )
+    args = parser.parse_args(argv)
+
+    conversions = []
+    if args.output_dir:
+        try:  # Inputs from different directories may share a file name
+            names = output_names(args.inputs)
+        except ValueError as e:
+            parser.error(str(e))
+        for csv_path, name in zip(args.inputs, names):
+            output_path = os.path.join(args.output_dir, f"{name}.{args.format}")
+            conversions.append((csv_path, output_path))
+        os.makedirs(args.output_dir, exist_ok=True)
+    else:
+        for csv_path in args.inputs:
+            stem = os.path.splitext(csv_path)[0]
+            conversions.append((csv_path, f"{stem}.{args.format}"))
+
+    try:
+        reports = convert_csv_files(
+            conversions,
+            args.scale,
+            args.offset,
+            args.workers,
+            lambda done, total, report: print(
+                f"[{done}/{total}] {format_conversion_report(report)}"
+            ),
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    return 1 if any("error" in report for report in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+
+from peakAnalyzer import PEAK_LOW
+
+# Labels of detected peaks, their label code is the position
+PEAK_LABELS = ("water", "tissue")
+
+
+class EventIndex:
+    """
+    Labeled events (peaks or label intervals) sorted by start time.
+
+    Events are kept as columns: start and end times and a label code, the
+    position of the label in labels. The start times of every label are
+    kept sorted on their own too, so ranges, nearest events and per-label
+    counts are binary searches instead of scans over all events.
+
+    Args:
+        start, end: event times in seconds, end >= start; end None for
+            point events, e.g. peaks, which end where they start
+        codes: label code of every event
+        labels: label names, indexed by code
+    """
+
+    def __init__(self, start, end, codes, labels=PEAK_LABELS):
+        points = end is None
+        start = np.asarray(start, dtype=np.float64)
+        end = start if points else np.asarray(end, dtype=np.float64)
+        codes = np.asarray(codes, dtype=np.uint8)
+        if not len(start) == len(end) == len(codes):
+            raise ValueError("Event columns differ in length")
+        if np.any(start[1:] < start[:-1]):
+            order = np.argsort(start, kind="stable")
+            start, codes = start[order], codes[order]
+            end = start if points else end[order]
+        self.start = start
+        self.end = end
+        self.codes = codes
+        self.labels = tuple(labels)
+        self.points = points  # end is start
+
+        # Events ending before t all come before the first index whose
+        # running maximum of end reaches t
+        self._end_reach = np.maximum.accumulate(end) if len(end) else end
+        self._label_starts = [start[codes == code] for code in range(len(labels))]
+
+    def __len__(self):
+        return len(self.start)
+
+    @classmethod
+    def from_frame(cls, frame):
+        """
+        Index of a peaks DataFrame with startTime, endTime and label columns.
+
+        Known peak labels keep their codes (see PEAK_LABELS), other labels
+        follow in sorted order.
+        """
+        names = frame["label"].astype(str)
+        labels = list(PEAK_LABELS)
+        labels += sorted(set(names.unique()) - set(labels))
+        codes = pd.Categorical(names, categories=labels).codes
+        return cls(
+            frame["startTime"].to_numpy(), frame["endTime"].to_numpy(), codes, labels
+        )
+
+    @classmethod
+    def from_results(cls, results):
+        """
+        Index of the accepted peaks of one or more PeakResults (channels).
+
+        Peaks below the medium threshold are labeled water, medium and high
+        peaks tissue. Every PeakResult is already sorted, so the channels are
+        merged by binary search instead of sorting all peaks again; peaks at
+        the same time keep the order of the channels.
+        """
+        times = np.zeros(0)
+        codes = np.zeros(0, dtype=np.uint8)
+        for result in results:
+            accepted = result.accepted
+            channel_times = result.time[accepted]
+            channel_codes = (result.class_code[accepted] != PEAK_LOW).astype(np.uint8)
+            if np.any(channel_times[1:] < channel_times[:-1]):  # e.g. refined times
+                order = np.argsort(channel_times, kind="stable")
+                channel_times = channel_times[order]
+                channel_codes = channel_codes[order]
+
+            merged_times = np.empty(len(times) + len(channel_times))
+            merged_codes = np.empty(len(merged_times), dtype=np.uint8)
+            before = np.arange(len(times)) + np.searchsorted(
+                channel_times, times, "left"
+            )
+            after = np.arange(len(channel_times)) + np.searchsorted(
+                times, channel_times, "right"
+            )
+            merged_times[before], merged_codes[before] = times, codes
+            merged_times[after], merged_codes[after] = channel_times, channel_codes
+            times, codes = merged_times, merged_codes
+        return cls(times, None, codes)
+
+    def to_frame(self):
+        """The events as a startTime, endTime, label DataFrame"""
+        return pd.DataFrame(
+            {
+                "startTime": self.start,
+                "endTime": self.end,
+                "label": np.asarray(self.labels, dtype=object)[self.codes],
+            }
+        )
+
+    def code(self, label):
+        """Label code of a label name"""
+        return self.labels.index(label)
+
+    def label_starts(self, code):
+        """Sorted start times of the events of one label code"""
+        return self._label_starts[code]
+
+    def span(self, t0, t1):
+        """
+        Slice of the events that may overlap [t0, t1].
+
+        Every overlapping event is inside it; with point events, or events
+        that do not contain each other, all events in it overlap.
+        """
+        first = np.searchsorted(self._end_reach, t0, "left")
+        last = np.searchsorted(self.start, t1, "right")
+        return slice(int(first), int(max(last, first)))
+
+    def between(self, t0, t1):
+        """Positions of the events overlapping [t0, t1]"""
+        window = self.span(t0, t1)
+        positions = np.arange(window.start, window.stop)
+        return positions[self.end[window] >= t0]
+
+    def nearest(self, times):
+        """
+        Positions of the events starting nearest to each time.
+
+        Args:
+            times: scalar or array of times, the index must not be empty
+        """
+        if not len(self):
+            raise ValueError("No events in the index")
+        times = np.asarray(times, dtype=np.float64)
+        if len(self) == 1:
+            return np.zeros(times.shape, dtype=np.intp)
+        right = np.clip(np.searchsorted(self.start, times), 1, len(self) - 1)
+        left = right - 1
+        return np.where(
+            times - self.start[left] <= self.start[right] - times, left, right
+        )
+
+    def counts(self, t0=-np.inf, t1=np.inf):
+        """Number of events of every label starting within [t0, t1]"""
+        return {
+            label: int(
+                np.searchsorted(starts, t1, "right")
+                - np.searchsorted(starts, t0, "left")
+            )
+            for label, starts in zip(self.labels, self._label_starts)
+        }
+
+    def match(self, other, tolerance):
+        """
+        Events of other starting within tolerance seconds of each event.
+
+        Compares e.g. imported with detected peaks: an event matches the
+        nearest event of other if that starts close enough and has the same
+        label name.
+
+        Returns:
+            positions in other of the matched events, -1 where none matches
+        """
+        if not len(other) or not len(self):
+            return np.full(len(self), -1)
+        nearest = other.nearest(self.start)
+        close = np.abs(other.start[nearest] - self.start) <= tolerance
+        names = np.asarray(self.labels, dtype=object)[self.codes]
+        other_names = np.asarray(other.labels, dtype=object)[other.codes[nearest]]
+        return np.where(close & (names == other_names), nearest, -1)
@@ -1,52 +1,211 @@
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
-from tkinter import filedialog, messagebox
+from numpy.lib.format import open_memmap
 import logging
+from event_index import EventIndex
+from parallel_analysis import POOL_START_METHOD
+from recording_container import CONTAINER_EXTENSION, ContainerReader, ContainerWriter
 
+# tkinter is imported by the dialog functions only, so batch.py and
+# convert.py also run where Tk is not installed
 
-def load_csv():
+ADC_COLUMNS = ("adc1", "adc2")
+PEAKS_COLUMNS = ("startTime", "endTime", "label")
+
+# Rows parsed per chunk when streaming ADC captures, ~8 MB of float32 per column
+CSV_CHUNK_ROWS = 1_000_000
+
+NPY_DTYPE = np.dtype(np.int16)
+
+# Sample rate stored in recording containers unless told otherwise
+SAMPLE_RATE = 50000
+
+# File types offered when saving a recording
+RECORDING_SAVE_TYPES = [
+    ("NumPy files", "*.npy"),
+    ("Recording containers", f"*{CONTAINER_EXTENSION}"),
+]
+
+# Binary peaks files, an .npz archive of columns (see write_peaks_npz)
+PEAKS_NPZ_EXTENSION = ".npz"
+PEAKS_NPZ_FORMAT = "adc-peaks"
+PEAKS_NPZ_VERSION = 1
+
+# File types offered when exporting peaks
+PEAKS_SAVE_TYPES = [
+    ("CSV files", "*.csv"),
+    ("Binary peak files", f"*{PEAKS_NPZ_EXTENSION}"),
+]
+
+# Decimals of the times in peaks CSV files
+PEAKS_CSV_DECIMALS = 5
+
+
+def count_csv_rows(filepath, block_size=1 << 24):
+    """Count the data rows of a CSV file (excluding the header) without parsing it"""
+    rows = 0
+    last_byte = b"\n"
+    with open(filepath, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            rows += block.count(b"\n")
+            last_byte = block[-1:]
+
+    if last_byte != b"\n":  # Last line has no trailing newline
+        rows += 1
+    return max(rows - 1, 0)
+
+
+def iter_adc_chunks(filepath, chunksize=CSV_CHUNK_ROWS):
+    """
+    Parse the adc1/adc2 columns of a CSV file chunk by chunk.
+
+    Yields:
+        (first_row, chunk) with chunk a float32 DataFrame of at most chunksize rows
+
+    Raises:
+        ValueError: if the columns contain non-numeric or missing values
+    """
+    reader = pd.read_csv(
+        filepath,
+        usecols=list(ADC_COLUMNS),
+        dtype={col: "float32" for col in ADC_COLUMNS},
+        chunksize=chunksize,
+    )
+    chunks = iter(reader)
+    first_row = 0
+    while True:
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        except ValueError as e:  # Raised by the parser for non-numeric values
+            raise ValueError(f"ADC columns must contain numeric data ({e})") from e
+
+        for col in ADC_COLUMNS:
+            values = chunk[col].to_numpy()
+            if np.isnan(values).any():
+                first_missing = first_row + int(np.argmax(np.isnan(values)))
+                raise ValueError(
+                    f"ADC data contains missing values (column '{col}', row {first_missing + 1})"
+                )
+
+        yield first_row, chunk
+        first_row += len(chunk)
+
+
+def stream_adc_csv(
+    filepath, chunksize=CSV_CHUNK_ROWS, dtype="float32", progress_callback=None
+):
+    """
+    Stream the adc1/adc2 columns of a CSV file into preallocated numpy buffers.
+
+    The file is parsed chunk by chunk with explicit column dtypes, and each chunk
+    is validated as it arrives, so peak memory stays close to the size of the
+    final arrays instead of several times the size of the file.
+
+    Args:
+        filepath: path to the CSV file
+        chunksize: number of rows parsed per chunk
+        dtype: storage dtype of the columns, "float32" or "int16"
+        progress_callback: optional callable(rows_done, total_rows)
+
+    Returns:
+        pandas DataFrame with the adc1 and adc2 columns
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind not in "if":
+        raise ValueError(f"Unsupported ADC dtype: {dtype}")
+
+    total_rows = count_csv_rows(filepath)
+    buffers = {col: np.empty(total_rows, dtype=dtype) for col in ADC_COLUMNS}
+    filled = 0
+
+    for filled, chunk in iter_adc_chunks(filepath, chunksize):
+        rows = len(chunk)
+        if filled + rows > total_rows:  # Row count was an underestimate
+            total_rows = filled + max(rows, chunksize)
+            buffers = {
+                col: np.resize(buffer, total_rows) for col, buffer in buffers.items()
+            }
+
+        for col in ADC_COLUMNS:
+            values = chunk[col].to_numpy()
+            if dtype.kind == "i":
+                limits = np.iinfo(dtype)
+                if values.min() < limits.min or values.max() > limits.max:
+                    raise ValueError(
+                        f"ADC column '{col}' contains values outside the {dtype} range"
+                    )
+            buffers[col][filled : filled + rows] = values
+
+        filled += rows
+        if progress_callback is not None:
+            progress_callback(filled, total_rows)
+
+    if filled != total_rows:  # Blank lines are skipped by the parser
+        buffers = {col: buffer[:filled].copy() for col, buffer in buffers.items()}
+
+    return pd.DataFrame(buffers, copy=False)
+
+
+def iter_adc_blocks(filepath, column, block_size=CSV_CHUNK_ROWS):
+    """
+    Iterate over one ADC column of a CSV, .npy or container recording in blocks.
+
+    .npy files are memory-mapped, containers decompressed block by block and
+    CSV files parsed in chunks, so only one block is held in memory at a
+    time. Used for chunked peak detection of recordings larger than RAM.
+    """
+    if filepath.lower().endswith((".npy", CONTAINER_EXTENSION)):
+        recording = read_npy_file(filepath, mmap=True)
+        position = recording.columns.index(column)
+        for start in range(0, len(recording), block_size):
+            rows = recording.array[start : start + block_size, position]
+            yield np.asarray(rows, dtype="float32")
+        return
+
+    reader = pd.read_csv(
+        filepath, usecols=[column], dtype={column: "float32"}, chunksize=block_size
+    )
+    for chunk in reader:
+        values = chunk[column].to_numpy()
+        if np.isnan(values).any():
+            raise ValueError(f"ADC data contains missing values (column '{column}')")
+        yield values
+
+
+def load_csv(progress_callback=None):
     """
     Load a CSV file, detecting whether it's ADC data or peaks data based on columns.
 
+    ADC data is streamed in chunks (see stream_adc_csv), so large captures can be
+    loaded without holding several copies of the file in memory.
+
+    Args:
+        progress_callback: optional callable(rows_done, total_rows) for ADC files
+
     Returns:
         tuple: (data, filename, file_type)
         - data: pandas DataFrame containing the loaded data
         - filename: name of the loaded file
         - file_type: 'adc' or 'peaks' indicating the type of data loaded
     """
+    from tkinter import filedialog, messagebox
     filepath = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
     filename = filepath.title()
     if not filepath:
         return None, None, None
 
     try:
-        data = pd.read_csv(filepath)
-
-        # Check for peaks data format
-        peaks_columns = {"startTime", "endTime", "label"}
-        if peaks_columns.issubset(set(data.columns)):
-            # Validate peaks data
-            if not all(
-                data[col].notna().all() for col in peaks_columns
-            ):  # This special sauce checks if there are empty values
-                raise ValueError("Peaks data contains missing values")
-            return data, filename, "peaks"
-
-        # Check for ADC data format
-        adc_columns = {"adc1", "adc2"}
-        if adc_columns.issubset(set(data.columns)):
-            # Validate ADC data
-            if not all(data[col].notna().all() for col in adc_columns):
-                raise ValueError("ADC data contains missing values")
-            if not all(
-                data[col].dtype.kind in "if" for col in adc_columns
-            ):  # check if numeric
-                raise ValueError("ADC columns must contain numeric data")
-            return data, filename, "adc"
-
-        raise ValueError(
-            "CSV must contain either 'adc1' and 'adc2' columns OR 'startTime', 'endTime', and 'label' columns"
-        )
+        data, file_type = read_csv_file(filepath, progress_callback)
+        return data, filename, file_type
 
     except Exception as e:
         logging.error(f"Error loading file: {e}")
@@ -54,47 +213,656 @@ def load_csv():
         return None, None, None
 
 
+def read_csv_file(filepath, progress_callback=None):
+    """
+    Read a CSV file without any dialogs, detecting its type from the columns.
+
+    Returns:
+        tuple: (data, file_type) with file_type 'adc' or 'peaks'
+
+    Raises:
+        ValueError: if the columns or values are invalid
+    """
+    # Only read the header first to decide how to load the file
+    columns = set(pd.read_csv(filepath, nrows=0).columns)
+
+    # Check for peaks data format
+    peaks_columns = set(PEAKS_COLUMNS)
+    if peaks_columns.issubset(columns):
+        data = pd.read_csv(filepath)
+        # Validate peaks data
+        if not all(
+            data[col].notna().all() for col in peaks_columns
+        ):  # This special sauce checks if there are empty values
+            raise ValueError("Peaks data contains missing values")
+        return data, "peaks"
+
+    # Check for ADC data format, validated chunk by chunk while streaming
+    if set(ADC_COLUMNS).issubset(columns):
+        data = stream_adc_csv(filepath, progress_callback=progress_callback)
+        return data, "adc"
+
+    raise ValueError(
+        "CSV must contain either 'adc1' and 'adc2' columns OR 'startTime', 'endTime', and 'label' columns"
+    )
+
+
+def read_recording(filepath, progress_callback=None):
+    """
+    Read an ADC recording (.csv, .npy or recording container) without any dialogs.
+
+    .npy files are memory-mapped and containers read lazily (see MappedRecording).
+
+    Raises:
+        ValueError: if the file is not an ADC recording
+    """
+    if filepath.lower().endswith((".npy", CONTAINER_EXTENSION)):
+        return read_npy_file(filepath, mmap=True)
+
+    data, file_type = read_csv_file(filepath, progress_callback)
+    if file_type != "adc":
+        raise ValueError(f"{filepath} does not contain 'adc1' and 'adc2' columns")
+    return data
+
+
 def convert_to_npy(data):
+    from tkinter import filedialog, messagebox
     save_path = filedialog.asksaveasfilename(
-        defaultextension=".npy", filetypes=[("NumPy files", "*.npy")]
+        defaultextension=".npy", filetypes=RECORDING_SAVE_TYPES
     )
     if not save_path:
         return
 
     try:
-        # Convert to float32 first for any calculations, then to int16 for saving
-        np_array = np.column_stack(
-            (
-                data["adc1"].astype("float32").values,
-                data["adc2"].astype("float32").values,
-            )
+        report = write_recording_file(save_path, data)
+        messagebox.showinfo(
+            "Success", f"File saved successfully\n{format_conversion_report(report)}"
         )
-        # Convert to int16 before saving
-        np_array = np_array.astype("int16")
-        np.save(save_path, np_array)
-        messagebox.showinfo("Success", "File saved successfully")
 
     except Exception as e:
         logging.error(f"Error saving NPY file: {e}")
         messagebox.showerror("Error", str(e))
 
 
-def load_npy():
-    filepath = filedialog.askopenfilename(filetypes=[("NumPy files", "*.npy")])
+def _new_conversion_report(path):
+    return {
+        "path": path,
+        "rows": 0,
+        "clipped": {col: 0 for col in ADC_COLUMNS},
+        "min": {col: np.inf for col in ADC_COLUMNS},
+        "max": {col: -np.inf for col in ADC_COLUMNS},
+    }
+
+
+def _saturate(values, scale, offset, report, col):
+    """
+    Scale samples to int16, clipping out-of-range values to the int16 limits.
+
+    The number of clipped samples and the range of the input are added to the
+    report of the conversion.
+    """
+    if len(values) == 0:
+        return values.astype(NPY_DTYPE)
+
+    report["min"][col] = min(report["min"][col], float(values.min()))
+    report["max"][col] = max(report["max"][col], float(values.max()))
+    if scale != 1 or offset != 0:
+        values = values * np.float64(scale) + offset
+    values = np.rint(values)
+
+    limits = np.iinfo(NPY_DTYPE)
+    clipped = np.count_nonzero((values < limits.min) | (values > limits.max))
+    if clipped:
+        report["clipped"][col] += int(clipped)
+        values = np.clip(values, limits.min, limits.max)
+    return values.astype(NPY_DTYPE)
+
+
+def _shrink_npy(path, rows):
+    """Keep only the first rows of a two column .npy file, block by block"""
+    source = np.load(path, mmap_mode="r")
+    temp_path = path + ".tmp"
+    target = open_memmap(temp_path, mode="w+", dtype=source.dtype, shape=(rows, 2))
+    for start in range(0, rows, CSV_CHUNK_ROWS):
+        stop = min(start + CSV_CHUNK_ROWS, rows)
+        target[start:stop] = source[start:stop]
+    target.flush()
+    del source, target
+    os.replace(temp_path, path)
+
+
+def write_npy_file(save_path, data, scale=1.0, offset=0.0, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Save the adc1/adc2 columns as a two column int16 .npy file without any dialogs.
+
+    The file is pre-sized with open_memmap and filled chunk by chunk, so only
+    one chunk is converted at a time. Samples are stored as
+    round(value * scale + offset); values outside the int16 range are clipped
+    to its limits instead of wrapping around.
+
+    Returns:
+        conversion report dict: path, rows, and per column the number of
+        clipped samples and the input range (see format_conversion_report)
+    """
+    columns = [data[col].to_numpy() for col in ADC_COLUMNS]
+    rows = len(columns[0])
+    report = _new_conversion_report(save_path)
+
+    output = open_memmap(save_path, mode="w+", dtype=NPY_DTYPE, shape=(rows, 2))
+    try:
+        for start in range(0, rows, chunk_rows):
+            for i, col in enumerate(ADC_COLUMNS):
+                output[start : start + chunk_rows, i] = _saturate(
+                    columns[i][start : start + chunk_rows], scale, offset, report, col
+                )
+        output.flush()
+    finally:
+        del output
+
+    report["rows"] = rows
+    return report
+
+
+def convert_csv_to_npy(
+    csv_path,
+    npy_path,
+    scale=1.0,
+    offset=0.0,
+    chunksize=CSV_CHUNK_ROWS,
+    progress_callback=None,
+):
+    """
+    Convert an ADC CSV file to a two column int16 .npy file without loading it.
+
+    The output is pre-sized from the line count of the CSV file and filled
+    directly from the chunked CSV reader, so memory stays bounded by one chunk
+    regardless of the size of the capture. Scaling and clipping work as in
+    write_npy_file. A partially written output is removed on errors.
+
+    Args:
+        progress_callback: optional callable(rows_done, total_rows)
+
+    Returns:
+        conversion report dict, see write_npy_file
+    """
+    total_rows = count_csv_rows(csv_path)
+    report = _new_conversion_report(npy_path)
+    filled = 0
+
+    output = open_memmap(npy_path, mode="w+", dtype=NPY_DTYPE, shape=(total_rows, 2))
+    try:
+        for first_row, chunk in iter_adc_chunks(csv_path, chunksize):
+            rows = len(chunk)
+            if first_row + rows > total_rows:
+                raise ValueError(f"{csv_path} has more rows than line breaks")
+
+            for i, col in enumerate(ADC_COLUMNS):
+                output[first_row : first_row + rows, i] = _saturate(
+                    chunk[col].to_numpy(), scale, offset, report, col
+                )
+            filled = first_row + rows
+            if progress_callback is not None:
+                progress_callback(filled, total_rows)
+        output.flush()
+    except BaseException:
+        del output
+        os.remove(npy_path)
+        raise
+    del output
+
+    if filled != total_rows:  # Blank lines are skipped by the parser
+        _shrink_npy(npy_path, filled)
+
+    report["rows"] = filled
+    return report
+
+
+def write_container_file(
+    save_path,
+    data,
+    sample_rate=SAMPLE_RATE,
+    scale=1.0,
+    offset=0.0,
+    chunk_rows=CSV_CHUNK_ROWS,
+):
+    """
+    Save the adc1/adc2 columns as a recording container without any dialogs.
+
+    Scaling and clipping work as in write_npy_file.
+
+    Returns:
+        conversion report dict, see write_npy_file
+    """
+    columns = [data[col].to_numpy() for col in ADC_COLUMNS]
+    rows = len(columns[0])
+    report = _new_conversion_report(save_path)
+
+    with ContainerWriter(save_path, sample_rate, ADC_COLUMNS, dtype=NPY_DTYPE) as out:
+        for start in range(0, rows, chunk_rows):
+            out.write(
+                np.column_stack(
+                    [
+                        _saturate(
+                            values[start : start + chunk_rows],
+                            scale,
+                            offset,
+                            report,
+                            col,
+                        )
+                        for col, values in zip(ADC_COLUMNS, columns)
+                    ]
+                )
+            )
+
+    report["rows"] = rows
+    return report
+
+
+def convert_csv_to_container(
+    csv_path,
+    container_path,
+    scale=1.0,
+    offset=0.0,
+    sample_rate=SAMPLE_RATE,
+    chunksize=CSV_CHUNK_ROWS,
+    progress_callback=None,
+):
+    """
+    Convert an ADC CSV file to a recording container without loading it.
+
+    Like convert_csv_to_npy, but writes compressed blocks with their summary
+    statistics (see recording_container.ContainerWriter).
+
+    Returns:
+        conversion report dict, see write_npy_file
+    """
+    total_rows = count_csv_rows(csv_path)
+    report = _new_conversion_report(container_path)
+    filled = 0
+
+    with ContainerWriter(
+        container_path, sample_rate, ADC_COLUMNS, dtype=NPY_DTYPE
+    ) as out:
+        for first_row, chunk in iter_adc_chunks(csv_path, chunksize):
+            out.write(
+                np.column_stack(
+                    [
+                        _saturate(chunk[col].to_numpy(), scale, offset, report, col)
+                        for col in ADC_COLUMNS
+                    ]
+                )
+            )
+            filled = first_row + len(chunk)
+            if progress_callback is not None:
+                progress_callback(filled, total_rows)
+
+    report["rows"] = filled
+    return report
+
+
+def convert_csv_file(csv_path, output_path, scale=1.0, offset=0.0):
+    """Convert a CSV file to .npy or to a container, chosen by the output extension"""
+    if output_path.lower().endswith(CONTAINER_EXTENSION):
+        return convert_csv_to_container(csv_path, output_path, scale, offset)
+    return convert_csv_to_npy(csv_path, output_path, scale, offset)
+
+
+def write_recording_file(save_path, data, scale=1.0, offset=0.0):
+    """Save loaded data as .npy or as a container, chosen by the file extension"""
+    if save_path.lower().endswith(CONTAINER_EXTENSION):
+        return write_container_file(save_path, data, scale=scale, offset=offset)
+    return write_npy_file(save_path, data, scale, offset)
+
+
+def output_names(inputs):
+    """
+    Output file name of every input, without suffix, unique among the inputs.
+
+    The file name stem, or where several inputs share a stem (rec.csv and
+    rec.npy, or the same name in different directories) the path relative
+    to the common directory of the inputs, with the extension and with
+    path separators replaced by underscores.
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in inputs]
+    shared = {stem for stem, count in Counter(stems).items() if count > 1}
+    if shared:
+        paths = [os.path.abspath(path) for path in inputs]
+        root = os.path.commonpath([os.path.dirname(path) for path in paths])
+    names = [
+        (
+            os.path.relpath(paths[i], root).replace(os.sep, "_")
+            if stem in shared
+            else stem
+        )
+        for i, stem in enumerate(stems)
+    ]
+
+    clashes = sorted(name for name, count in Counter(names).items() if count > 1)
+    if clashes:
+        raise ValueError(f"Several inputs map to the outputs {', '.join(clashes)}")
+    return names
+
+
+def convert_csv_files(
+    conversions, scale=1.0, offset=0.0, max_workers=None, progress_callback=None
+):
+    """
+    Convert several CSV files concurrently, one file per worker process.
+
+    Args:
+        conversions: iterable of (csv_path, output_path), each output is a .npy
+            file or a recording container depending on its extension
+        max_workers: number of worker processes, defaults to the number of CPUs
+        progress_callback: optional callable(files_done, total_files, report),
+            called as files finish
+
+    Returns:
+        list of conversion reports in the order of the conversions. Failed
+        conversions have an "error" entry with the message instead.
+
+    Raises:
+        ValueError: if several conversions have the same output path, see
+            output_names
+    """
+    conversions = list(conversions)
+    targets = Counter(os.path.abspath(path) for _, path in conversions)
+    clashes = sorted(path for path, count in targets.items() if count > 1)
+    if clashes:  # Workers would write the same file at the same time
+        raise ValueError(f"Several conversions write {', '.join(clashes)}")
+    reports = [None] * len(conversions)
+    context = multiprocessing.get_context(POOL_START_METHOD)  # Run from GUI threads
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        futures = {
+            pool.submit(convert_csv_file, csv_path, output_path, scale, offset): i
+            for i, (csv_path, output_path) in enumerate(conversions)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                reports[i] = future.result()
+            except Exception as e:
+                logging.error(f"Error converting {conversions[i][0]}: {e}")
+                reports[i] = {"path": conversions[i][1], "error": str(e)}
+            if progress_callback is not None:
+                progress_callback(done, len(conversions), reports[i])
+    return reports
+
+
+def format_conversion_report(report):
+    """One line summary of a conversion report"""
+    name = os.path.basename(report["path"])
+    if "error" in report:
+        return f"{name}: failed ({report['error']})"
+
+    clipped = sum(report["clipped"].values())
+    if not clipped:
+        return f"{name}: {report['rows']:,} rows, no clipped samples"
+
+    columns = ", ".join(
+        f"{col} {count:,} (input range {report['min'][col]:g} to {report['max'][col]:g})"
+        for col, count in report["clipped"].items()
+        if count
+    )
+    return f"{name}: {report['rows']:,} rows, clipped samples: {columns}"
+
+
+class MappedRecording:
+    """
+    Two column recording backed by a memory-mapped int16 .npy file.
+
+    A ContainerReader can stand in for the mapped array, it decompresses the
+    blocks of the rows that are accessed.
+
+    Rows are only converted to float32 when a window of them is requested
+    through iloc, so opening a file is close to instant and memory use
+    follows the part of the recording that is actually filtered or drawn.
+    """
+
+    def __init__(self, array, columns=ADC_COLUMNS):
+        if array.ndim != 2 or array.shape[1] != len(columns):
+            raise ValueError(
+                f"Expected an array with {len(columns)} columns, got shape {array.shape}"
+            )
+        self.array = array
+        self.columns = list(columns)
+        self.iloc = _RowWindows(self)
+        self._decompressed = {}  # Whole columns read from a container
+
+    def __len__(self):
+        return self.array.shape[0]
+
+    @property
+    def container(self):
+        """The ContainerReader backing the recording, None for .npy files"""
+        return self.array if isinstance(self.array, ContainerReader) else None
+
+    @property
+    def nbytes(self):
+        """RAM held by decompressed container columns, mapped files hold none"""
+        return sum(values.nbytes for values in self._decompressed.values())
+
+    def release(self):
+        """Drop the decompressed container columns, they are read again if needed"""
+        self._decompressed.clear()
+
+    def __getitem__(self, column):
+        """
+        A single column in its stored dtype.
+
+        For .npy files a zero-copy strided view of the mapped file. A
+        container decompresses the whole column into memory, which is kept
+        for later calls and counted by nbytes; read ranges of rows through
+        iloc or the container instead where possible.
+        """
+        if self.container is None:
+            values = self.array[:, self.columns.index(column)]
+        else:
+            values = self._decompressed.get(column)
+            if values is None:
+                values = self.array[:, self.columns.index(column)]
+                self._decompressed[column] = values
+        return pd.Series(values, name=column, copy=False)
+
+    def window(self, start=None, stop=None, step=None, dtype="float32"):
+        """Convert a range of rows to a DataFrame of the given dtype"""
+        index = pd.RangeIndex(*slice(start, stop, step).indices(len(self)))
+        rows = self.array[start:stop:step]
+        return pd.DataFrame(
+            {col: rows[:, i].astype(dtype) for i, col in enumerate(self.columns)},
+            index=index,
+            copy=False,
+        )
+
+
+class _RowWindows:
+    """Minimal iloc accessor so MappedRecording can stand in for a DataFrame"""
+
+    def __init__(self, recording):
+        self._recording = recording
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("Mapped recordings only support slicing rows")
+        return self._recording.window(key.start, key.stop, key.step)
+
+
+def load_npy(mmap=False):
+    """
+    Load a two column int16 .npy recording or a recording container.
+
+    Args:
+        mmap: open the file memory-mapped and return a MappedRecording instead
+              of reading and converting the whole array up front
+
+    Returns:
+        tuple: (data, filename)
+    """
+    from tkinter import filedialog, messagebox
+    filepath = filedialog.askopenfilename(
+        filetypes=[
+            ("Recordings", f"*.npy *{CONTAINER_EXTENSION}"),
+            ("NumPy files", "*.npy"),
+            ("Recording containers", f"*{CONTAINER_EXTENSION}"),
+        ]
+    )
     filename = filepath.title()
     if not filepath:
         return None, None
 
     try:
+        return read_npy_file(filepath, mmap), filename
+
+    except Exception as e:
+        logging.error(f"Error loading NPY file: {e}")
+        messagebox.showerror("Error", str(e))
+        return None, None
+
+
+def read_npy_file(filepath, mmap=False):
+    """
+    Read a two column int16 .npy recording without any dialogs.
+
+    Recording containers are read as well, with mmap only the blocks that are
+    accessed get decompressed.
+    """
+    if filepath.lower().endswith(CONTAINER_EXTENSION):
+        reader = ContainerReader(filepath)
+        if mmap:
+            return MappedRecording(reader, reader.channels)
+        np_array = reader.read()
+        reader.close()
+    elif mmap:
+        return MappedRecording(np.load(filepath, mmap_mode="r"))
+    else:
         # Load as int16 first
         np_array = np.load(filepath)
-        # Convert to float32 for processing
-        np_array = pd.DataFrame(np_array, columns=["adc1", "adc2"]).astype(
-            {"adc1": "float32", "adc2": "float32"}
+    # Convert to float32 for processing
+    return pd.DataFrame(np_array, columns=["adc1", "adc2"]).astype(
+        {"adc1": "float32", "adc2": "float32"}
+    )
+
+
+def _event_index(events):
+    """EventIndex of an EventIndex or an iterable of PeakResult"""
+    if isinstance(events, EventIndex):
+        return events
+    return EventIndex.from_results(events)
+
+
+def write_peaks_csv(save_path, results):
+    """
+    Write detected peaks of one or more channels as a startTime,endTime,label CSV.
+
+    Accepted low peaks (below the medium threshold) are labeled as water,
+    medium and high peaks as tissue. Times are rounded to
+    PEAKS_CSV_DECIMALS decimals.
+
+    Args:
+        save_path: path of the CSV file
+        results: iterable of PeakResult, one per channel, or an EventIndex
+
+    Returns:
+        number of written peaks
+    """
+    index = _event_index(results)
+    index.to_frame().to_csv(
+        save_path, index=False, float_format=f"%.{PEAKS_CSV_DECIMALS}f"
+    )
+    return len(index)
+
+
+def write_peaks_npz(save_path, results):
+    """
+    Write detected peaks as a binary .npz peaks file.
+
+    Holds the columns start_time and end_time (seconds, float64, not
+    rounded) and label_code (uint8, the position in label_names), with the
+    same peaks and order as write_peaks_csv. Much smaller and faster to
+    write and load than CSV, see read_peaks_npz.
+
+    Returns:
+        number of written peaks
+    """
+    index = _event_index(results)
+    with open(save_path, "wb") as f:
+        np.savez(
+            f,
+            format=np.array(PEAKS_NPZ_FORMAT),
+            version=np.array(PEAKS_NPZ_VERSION),
+            start_time=index.start,
+            end_time=index.end,
+            label_code=index.codes,
+            label_names=np.array(index.labels),
         )
-        return np_array, filename
+    return len(index)
+
+
+def write_peaks_file(save_path, results):
+    """Write peaks as binary .npz if save_path ends with .npz, else as CSV"""
+    if save_path.lower().endswith(PEAKS_NPZ_EXTENSION):
+        return write_peaks_npz(save_path, results)
+    return write_peaks_csv(save_path, results)
+
+
+def read_peaks_npz(filepath):
+    """
+    Read a binary peaks file written by write_peaks_npz.
+
+    Returns:
+        DataFrame with the startTime, endTime and label columns of a peaks CSV
+
+    Raises:
+        ValueError: if the file is not a valid peaks file
+    """
+    with np.load(filepath) as archive:
+        if (
+            "format" not in archive
+            or str(archive["format"]) != PEAKS_NPZ_FORMAT
+            or int(archive["version"]) > PEAKS_NPZ_VERSION
+        ):
+            raise ValueError(f"{filepath} is not a supported peaks file")
+        start_time = archive["start_time"]
+        end_time = archive["end_time"]
+        codes = archive["label_code"]
+        label_names = np.asarray(archive["label_names"], dtype=object)
+
+    if not len(start_time) == len(end_time) == len(codes):
+        raise ValueError("Peaks file columns differ in length")
+    if len(codes) and codes.max() >= len(label_names):
+        raise ValueError("Peaks file contains unknown label codes")
+    return pd.DataFrame(
+        {"startTime": start_time, "endTime": end_time, "label": label_names[codes]},
+        columns=list(PEAKS_COLUMNS),
+    )
+
+
+def load_peaks():
+    """
+    Ask for a peaks file (CSV or binary .npz) and read it.
+
+    Returns:
+        tuple: (data, filename, file_type) as load_csv; file_type is 'peaks'
+        for binary files
+    """
+    from tkinter import filedialog, messagebox
+    filepath = filedialog.askopenfilename(
+        filetypes=[
+            ("Peak files", f"*.csv *{PEAKS_NPZ_EXTENSION}"),
+            ("CSV files", "*.csv"),
+            ("Binary peak files", f"*{PEAKS_NPZ_EXTENSION}"),
+        ]
+    )
+    filename = filepath.title()
+    if not filepath:
+        return None, None, None
+
+    try:
+        if filepath.lower().endswith(PEAKS_NPZ_EXTENSION):
+            return read_peaks_npz(filepath), filename, "peaks"
+        data, file_type = read_csv_file(filepath)
+        return data, filename, file_type
 
     except Exception as e:
-        logging.error(f"Error loading NPY file: {e}")
+        logging.error(f"Error loading peaks file: {e}")
         messagebox.showerror("Error", str(e))
-        return None, None
+        return None, None, None
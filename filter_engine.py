@@ -0,0 +1,116 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.ndimage import convolve1d
+from scipy.signal import oaconvolve, savgol_coeffs, savgol_filter
+
+# Kernels up to this many taps are convolved directly, longer ones by FFT
+# overlap-add, which costs about the same for any kernel length
+DIRECT_MAX_TAPS = 63
+
+
+@lru_cache(maxsize=128)
+def savgol_kernel(window_length, polyorder):
+    """
+    Savitzky-Golay smoothing coefficients, computed once per setting.
+
+    The returned array is shared between callers and read-only.
+    """
+    kernel = savgol_coeffs(window_length, polyorder)
+    kernel.setflags(write=False)
+    return kernel
+
+
+@lru_cache(maxsize=128)
+def composed_kernel(stages):
+    """
+    Single kernel equal to consecutive Savitzky-Golay filters.
+
+    Args:
+        stages: tuple of (window_length, polyorder), in the order applied
+    """
+    kernel = np.ones(1)
+    for window_length, polyorder in stages:
+        kernel = np.convolve(kernel, savgol_kernel(window_length, polyorder))
+    kernel.setflags(write=False)
+    return kernel
+
+
+def _as_float(signal):
+    """The signal in the float dtype savgol_filter computes in"""
+    signal = np.asarray(signal)
+    if signal.dtype not in (np.float32, np.float64):
+        signal = signal.astype(np.float64)
+    return signal
+
+
+def convolve(signal, kernel, out=None):
+    """
+    Convolve with an odd-length kernel, zero padded, output centered on the input.
+
+    Short kernels are applied directly, longer ones by FFT overlap-add (see
+    DIRECT_MAX_TAPS). out is an optional array for the result, of the shape
+    and dtype of signal.
+    """
+    signal = _as_float(signal)
+    if len(kernel) <= DIRECT_MAX_TAPS:
+        return convolve1d(signal, kernel, output=out, mode="constant")
+    result = oaconvolve(signal, kernel, mode="same")
+    if out is None:
+        return result.astype(signal.dtype, copy=False)
+    out[:] = result
+    return out
+
+
+def savgol(signal, window_length, polyorder, out=None):
+    """
+    savgol_filter(signal, window_length, polyorder) with cached coefficients.
+
+    Long windows are convolved by FFT (see convolve), otherwise the result is
+    identical to savgol_filter. The first and last half window are fitted
+    with polynomials like mode="interp" does, on just the edge samples.
+
+    Args:
+        out: optional array for the result, of the length of signal and the
+            float dtype of savgol_filter's result, e.g. shared memory
+    """
+    return savgol_cascade(signal, ((window_length, polyorder),), out)
+
+
+def savgol_cascade(signal, stages, out=None):
+    """
+    Consecutive Savitzky-Golay filters in a single pass over the signal.
+
+    The filters are composed into one kernel, so the signal is read and
+    written once and no intermediate signal is allocated. Only the samples
+    within the combined half windows of either end, where the polynomial
+    edge fits of the filters apply, are computed by running the filters one
+    after another on the ends of the signal.
+
+    Args:
+        stages: sequence of (window_length, polyorder), in the order applied
+        out: optional array for the result, as in savgol
+    """
+    signal = _as_float(signal)
+    stages = tuple((int(window), int(order)) for window, order in stages)
+    margin = sum(window // 2 for window, _ in stages)
+    # The end pieces have to hold every filter's edge fit and its input
+    end_length = 2 * sum(window for window, _ in stages)
+    if len(signal) < 2 * end_length:
+        result = signal
+        for window_length, polyorder in stages:
+            result = savgol_filter(result, window_length, polyorder)
+        if out is None:
+            return result
+        out[:] = result
+        return out
+
+    result = convolve(signal, composed_kernel(stages), out)
+    if margin:
+        head, tail = signal[:end_length], signal[-end_length:]
+        for window_length, polyorder in stages:
+            head = savgol_filter(head, window_length, polyorder)
+            tail = savgol_filter(tail, window_length, polyorder)
+        result[:margin] = head[:margin]
+        result[-margin:] = tail[-margin:]
+    return result
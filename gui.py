@@ -1,15 +1,74 @@
+import itertools
+import logging
 import os.path
+import queue
+import threading
+from time import perf_counter
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, HORIZONTAL
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-from signal_processing import process_signal, find_signal_peaks
-from file_operations import load_csv, convert_to_npy, load_npy
+from signal_processing import (
+    add_detection_stages,
+    check_filter_params,
+    print_peak_summary,
+    sweep_signal_peaks,
+)
+from parallel_analysis import AnalysisCancelled, detect_stages, filter_channels
+from file_operations import (
+    load_csv,
+    load_npy,
+    load_peaks,
+    write_peaks_file,
+    write_recording_file,
+    convert_csv_files,
+    format_conversion_report,
+    output_names,
+    PEAKS_SAVE_TYPES,
+    RECORDING_SAVE_TYPES,
+)
+from analysis_cache import StageCache
+from stage_graph import StageGraph
+from event_index import EventIndex
+from lod import BlockPyramid, EventTrain, MinMaxPyramid, ViewportLines
+from refinement import decimate, refine_result
+from sweep import parse_values
+from tracing import Tracer
+from workspace import DEFAULT_WORKSPACE_BYTES, Workspace
+from plot_manager import AnalysisPlot
+
+# Samples skipped between analyzed samples
+DOWNSAMPLE_RATE = 10
+
+# Milliseconds between checks for results of the background analysis
+ANALYSIS_POLL_MS = 50
+
+# Milliseconds of slider inactivity before a new analysis is started
+AUTO_UPDATE_DELAY_MS = 400
+
+# Columns of the sweep results table: (column, heading, width, format)
+SWEEP_TABLE_COLUMNS = (
+    ("channel", "Channel", 60, str.upper),
+    ("window_length", "Window", 60, "{:d}".format),
+    ("poly_order", "Poly", 40, "{:d}".format),
+    ("prominence_threshold", "Prominence %", 90, "{:g}".format),
+    ("amplitude_tolerance", "Tolerance", 70, "{:g}".format),
+    ("high_threshold", "High %", 60, lambda value: f"{value * 100:g}"),
+    ("medium_threshold", "Medium %", 70, lambda value: f"{value * 100:g}"),
+    ("peak_count", "Peaks", 60, "{:d}".format),
+    ("rejected_count", "Rejected", 70, "{:d}".format),
+    ("high_count", "High", 50, "{:d}".format),
+    ("medium_count", "Medium", 60, "{:d}".format),
+    ("low_count", "Low", 50, "{:d}".format),
+    ("actual_frequency", "Frequency (Hz)", 100, "{:.2f}".format),
+    ("signal_quality", "Quality", 70, "{:.3f}".format),
+)
 
 
 class SignalAnalyzer:
-    def __init__(self, root):
+    def __init__(self, root, workspace_bytes=DEFAULT_WORKSPACE_BYTES):
         self.title_label = None
         self.convert_button = None
         self.root = root
@@ -20,7 +79,26 @@ class SignalAnalyzer:
         self.filename = None
 
         self.data_type = None
-        self.peaks_data = None
+        self.peaks_index = None
+        self.viewports = ()  # Keeps the zoom/pan callbacks of the axes alive
+
+        # Results of the pipeline stages, keyed by recording and parameters
+        self.stage_cache = StageCache()
+        self.recording_id = None
+
+        # Open recordings, those over the memory budget are paged out to disk
+        self.workspace = Workspace(workspace_bytes, on_release=self.release_recording)
+
+        # Background analysis state, only the latest job is ever shown
+        self.analysis_queue = queue.Queue()
+        self.job_id = 0
+        self.job_cancel = None
+        self.job_running = False
+        self.analysis_shown = False
+        self.pending_update = None
+
+        # Stage timings of the last shown analysis
+        self.last_trace = None
 
     def setup_gui(self):
 
@@ -66,10 +144,23 @@ class SignalAnalyzer:
         )
         self.convert_button.pack(side=tk.LEFT, padx=5)
 
+        ttk.Button(
+            file_frame, text="Convert CSV Files", command=self.convert_csv_files
+        ).pack(side=tk.LEFT, padx=5)
+
         ttk.Button(file_frame, text="Load NPY", command=self.load_npy).pack(
             side=tk.LEFT, padx=5
         )
 
+        # Switch between the open recordings, keeping their analysis results
+        ttk.Label(file_frame, text="Recording:").pack(side=tk.LEFT, padx=5)
+        self.recording_select = ttk.Combobox(file_frame, state="readonly", width=24)
+        self.recording_select.pack(side=tk.LEFT, padx=5)
+        self.recording_select.bind("<<ComboboxSelected>>", self.switch_recording)
+        ttk.Button(file_frame, text="Close", command=self.close_recording).pack(
+            side=tk.LEFT, padx=5
+        )
+
 
 
         ttk.Label(filter_frame, text="Window Length:").pack(side=tk.LEFT, padx=5)
@@ -103,6 +194,25 @@ class SignalAnalyzer:
         self.amplitude_tolerance.set(6.0)
         self.amplitude_tolerance.pack(side=tk.LEFT, padx=5)
 
+        # Derive the minimum peak distance from the period found in the signal
+        self.auto_period = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            peak_frame,
+            text="Auto Period",
+            variable=self.auto_period,
+            command=self.on_parameter_change,
+        ).pack(side=tk.LEFT, padx=5)
+
+        # Detect on the anti-aliased downsampled signal, then locate the peaks
+        # in the full-rate signal
+        self.refine_peaks = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            peak_frame,
+            text="Refine Peaks",
+            variable=self.refine_peaks,
+            command=self.on_parameter_change,
+        ).pack(side=tk.LEFT, padx=5)
+
         threshold_frame = ttk.LabelFrame(
             control_container, text="Peak Classification Thresholds"
         )
@@ -134,6 +244,10 @@ class SignalAnalyzer:
             threshold_frame, text="Update Analysis", command=self.update_analysis
         ).pack(side=tk.RIGHT, padx=5)
 
+        ttk.Button(
+            threshold_frame, text="Parameter Sweep", command=self.open_sweep_dialog
+        ).pack(side=tk.RIGHT, padx=5)
+
         reset_button = ttk.Button(
             threshold_frame, text="Reset Defaults", command=self.reset_to_defaults
         )
@@ -151,6 +265,58 @@ class SignalAnalyzer:
         # Create the main figure and add toolbar
         self.setup_plots()
 
+        # Status line and activity indicator for long running operations
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5)
+        self.progress = ttk.Progressbar(status_frame, mode="indeterminate", length=150)
+        self.progress.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(status_frame, text="Save Trace", command=self.save_trace).pack(
+            side=tk.RIGHT, padx=5
+        )
+        self.trace_allocations = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            status_frame, text="Trace Memory", variable=self.trace_allocations
+        ).pack(side=tk.RIGHT, padx=5)
+        self.show_timings = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            status_frame,
+            text="Show Timings",
+            variable=self.show_timings,
+            command=self.toggle_timings,
+        ).pack(side=tk.RIGHT, padx=5)
+        self.status_label = ttk.Label(status_frame, text="Ready", anchor=tk.W)
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        # Stage timings of the last analysis, hidden until requested
+        self.timings_frame = ttk.LabelFrame(self.root, text="Stage Timings")
+        self.timings_table = ttk.Treeview(
+            self.timings_frame,
+            columns=("calls", "time", "share", "memory", "details"),
+            height=8,
+        )
+        for column, heading, width in (
+            ("#0", "Stage", 180),
+            ("calls", "Calls", 50),
+            ("time", "Time (ms)", 90),
+            ("share", "Share", 60),
+            ("memory", "Peak Memory (MiB)", 120),
+            ("details", "Details", 400),
+        ):
+            self.timings_table.heading(column, text=heading, anchor=tk.W)
+            self.timings_table.column(column, width=width, anchor=tk.W)
+        self.timings_table.pack(fill=tk.X, padx=5, pady=5)
+
+        # Changing a slider after the first analysis starts a new one
+        for scale in (
+            self.window_length,
+            self.poly_order,
+            self.prominence_threshold,
+            self.amplitude_tolerance,
+            self.high_threshold,
+            self.medium_threshold,
+        ):
+            scale.config(command=self.on_parameter_change)
+
     def setup_plots(self):
         self.fig, (self.ax1, self.ax2) = plt.subplots(2, 1, figsize=(12, 8))
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.root)
@@ -158,6 +324,7 @@ class SignalAnalyzer:
         self.toolbar = NavigationToolbar2Tk(self.canvas, self.root)
         self.toolbar.update()
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.plots = AnalysisPlot(self.fig, (self.ax1, self.ax2))
 
     def reset_to_defaults(self):
 
@@ -179,35 +346,108 @@ class SignalAnalyzer:
         self.high_threshold.set(default_values["high_threshold"])
         self.medium_threshold.set(default_values["medium_threshold"])
 
+    def toggle_timings(self):
+        """Show or hide the stage timings panel above the status line"""
+        if self.show_timings.get():
+            self.timings_frame.pack(
+                side=tk.BOTTOM, fill=tk.X, padx=5, before=self.canvas.get_tk_widget()
+            )
+        else:
+            self.timings_frame.pack_forget()
+
+    def update_timings(self, tracer):
+        """Fill the timings panel with the stages of a traced analysis"""
+        table = self.timings_table
+        table.delete(*table.get_children())
+        rows = tracer.summary()
+        total = sum(row["duration"] for row in rows if row["depth"] == 0)
+        for row in rows:
+            memory = row["peak_allocated"]
+            details = ", ".join(
+                f"{key}={value:,}" if isinstance(value, int) else f"{key}={value}"
+                for key, value in row["info"].items()
+            )
+            table.insert(
+                "",
+                tk.END,
+                text="    " * row["depth"] + row["name"],
+                values=(
+                    row["calls"],
+                    f"{row['duration'] * 1000:.1f}",
+                    f"{row['duration'] / total:.0%}" if total else "",
+                    "" if memory is None else f"{memory / 2**20:.1f}",
+                    details,
+                ),
+            )
+
+    def save_trace(self):
+        """Save the stage timings of the last analysis as a Chrome trace JSON file"""
+        if self.last_trace is None:
+            messagebox.showinfo("Info", "Run an analysis first.")
+            return
+
+        save_path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("Trace files", "*.json")],
+            title="Save Analysis Trace",
+        )
+        if not save_path:
+            return
+
+        try:
+            self.last_trace.write_json(save_path)
+            self.set_status(f"Trace saved to {save_path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Error saving trace: {str(e)}")
+
+    def set_status(self, text):
+        """Show a message in the status line and refresh the window"""
+        self.status_label.config(text=text)
+        self.root.update_idletasks()
+
+    def report_load_progress(self, rows_done, total_rows):
+        """Progress callback for chunked CSV loading"""
+        percent = 100 * rows_done / total_rows if total_rows else 100
+        self.set_status(
+            f"Loading CSV... {rows_done:,} / {total_rows:,} rows ({percent:.0f}%)"
+        )
+
     def load_csv(self):
         """Load CSV file and handle both ADC and peaks data formats"""
-        result = load_csv()
+        result = load_csv(progress_callback=self.report_load_progress)
         if result[0] is None:
+            self.set_status("Ready")
             return
+        self.set_status(f"Loaded {len(result[0]):,} rows")
 
         data, filename, data_type = result
         self.filename = os.path.basename(filename)
 
         if data_type == "adc":
-            self.data = data
-            self.data_type = "adc"
-            self.peaks_data = None  # Clear any existing peaks data
+            self.open_recording(data, self.filename, filename)
+            self.peaks_index = None  # Clear any existing peaks data
             # self.update_analysis()
 
         self.root.title(f"Signal Analyzer - {self.filename}")
         self.title_label.config(text=f"Signal Analyzer - {self.filename}")
 
     def import_peaks(self):
-        """Specifically import peaks data from a CSV file"""
-        result = load_csv()
+        """Specifically import peaks data from a CSV or binary peaks file"""
+        result = load_peaks()
         if result[0] is None:
             return
 
         data, filename, data_type = result
 
         if data_type == "peaks":
-            self.peaks_data = data
+            self.peaks_index = EventIndex.from_frame(data)
             self.filename = os.path.basename(filename)
+            counts = self.peaks_index.counts()
+            self.set_status(
+                "Imported "
+                + ", ".join(f"{count:,} {label}" for label, count in counts.items())
+                + " peaks"
+            )
 
             # Update window title and label with peaks filename
             self.root.title(f"Signal Analyzer - Peaks: {self.filename}")
@@ -218,124 +458,272 @@ class SignalAnalyzer:
             # Plot the imported peaks
             self.plot_peaks_only()
         else:
-            messagebox.showinfo("Info", "Please select a peaks CSV file.")
+            messagebox.showinfo("Info", "Please select a peaks file.")
 
     def plot_peaks_only(self):
-        if self.peaks_data is None:
+        if self.peaks_index is None:
             messagebox.showinfo("Info", "No peaks data loaded.")
             return
 
         # Clear previous plots
-        self.ax1.cla()
-        self.ax2.cla()
+        self.plots.clear()
 
         # Define constants for peak classifications
         WATER_Y_VALUE = 0.5
         TISSUE_Y_VALUE = 1
 
-        # Plot peaks based on their labels and connect them with lines
-        for label, group in self.peaks_data.groupby("label"):
-            # Sort peaks by their startTime to ensure proper line connection
-            group = group.sort_values("startTime")
-
-            times = group["startTime"].values  # Use startTime for x-axis
-
-            # Assign y-values based on label type (0.5 for water peaks, 1 for tissue peaks)
+        # One spike train per label on ax1, as ADC1/ADC2 is no longer relevant.
+        # Trains are culled to the visible range on zoom and pan.
+        viewport = ViewportLines(self.ax1)
+        self.viewports = (viewport,)
+        index = self.peaks_index
+        for label in sorted(index.labels):
+            times = index.label_starts(index.code(label))
+            if not len(times):
+                continue
             if label == "water":
-                y_values = [WATER_Y_VALUE] * len(times)  # Water peaks at y = 0.5
-                marker = "o"  # Marker for water peaks
-                color = "blue"  # Color for water peaks (arbitrary choice)
+                train = EventTrain(times, WATER_Y_VALUE)
+                marker, color = "o", "blue"  # Water peaks at y = 0.5
             else:  # Tissue label
-                y_values = [TISSUE_Y_VALUE] * len(times)  # Tissue peaks at y = 1
-                marker = "^"  # Marker for tissue peaks
-                color = "red"  # Color for tissue peaks (arbitrary choice)
-
-            # Assign the same axis for all peaks, as ADC1/ADC2 is no longer relevant
-            ax = self.ax1  # Use ax1 for both water and tissue peaks
-
-            # Only add label for the first occurrence of each label in the legend
-            legend_labels = [
-                item.get_label() for item in ax.get_legend_handles_labels()[0]
-            ]
-            if label not in legend_labels:
-                ax.scatter(times, y_values, label=label, color=color, marker=marker)
-            else:
-                ax.scatter(times, y_values, color=color, marker=marker)
-
-            # Create a continuous x-axis by adding points between peaks with y=0
-            continuous_times = []
-            continuous_y = []
-
-            for i in range(1, len(times)):
-                continuous_times.append(times[i - 1])
-                continuous_y.append(y_values[i - 1])  # Peak value for the current peak
-
-                # Add a "gap" between peaks
-                gap_start = times[i - 1]
-                gap_end = times[i]
-                continuous_times.extend([gap_start, gap_end])
-                continuous_y.extend([0, 0])  # Y value for gap is 0
-
-            continuous_times.append(times[-1])  # Add the last peak
-            continuous_y.append(y_values[-1])
-
-            # Plot the continuous line connecting peaks and gaps
-            ax.plot(
-                continuous_times,
-                continuous_y,
-                color=color,
-                linestyle="-",
-                linewidth=0.8,
-                alpha=0.7,
+                train = EventTrain(times, TISSUE_Y_VALUE)
+                marker, color = "^", "red"  # Tissue peaks at y = 1
+            viewport.plot_events(
+                train, color, marker, label=label, linewidth=0.8, alpha=0.7
             )
+        self.ax1.autoscale_view()
 
         # Update plot legends and refresh canvas
         self.ax1.legend(loc="upper right")
         self.fig.tight_layout()
         self.canvas.draw_idle()
 
+    def run_in_background(self, task, on_done, status):
+        """
+        Run task() in a worker thread and call on_done(result, error) on the Tk thread.
+
+        The progress bar runs and the status line shows `status` meanwhile.
+        """
+        outcome = {}
+
+        def work():
+            try:
+                outcome["result"] = task()
+            except Exception as e:
+                outcome["error"] = e
+
+        def poll():
+            if worker.is_alive():
+                self.root.after(ANALYSIS_POLL_MS, poll)
+                return
+            self.progress.stop()
+            on_done(outcome.get("result"), outcome.get("error"))
+
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        self.progress.start()
+        self.set_status(status)
+        self.root.after(ANALYSIS_POLL_MS, poll)
+
     def start_convert_to_npy(self):
-        # disable button
+        if self.data is None:
+            return
+
+        save_path = filedialog.asksaveasfilename(
+            defaultextension=".npy", filetypes=RECORDING_SAVE_TYPES
+        )
+        if not save_path:
+            return
 
+        # disable button
         self.convert_button.config(state=tk.DISABLED)
         self.convert_button.config(text="Converting...")
-        self.root.update_idletasks()  # Forces UI update
 
-        # Run conversion
-        if self.data is not None:
-            self.convert_to_npy()
+        def done(report, error):
+            # Re-enable button
+            self.convert_button.config(state=tk.NORMAL)
+            self.convert_button.config(text="Convert to NPY")
+            if error is not None:
+                logging.error(f"Error saving NPY file: {error}")
+                self.set_status("Conversion failed")
+                messagebox.showerror("Error", str(error))
+                return
+            self.set_status("Ready")
+            messagebox.showinfo(
+                "Success",
+                f"File saved successfully\n{format_conversion_report(report)}",
+            )
 
-        # Re-enable button
-        self.convert_button.config(state=tk.NORMAL)
-        self.convert_button.config(text="Convert to NPY")
+        # Written chunk by chunk off the Tk thread
+        data = self.data
+        self.run_in_background(
+            lambda: write_recording_file(save_path, data), done, "Converting..."
+        )
 
-    def convert_to_npy(self):
-        if self.data is not None:
-            convert_to_npy(self.data)
+    def convert_csv_files(self):
+        """Convert several CSV files to NPY at once, without loading them"""
+        csv_paths = filedialog.askopenfilenames(filetypes=[("CSV files", "*.csv")])
+        if not csv_paths:
+            return
+        output_dir = filedialog.askdirectory(title="Folder for the NPY files")
+        if not output_dir:
+            return
+
+        try:
+            names = output_names(csv_paths)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        conversions = [
+            (path, os.path.join(output_dir, name + ".npy"))
+            for path, name in zip(csv_paths, names)
+        ]
+
+        def done(reports, error):
+            if error is not None:
+                self.set_status("Conversion failed")
+                messagebox.showerror("Error", f"Error converting files: {error}")
+                return
+            failed = sum("error" in report for report in reports)
+            self.set_status(
+                f"Converted {len(reports) - failed} of {len(reports)} files"
+            )
+            summary = "\n".join(format_conversion_report(report) for report in reports)
+            if failed:
+                messagebox.showerror("Error", summary)
+            else:
+                messagebox.showinfo("Success", summary)
+
+        self.run_in_background(
+            lambda: convert_csv_files(conversions),
+            done,
+            f"Converting {len(conversions)} CSV files...",
+        )
 
     def load_npy(self):
-        self.data, self.filename = load_npy()
-        self.filename = os.path.basename(self.filename)
+        data, filename = load_npy(mmap=True)
+        if data is None:
+            return
+
+        self.filename = os.path.basename(filename)
+        opened = self.open_recording(data, self.filename, filename)
         self.root.title(f"Signal Analyzer - {self.filename}")
         self.title_label.config(text=f"Signal Analyzer - {self.filename}")
+        if opened:
+            self.show_recording()
+
+    def open_recording(self, data, name, source=None):
+        """
+        Add a recording to the workspace and make it the current one.
+
+        Args:
+            source: path of the file the data was read from; if that file is
+                already open its recording is selected instead
+
+        Returns:
+            False if an already open recording was selected
+        """
+        if source is not None:
+            recording_id = self.workspace.find(source)
+            if recording_id is not None:
+                self.select_recording(recording_id)
+                return False
+
+        self.cancel_analysis()
+        self.analysis_shown = False
+        self.recording_id = self.workspace.add(name, data, source)
+        self.data = self.workspace.get(self.recording_id)
+        self.data_type = "adc"
+        self.plots.clear()
+        self.refresh_recordings()
+        return True
+
+    def refresh_recordings(self):
+        """List the open recordings, selecting the current one"""
+        recordings = self.workspace.recordings()
+        self.recording_select.config(values=[name for _, name, _ in recordings])
+        if self.recording_id is None:
+            self.recording_select.set("")
+        for position, (recording_id, _, _) in enumerate(recordings):
+            if recording_id == self.recording_id:
+                self.recording_select.current(position)
+
+    def switch_recording(self, _event=None):
+        """Make the recording selected in the list the current one"""
+        position = self.recording_select.current()
+        if position < 0:
+            return
+        recording_id, _, _ = self.workspace.recordings()[position]
+        self.select_recording(recording_id)
 
-        if self.data is None:
+    def select_recording(self, recording_id):
+        """
+        Make an open recording the current one.
+
+        Its data and cached analysis results are still open, so it is shown
+        again without reloading; an analysis is redone from the cache.
+        """
+        if recording_id == self.recording_id:
             return
 
-        # Clear previous lines on the axes
-        self.ax1.cla()
-        self.ax2.cla()
+        analyzed = self.analysis_shown
+        self.cancel_analysis()
+        self.analysis_shown = False
+        self.recording_id = recording_id
+        self.data = self.workspace.get(recording_id)
+        self.data_type = "adc"
+        self.filename = self.workspace.name(recording_id)
+        self.root.title(f"Signal Analyzer - {self.filename}")
+        self.title_label.config(text=f"Signal Analyzer - {self.filename}")
+        self.refresh_recordings()
+
+        self.plots.clear()
+        if analyzed:
+            self.update_analysis()
+        else:
+            self.show_recording()
+
+    def close_recording(self):
+        """Close the current recording and show the last opened one left"""
+        if self.recording_id is None:
+            return
+        self.cancel_analysis()
+        recording_id = self.recording_id
+        self.recording_id = None
+        self.data = None
+        self.analysis_shown = False
+        self.workspace.remove(recording_id)
+        self.stage_cache.discard(recording_id)
+
+        recordings = self.workspace.recordings()
+        if recordings:
+            self.select_recording(recordings[-1][0])
+            return
+        self.refresh_recordings()
+        self.filename = None
+        self.root.title("Signal Processing App")
+        self.title_label.config(text="Signal Processing App")
+        self.plots.clear()
+        self.viewports = ()
+        self.canvas.draw_idle()
 
-        # Increase downsample rate if needed
-        downsample_rate = 10
-        downsampled_data = self.data.iloc[::downsample_rate]
+    def release_recording(self, recording_id):
+        """Drop cached results referencing the in-memory data of a recording"""
+        self.stage_cache.discard(recording_id, stages=("raw_pyramid",))
 
-        # Time vector (in seconds)
-        time = np.arange(len(downsampled_data)) / (self.sample_rate / downsample_rate)
+    def show_recording(self):
+        """Plot the raw channels of the current recording"""
+        # Clear previous lines on the axes
+        self.plots.clear()
+        self.viewports = (ViewportLines(self.ax1), ViewportLines(self.ax2))
+        viewport1, viewport2 = self.viewports
 
-        # Plot raw ADC1 and ADC2 data
-        self.ax1.plot(time, downsampled_data["adc1"], "b-", label="ADC1")
-        self.ax2.plot(time, downsampled_data["adc2"], "g-", label="ADC2")
+        # Plot raw ADC1 and ADC2 data from their min/max pyramids
+        viewport1.plot(
+            self.raw_pyramid(self.data, self.recording_id, "adc1"), "b-", label="ADC1"
+        )
+        viewport2.plot(
+            self.raw_pyramid(self.data, self.recording_id, "adc2"), "g-", label="ADC2"
+        )
 
         # Refresh canvas
         self.fig.tight_layout()
@@ -349,182 +737,361 @@ class SignalAnalyzer:
                 "amplitude_tolerance": float(self.amplitude_tolerance.get()),
                 "high_threshold": float(self.high_threshold.get()) / 100,
                 "medium_threshold": float(self.medium_threshold.get()) / 100,
+                "auto_period": bool(self.auto_period.get()),
+                "refine_peaks": bool(self.refine_peaks.get()),
             }
             return params
         except ValueError as e:
             messagebox.showerror("Error", f"Invalid parameter value: {str(e)}")
             return None
 
-    def update_analysis(self):
+    def valid_filter_window(self, window, poly_order):
+        """Return the window length, or None after an error if the filter is invalid"""
+        try:
+            check_filter_params(window, poly_order)
+            return window
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid filter parameters: {str(e)}")
+            return None  # Continue with the unfiltered signals
+
+    def analysis_graph(self, data, recording_id, cancel=None, tracer=None):
+        """
+        Stage graph of the analysis of a recording, backed by the stage cache.
+
+        downsample -> filter -> prepare -> candidate_peaks -> accepted_peaks ->
+        classified_peaks (-> refined_peaks with refine_peaks), plus the time
+        vector and the min/max pyramids that plotting draws. Every stage is
+        keyed by only the parameters it depends on (see analysis_params), so
+        after a slider change only the stages downstream of that parameter
+        run again; a new classification threshold, for example, just
+        reclassifies the cached peaks.
+        """
+
+        def downsample(downsample_rate, refine_peaks):
+            if not refine_peaks:
+                # A copy, a strided view would keep the full-rate columns
+                # alive in the cache after the workspace evicts them
+                return data.iloc[::downsample_rate].copy()
+            return pd.DataFrame(
+                {
+                    name: decimate(data[name].to_numpy(), downsample_rate)
+                    for name in ("adc1", "adc2")
+                }
+            )
+
+        def refine(classified, channel, downsample_rate, window_length, poly_order):
+            peaks, properties = classified
+            result = refine_result(
+                properties["result"],
+                data[channel].to_numpy(),
+                downsample_rate,
+                self.sample_rate,
+                window_length,
+                poly_order,
+            )
+            return peaks, dict(properties, result=result)
+
+        def raw_pyramid(channel):
+            container = getattr(data, "container", None)
+            if container is not None:
+                # Drawn from the block statistics and the rows in view, the
+                # whole channel is never decompressed for plotting
+                return BlockPyramid(container, channel, self.sample_rate)
+            return MinMaxPyramid(data[channel].to_numpy(), self.sample_rate)
+
+        graph = StageGraph(self.stage_cache, recording_id, cancel, tracer)
+        graph.add_stage(
+            "downsample", downsample, params=("downsample_rate", "refine_peaks")
+        )
+        graph.add_stage(
+            "time",
+            lambda downsampled, downsample_rate: np.arange(len(downsampled))
+            / (self.sample_rate / downsample_rate),
+            inputs=("downsample",),
+            params=("downsample_rate",),
+        )
+        graph.add_stage(
+            "filter",
+            lambda downsampled, window_length, poly_order: filter_channels(
+                {name: downsampled[name] for name in ("adc1", "adc2")},
+                window_length,
+                poly_order,
+                cancel=cancel,
+            ),
+            inputs=("downsample",),
+            params=("window_length", "poly_order"),
+        )
+        add_detection_stages(graph, "filter", "time", tracer)
+        graph.add_stage(
+            "refined_peaks",
+            refine,
+            inputs=("classified_peaks",),
+            params=("channel", "downsample_rate", "window_length", "poly_order"),
+        )
+        graph.add_stage("raw_pyramid", raw_pyramid, params=("channel",))
+        graph.add_stage(
+            "filtered_pyramid",
+            lambda filtered, channel, downsample_rate: MinMaxPyramid(
+                filtered[channel], self.sample_rate / downsample_rate
+            ),
+            inputs=("filter",),
+            params=("channel", "downsample_rate"),
+        )
+        return graph
+
+    def analysis_params(self, window, poly_order, peak_params):
+        """Parameters of all stages of the analysis graph"""
+        return dict(
+            peak_params,
+            downsample_rate=DOWNSAMPLE_RATE,
+            window_length=window,
+            poly_order=poly_order,
+        )
+
+    def raw_pyramid(self, data, recording_id, name):
+        """Min/max pyramid of a full-rate channel, cached per recording"""
+        graph = self.analysis_graph(data, recording_id)
+        return graph.evaluate("raw_pyramid", {"channel": name})
+
+    def run_channel_analysis(self, graph, params, cancel=None, tracer=None):
+        """
+        Filter both ADC channels and detect their peaks, safe to call from a worker thread.
+
+        Stages are evaluated through the analysis graph, so only those whose
+        parameters changed are recomputed. Channels without any cached
+        detection stage are detected in parallel on the process pool. With
+        refine_peaks the peaks of the result are located at full rate.
+
+        Returns:
+            dict of channel name -> (filtered signal, peaks, properties)
+        """
+        channels = {name: dict(params, channel=name) for name in ("adc1", "adc2")}
+        final = "refined_peaks" if params["refine_peaks"] else "classified_peaks"
+        fresh = [
+            name
+            for name, channel_params in channels.items()
+            if not graph.cached(final, channel_params)
+        ]
+
+        cold = [name for name in fresh if not graph.cached("prepare", channels[name])]
+        if cold:
+            filtered = graph.evaluate("filter", params)
+            computed = detect_stages(
+                {name: filtered[name] for name in cold},
+                params,
+                graph.evaluate("time", params),
+                cancel=cancel,
+                tracer=tracer,
+            )
+            for name, stages in computed.items():
+                for stage, value in stages.items():
+                    graph.put(stage, channels[name], value)
+
+        results = {}
+        for name, channel_params in channels.items():
+            filtered = graph.evaluate("filter", params)[name]
+            peaks, properties = graph.evaluate(final, channel_params)
+            results[name] = (filtered, peaks, properties)
+            if name in fresh and "peak_count" in properties:
+                print_peak_summary(properties)
+        return results
+
+    def run_sweep(
+        self, data, recording_id, grid, auto_period=False, refine_peaks=False
+    ):
+        """
+        Evaluate a grid of settings on both channels, safe to call from a worker thread.
+
+        The filtered and prepared signals come from the analysis graph, so
+        filter settings already analyzed are not filtered again.
+
+        Args:
+            grid: dict of lists of values of window_length, poly_order and the
+                detection parameters of get_peak_params
+            refine_peaks: sweep on the anti-aliased downsampled signals; the
+                refinement itself does not change the counts
+
+        Returns:
+            DataFrame with one row per channel and combination of settings
+        """
+        graph = self.analysis_graph(data, recording_id)
+        tables = []
+        for window, poly_order in itertools.product(
+            grid["window_length"], grid["poly_order"]
+        ):
+            params = self.analysis_params(
+                window, poly_order, {"refine_peaks": refine_peaks}
+            )
+            for name in ("adc1", "adc2"):
+                prepared = graph.evaluate("prepare", dict(params, channel=name))
+                table = sweep_signal_peaks(prepared, grid, auto_period)
+                table.insert(0, "poly_order", poly_order)
+                table.insert(0, "window_length", window)
+                table.insert(0, "channel", name)
+                tables.append(table)
+        return pd.concat(tables, ignore_index=True)
+
+    def open_sweep_dialog(self):
+        """Open the parameter sweep window for the loaded recording"""
         if self.data is None:
+            messagebox.showerror("Error", "No data loaded")
             return
+        SweepDialog(self)
 
-        try:
-            window = int(self.window_length.get())
-            if window % 2 == 0:  # Ensure window length is odd
-                window += 1
-            poly_order = int(self.poly_order.get())
+    def on_parameter_change(self, _value=None):
+        """Restart the analysis shortly after the sliders stop moving"""
+        if not self.analysis_shown or self.data is None:
+            return
+        if self.pending_update is not None:
+            self.root.after_cancel(self.pending_update)
+        self.pending_update = self.root.after(
+            AUTO_UPDATE_DELAY_MS, self.update_analysis
+        )
 
-            # Clear previous lines on the axes
-            self.ax1.cla()
-            self.ax2.cla()
+    def cancel_analysis(self):
+        """Cancel the running analysis job, its result will be dropped"""
+        if self.job_cancel is not None:
+            self.job_cancel.set()
+        self.job_id += 1
+        if self.job_running:
+            self.job_running = False
+            self.progress.stop()
 
-            # Get peak detection parameters
-            peak_params = self.get_peak_params()
-            if peak_params is None:
-                return
+    def update_analysis(self):
+        """Start the analysis in a background thread, replacing any running one"""
+        self.pending_update = None
+        if self.data is None:
+            return
 
-            # Increase downsample rate if needed
-            downsample_rate = 10
-            downsampled_data = self.data.iloc[::downsample_rate]
+        window = int(self.window_length.get())
+        if window % 2 == 0:  # Ensure window length is odd
+            window += 1
+        poly_order = int(self.poly_order.get())
 
-            # Time vector (in seconds)
-            time = np.arange(len(downsampled_data)) / (
-                self.sample_rate / downsample_rate
+        # Get peak detection parameters
+        peak_params = self.get_peak_params()
+        if peak_params is None:
+            return
+        window = self.valid_filter_window(window, poly_order)
+
+        # Drop the in-flight computation and start a new job
+        self.cancel_analysis()
+        self.job_cancel = threading.Event()
+        self.job_running = True
+        worker = threading.Thread(
+            target=self.analysis_worker,
+            args=(
+                self.job_id,
+                self.job_cancel,
+                Tracer(trace_allocations=self.trace_allocations.get()),
+                self.data,
+                self.recording_id,
+                window,
+                poly_order,
+                peak_params,
+            ),
+            daemon=True,
+        )
+        worker.start()
+
+        self.progress.start()
+        self.set_status("Analyzing...")
+        self.root.after(ANALYSIS_POLL_MS, self.poll_analysis, self.job_id)
+
+    def analysis_worker(
+        self,
+        job_id,
+        cancel,
+        tracer,
+        data,
+        recording_id,
+        window,
+        poly_order,
+        peak_params,
+    ):
+        """Run the analysis pipeline off the Tk thread and queue the result"""
+        try:
+            start = perf_counter()
+            graph = self.analysis_graph(data, recording_id, cancel, tracer)
+            params = self.analysis_params(window, poly_order, peak_params)
+
+            # Filter signals and find peaks on both channels in parallel
+            with tracer.span("analysis", samples=len(data) // DOWNSAMPLE_RATE):
+                results = self.run_channel_analysis(graph, params, cancel, tracer)
+
+            # Pyramids for drawing the raw and filtered signals
+            pyramids = {}
+            with tracer.span("pyramids", channels=len(results)):
+                for name in results:
+                    channel_params = dict(params, channel=name)
+                    pyramids[name] = (
+                        graph.evaluate("raw_pyramid", channel_params),
+                        graph.evaluate("filtered_pyramid", channel_params),
+                    )
+
+            elapsed = perf_counter() - start
+            self.analysis_queue.put(
+                (job_id, "done", (pyramids, results, elapsed, tracer))
             )
 
-            # Process signals
-            filtered_adc1 = process_signal(downsampled_data["adc1"], window, poly_order)
-            filtered_adc2 = process_signal(downsampled_data["adc2"], window, poly_order)
+        except AnalysisCancelled:
+            tracer.close()
+        except Exception as e:
+            tracer.close()
+            self.analysis_queue.put((job_id, "error", e))
+
+    def poll_analysis(self, job_id):
+        """Pick up results of the background analysis on the Tk thread"""
+        while True:
+            try:
+                result_job, kind, payload = self.analysis_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if result_job != self.job_id:
+                if kind == "done":
+                    payload[-1].close()  # Tracer of the dropped result
+                continue  # Result of a replaced or cancelled job
+
+            self.job_running = False
+            self.progress.stop()
+            if kind == "done":
+                self.show_analysis(*payload)
+            else:
+                self.set_status("Analysis failed")
+                messagebox.showerror("Error", f"Error updating analysis: {payload}")
 
-            # Find peaks with parameters
-            peaks_adc1, properties_adc1 = find_signal_peaks(filtered_adc1, peak_params)
-            peaks_adc2, properties_adc2 = find_signal_peaks(filtered_adc2, peak_params)
+        if self.job_running and job_id == self.job_id:
+            self.root.after(ANALYSIS_POLL_MS, self.poll_analysis, job_id)
 
-            # Plot ADC1
-            self.ax1.plot(
-                time, downsampled_data["adc1"], "b-", alpha=0.3, label="Raw ADC1"
-            )
-            self.ax1.plot(time, filtered_adc1, "b-", label="Filtered ADC1")
-
-            # Plot classified peaks for ADC1
-            if len(peaks_adc1) > 0:
-                classifications = properties_adc1["peak_classifications"]
-                if classifications:  # Check if classifications exist
-                    high_peaks = [
-                        p for p, c in zip(peaks_adc1, classifications) if c == "high"
-                    ]
-                    medium_peaks = [
-                        p for p, c in zip(peaks_adc1, classifications) if c == "medium"
-                    ]
-                    low_peaks = [
-                        p for p, c in zip(peaks_adc1, classifications) if c == "low"
-                    ]
-
-                    if high_peaks:
-                        self.ax1.plot(
-                            time[high_peaks],
-                            filtered_adc1[high_peaks],
-                            "x",
-                            color="red",
-                            label=f"High Peaks ({len(high_peaks)})",
-                            markersize=10,
-                        )
-                    if medium_peaks:
-                        self.ax1.plot(
-                            time[medium_peaks],
-                            filtered_adc1[medium_peaks],
-                            "x",
-                            color="yellow",
-                            label=f"Medium Peaks ({len(medium_peaks)})",
-                            markersize=8,
-                        )
-                    if low_peaks:
-                        self.ax1.plot(
-                            time[low_peaks],
-                            filtered_adc1[low_peaks],
-                            "x",
-                            color="orange",
-                            label=f"Low Peaks ({len(low_peaks)})",
-                            markersize=6,
-                        )
-
-            # Plot rejected peaks for ADC1
-            rejected_peaks_adc1 = properties_adc1["rejected_peaks"]
-            if rejected_peaks_adc1 is not None and len(rejected_peaks_adc1) > 0:
-                self.ax1.plot(
-                    time[rejected_peaks_adc1],
-                    filtered_adc1[rejected_peaks_adc1],
-                    "x",
-                    color="blue",
-                    label=f"Rejected ({len(rejected_peaks_adc1)})",
-                    markersize=6,
+    def show_analysis(self, pyramids, results, elapsed, tracer):
+        """Plot the result of an analysis job"""
+        try:
+            with tracer.span("plot"):
+                # Only new data is pushed into the artists of the last analysis
+                full = self.plots.update(
+                    pyramids,
+                    {name: result[2]["result"] for name, result in results.items()},
                 )
 
-            # Plot ADC2
-            self.ax2.plot(
-                time, downsampled_data["adc2"], "g-", alpha=0.3, label="Raw ADC2"
-            )
-            self.ax2.plot(time, filtered_adc2, "g-", label="Filtered ADC2")
-
-            # Plot classified peaks for ADC2
-            if len(peaks_adc2) > 0:
-                classifications = properties_adc2["peak_classifications"]
-                if classifications:  # Check if classifications exist
-                    high_peaks = [
-                        p for p, c in zip(peaks_adc2, classifications) if c == "high"
-                    ]
-                    medium_peaks = [
-                        p for p, c in zip(peaks_adc2, classifications) if c == "medium"
-                    ]
-                    low_peaks = [
-                        p for p, c in zip(peaks_adc2, classifications) if c == "low"
-                    ]
-
-                    if high_peaks:
-                        self.ax2.plot(
-                            time[high_peaks],
-                            filtered_adc2[high_peaks],
-                            "x",
-                            color="red",
-                            label=f"High Peaks ({len(high_peaks)})",
-                            markersize=10,
-                        )
-                    if medium_peaks:
-                        self.ax2.plot(
-                            time[medium_peaks],
-                            filtered_adc2[medium_peaks],
-                            "x",
-                            color="yellow",
-                            label=f"Medium Peaks ({len(medium_peaks)})",
-                            markersize=8,
-                        )
-                    if low_peaks:
-                        self.ax2.plot(
-                            time[low_peaks],
-                            filtered_adc2[low_peaks],
-                            "x",
-                            color="orange",
-                            label=f"Low Peaks ({len(low_peaks)})",
-                            markersize=6,
-                        )
-
-            # Plot rejected peaks for ADC2
-            rejected_peaks_adc2 = properties_adc2["rejected_peaks"]
-            if rejected_peaks_adc2 is not None and len(rejected_peaks_adc2) > 0:
-                self.ax2.plot(
-                    time[rejected_peaks_adc2],
-                    filtered_adc2[rejected_peaks_adc2],
-                    "x",
-                    color="blue",
-                    label=f"Rejected ({len(rejected_peaks_adc2)})",
-                    markersize=6,
-                )
+            # Refresh canvas, drawn right away so the time can be measured
+            with tracer.span("draw", blit=not full):
+                self.plots.draw(full)
+            self.analysis_shown = True
+            self.set_status(f"Analysis done in {elapsed:.2f} s")
 
-            # Set fixed legend location
-            for ax in [self.ax1, self.ax2]:
-                ax.legend(loc="upper right")
-                ax.set_xlabel("Time (s)")
-                ax.set_ylabel("Amplitude")
-                ax.grid(True)
+            self.last_trace = tracer
+            self.update_timings(tracer)
 
-            # Refresh canvas
-            self.fig.tight_layout()
-            self.canvas.draw_idle()
+            # Columns a container decompressed for the analysis now count
+            # against the workspace budget
+            self.workspace.trim()
 
         except Exception as e:
             messagebox.showerror("Error", f"Error updating analysis: {str(e)}")
             raise  # This will help with debugging by showing the full error traceback
+        finally:
+            tracer.close()
 
     def export_peaks(self):
         """Export plotted data with the assumption that all low peaks are water, and anything above is tissue"""
@@ -536,7 +1103,7 @@ class SignalAnalyzer:
             # Get target file location
             save_path = filedialog.asksaveasfilename(
                 defaultextension=".csv",
-                filetypes=[("CSV files", "*.csv")],
+                filetypes=PEAKS_SAVE_TYPES,
                 title="Export Peaks Data",
             )
 
@@ -553,67 +1120,231 @@ class SignalAnalyzer:
             if peak_params is None:
                 return
 
-            # Keep downsample rate
-            downsample_rate = 10
-            downsampled_data = self.data.iloc[::downsample_rate]
-            time = np.arange(len(downsampled_data)) / (
-                self.sample_rate / downsample_rate
+            # Reuses the results of the last analysis with the same settings
+            results = self.run_channel_analysis(
+                self.analysis_graph(self.data, self.recording_id),
+                self.analysis_params(
+                    self.valid_filter_window(window, poly_order),
+                    poly_order,
+                    peak_params,
+                ),
+            )
+            write_peaks_file(
+                save_path,
+                (results["adc1"][2]["result"], results["adc2"][2]["result"]),
             )
 
-            filtered_adc1 = process_signal(downsampled_data["adc1"], window, poly_order)
-            filtered_adc2 = process_signal(downsampled_data["adc2"], window, poly_order)
-
-            peaks_adc1, properties_adc1 = find_signal_peaks(filtered_adc1, peak_params)
-            peaks_adc2, properties_adc2 = find_signal_peaks(filtered_adc2, peak_params)
-
-            # Create list for peak data
-            peaks_data = []
-
-            def get_label(peak_class):  # Helper function to classify found peaks
-                # If peak is low (below medium threshold), label as water
-                # If peak is medium or high, label as tissue
-                return "water" if peak_class == "low" else "tissue"
-
-            # ADC1 peaks
-            if len(peaks_adc1) > 0:
-                for peak_idx, peak_class in zip(
-                    peaks_adc1, properties_adc1["peak_classifications"]
-                ):
-                    peak_time = round(time[peak_idx], 5)  # Round to 5 decimal places
-                    peaks_data.append(
-                        {
-                            "startTime": peak_time,
-                            "endTime": peak_time,
-                            "label": get_label(peak_class),
-                        }
-                    )
+            messagebox.showinfo(
+                "Success", f"Peaks data exported successfully to {save_path}"
+            )
 
-            # ADC2 peaks
-            if len(peaks_adc2) > 0:
-                for peak_idx, peak_class in zip(
-                    peaks_adc2, properties_adc2["peak_classifications"]
-                ):
-                    peak_time = round(time[peak_idx], 5)  # Round to 5 decimal places
-                    peaks_data.append(
-                        {
-                            "startTime": peak_time,
-                            "endTime": peak_time,
-                            "label": get_label(peak_class),
-                        }
-                    )
+        except Exception as e:  # Whoopsie daisies moment
+            messagebox.showerror("Error", f"Error exporting peaks: {str(e)}")
 
-            # Sort by start time
-            import pandas as pd
 
-            peaks_df = pd.DataFrame(peaks_data)
-            peaks_df = peaks_df.sort_values("startTime")
+class SweepDialog:
+    """
+    Window evaluating a grid of filter and detection settings at once.
+
+    Every setting takes a list ("10, 20, 40") or an inclusive range
+    ("10:50:10") of values. The signals are filtered and prepared once per
+    window length and polynomial order and all other settings are evaluated
+    on the same candidate peaks, so hundreds of combinations take about as
+    long as a few analyses. "Apply Selected" moves the sliders to the
+    settings of the selected row.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.table = None  # DataFrame of the last sweep
+        self.sort_column = None
+        self.sort_ascending = True
+
+        self.window = tk.Toplevel(app.root)
+        self.window.title("Parameter Sweep")
+
+        settings_frame = ttk.LabelFrame(self.window, text="Settings to Sweep")
+        settings_frame.pack(fill=tk.X, padx=5, pady=5)
+        self.entries = {}
+        for row, (name, label, value) in enumerate(self.initial_settings()):
+            ttk.Label(settings_frame, text=label).grid(
+                row=row, column=0, sticky=tk.W, padx=5
+            )
+            entry = ttk.Entry(settings_frame, width=40)
+            entry.insert(0, value)
+            entry.grid(row=row, column=1, sticky=tk.W, padx=5, pady=2)
+            self.entries[name] = entry
+
+        button_frame = ttk.Frame(self.window)
+        button_frame.pack(fill=tk.X, padx=5)
+        self.run_button = ttk.Button(button_frame, text="Run Sweep", command=self.run)
+        self.run_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(
+            button_frame, text="Apply Selected", command=self.apply_selected
+        ).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Save CSV", command=self.save_csv).pack(
+            side=tk.LEFT, padx=5
+        )
 
-            # Doublecheck that timestamps are rounded correctly
-            peaks_df.to_csv(save_path, index=False, float_format="%.5f")
+        # Results, sorted by clicking a column heading
+        table_frame = ttk.Frame(self.window)
+        table_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.results = ttk.Treeview(
+            table_frame,
+            columns=[column for column, *_ in SWEEP_TABLE_COLUMNS],
+            show="headings",
+            height=20,
+        )
+        for column, heading, width, _ in SWEEP_TABLE_COLUMNS:
+            self.results.heading(
+                column, text=heading, command=lambda c=column: self.sort_by(c)
+            )
+            self.results.column(column, width=width, anchor=tk.E)
+        scrollbar = ttk.Scrollbar(
+            table_frame, orient=tk.VERTICAL, command=self.results.yview
+        )
+        self.results.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.results.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+    def initial_settings(self):
+        """(name, label, text) of every setting, starting from the sliders"""
+        app = self.app
+        return (
+            ("window_length", "Window Length:", str(int(app.window_length.get()))),
+            ("poly_order", "Polynomial Order:", str(int(app.poly_order.get()))),
+            ("prominence_threshold", "Min Prominence (%):", "5:80:5"),
+            ("amplitude_tolerance", "Amp Tolerance (σ):", "1:10:1"),
+            (
+                "high_threshold",
+                "High Peak Threshold (% of max):",
+                f"{float(app.high_threshold.get()):g}",
+            ),
+            (
+                "medium_threshold",
+                "Medium Peak Threshold (% of max):",
+                f"{float(app.medium_threshold.get()):g}",
+            ),
+        )
 
-            messagebox.showinfo(
-                "Success", f"Peaks data exported successfully to {save_path}"
+    def read_grid(self):
+        """Values of every setting from the entries, raising ValueError if invalid"""
+        grid = {}
+        for name, entry in self.entries.items():
+            dtype = int if name in ("window_length", "poly_order") else float
+            try:
+                grid[name] = parse_values(entry.get(), dtype)
+            except ValueError as e:
+                raise ValueError(f"{name}: {e}")
+
+        # Odd window lengths and thresholds in fractions, as in update_analysis
+        grid["window_length"] = list(
+            dict.fromkeys(window + 1 - window % 2 for window in grid["window_length"])
+        )
+        for name in ("high_threshold", "medium_threshold"):
+            grid[name] = [value / 100 for value in grid[name]]
+        for window, poly_order in itertools.product(
+            grid["window_length"], grid["poly_order"]
+        ):
+            check_filter_params(window, poly_order)
+        return grid
+
+    def run(self):
+        """Start the sweep in the background"""
+        app = self.app
+        if app.data is None:
+            messagebox.showerror("Error", "No data loaded", parent=self.window)
+            return
+        try:
+            grid = self.read_grid()
+        except ValueError as e:
+            messagebox.showerror(
+                "Error", f"Invalid sweep settings: {str(e)}", parent=self.window
             )
+            return
 
-        except Exception as e:  # Whoopsie daisies moment
-            messagebox.showerror("Error", f"Error exporting peaks: {str(e)}")
+        count = 2 * int(np.prod([len(values) for values in grid.values()]))
+        data, recording_id = app.data, app.recording_id
+        auto_period = bool(app.auto_period.get())
+        refine_peaks = bool(app.refine_peaks.get())
+
+        def done(table, error):
+            shown = self.window.winfo_exists()
+            if shown:
+                self.run_button.config(state=tk.NORMAL)
+            if error is not None:
+                app.set_status("Sweep failed")
+                messagebox.showerror("Error", f"Error in parameter sweep: {error}")
+                return
+            app.set_status(f"Swept {count:,} settings")
+            if shown:
+                self.show(table)
+
+        self.run_button.config(state=tk.DISABLED)
+        app.run_in_background(
+            lambda: app.run_sweep(data, recording_id, grid, auto_period, refine_peaks),
+            done,
+            f"Sweeping {count:,} settings...",
+        )
+
+    def show(self, table):
+        """Fill the results table"""
+        self.table = table
+        self.results.delete(*self.results.get_children())
+        for row in table.itertuples():
+            values = []
+            for column, _, _, format_value in SWEEP_TABLE_COLUMNS:
+                value = getattr(row, column)
+                values.append("" if pd.isna(value) else format_value(value))
+            self.results.insert("", tk.END, iid=str(row.Index), values=values)
+
+    def sort_by(self, column):
+        """Sort the results by a column, again to reverse the order"""
+        if self.table is None:
+            return
+        if self.sort_column == column:
+            self.sort_ascending = not self.sort_ascending
+        else:
+            self.sort_column, self.sort_ascending = column, True
+        self.show(
+            self.table.sort_values(column, ascending=self.sort_ascending, kind="stable")
+        )
+
+    def apply_selected(self):
+        """Set the sliders to the settings of the selected row and analyze"""
+        selection = self.results.selection()
+        if not selection:
+            messagebox.showinfo("Info", "Select a row first.", parent=self.window)
+            return
+        row = self.table.loc[int(selection[0])]
+        app = self.app
+        app.window_length.set(int(row["window_length"]))
+        app.poly_order.set(int(row["poly_order"]))
+        app.prominence_threshold.set(row["prominence_threshold"])
+        app.amplitude_tolerance.set(row["amplitude_tolerance"])
+        app.high_threshold.set(row["high_threshold"] * 100)
+        app.medium_threshold.set(row["medium_threshold"] * 100)
+        if app.analysis_shown:
+            app.on_parameter_change()
+        else:
+            app.update_analysis()
+
+    def save_csv(self):
+        """Save the results of the last sweep as CSV"""
+        if self.table is None:
+            messagebox.showinfo("Info", "Run a sweep first.", parent=self.window)
+            return
+        save_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv")],
+            title="Save Sweep Results",
+            parent=self.window,
+        )
+        if not save_path:
+            return
+        try:
+            self.table.to_csv(save_path, index=False)
+        except Exception as e:
+            messagebox.showerror(
+                "Error", f"Error saving sweep results: {str(e)}", parent=self.window
+            )
@@ -0,0 +1,304 @@
+import numpy as np
+from matplotlib.collections import LineCollection
+
+from recording_container import CACHED_BLOCKS
+
+# Samples per bucket of the finest pyramid level
+BASE_BUCKET = 8
+
+# Samples reduced at a time while building a pyramid, bounds temporary memory
+BUILD_CHUNK = 1 << 23
+
+
+class MinMaxPyramid:
+    """
+    Multi-resolution min/max decimation of a signal for plotting.
+
+    Level k stores the minimum and maximum of every bucket of
+    BASE_BUCKET * 2**k samples. Drawing a vertical min-max segment per bucket
+    keeps narrow spikes visible at every zoom level, unlike plain striding.
+    """
+
+    def __init__(self, signal, sample_rate, min_buckets=512):
+        self.signal = signal
+        self.sample_rate = sample_rate
+        self.levels = []  # (bucket size, mins, maxs) from fine to coarse
+
+        mins, maxs = self._reduce(signal, BASE_BUCKET)
+        bucket = BASE_BUCKET
+        self.levels.append((bucket, mins, maxs))
+        while len(mins) > min_buckets:
+            mins, maxs = _pairwise(mins, np.minimum), _pairwise(maxs, np.maximum)
+            bucket *= 2
+            self.levels.append((bucket, mins, maxs))
+
+    def __len__(self):
+        return len(self.signal)
+
+    @property
+    def nbytes(self):
+        """Memory held by the pyramid levels, the signal itself is not copied"""
+        return sum(mins.nbytes + maxs.nbytes for _, mins, maxs in self.levels)
+
+    @staticmethod
+    def _reduce(signal, bucket):
+        """Min and max of every bucket, computed in chunks of the signal"""
+        count = -(-len(signal) // bucket)
+        mins = np.empty(count, dtype=signal.dtype)
+        maxs = np.empty(count, dtype=signal.dtype)
+        chunk = BUILD_CHUNK - BUILD_CHUNK % bucket
+        for start in range(0, len(signal), chunk):
+            block = np.asarray(signal[start : start + chunk])
+            full = len(block) // bucket * bucket
+            first = start // bucket
+            if full:
+                rows = block[:full].reshape(-1, bucket)
+                mins[first : first + len(rows)] = rows.min(axis=1)
+                maxs[first : first + len(rows)] = rows.max(axis=1)
+            if full < len(block):  # Partial bucket at the end of the signal
+                mins[-1], maxs[-1] = block[full:].min(), block[full:].max()
+        return mins, maxs
+
+    def view(self, start_time=None, stop_time=None, pixels=1000):
+        """
+        Polyline for the time range [start_time, stop_time] at the given width.
+
+        Returns raw samples when the range is narrow enough, otherwise the
+        coarsest level that still has at least one bucket per pixel.
+        """
+        length = len(self.signal)
+        first = 0 if start_time is None else int(start_time * self.sample_rate)
+        last = length if stop_time is None else int(stop_time * self.sample_rate) + 1
+        first, last = max(first, 0), min(last, length)
+        if last <= first:
+            return np.zeros(0), np.zeros(0)
+
+        samples_per_pixel = (last - first) / max(pixels, 1)
+        if samples_per_pixel < BASE_BUCKET:
+            index = np.arange(max(first - 1, 0), min(last + 1, length))
+            return index / self.sample_rate, np.asarray(
+                self.signal[index[0] : index[-1] + 1]
+            )
+
+        bucket, mins, maxs = self.levels[0]
+        for level in self.levels[1:]:
+            if level[0] > samples_per_pixel:
+                break
+            bucket, mins, maxs = level
+
+        # One extra bucket on either side keeps the line continuous at the edges
+        lo = max(first // bucket - 1, 0)
+        hi = min(-(-last // bucket) + 1, len(mins))
+        times = np.repeat(np.arange(lo, hi) * bucket / self.sample_rate, 2)
+        values = np.column_stack((mins[lo:hi], maxs[lo:hi])).ravel()
+        return times, values
+
+
+class EventTrain:
+    """
+    Sorted events of one height drawn as spikes on a zero baseline, for plotting.
+
+    Every event is a vertical segment from zero to the height, a segment
+    along zero joins the first and last event. When more events are visible
+    than there are pixels, only the first event of every pixel column is
+    kept: the others would be drawn on the same spot, as all spikes are
+    equally high.
+    """
+
+    def __init__(self, times, height):
+        self.times = np.asarray(times, dtype=np.float64)  # Sorted
+        self.height = height
+
+    def __len__(self):
+        return len(self.times)
+
+    def events(self, start_time=None, stop_time=None, pixels=1000):
+        """
+        Times of the events to draw for the time range at the given width.
+
+        One event beyond either end of the range is included, so the
+        baseline reaches the edges of the view.
+        """
+        times = self.times
+        first = 0 if start_time is None else np.searchsorted(times, start_time)
+        last = len(times) if stop_time is None else np.searchsorted(times, stop_time)
+        first, last = max(first - 1, 0), min(last + 1, len(times))
+        visible = times[first:last]
+        if len(visible) <= pixels:
+            return visible
+
+        start = visible[0] if start_time is None else start_time
+        stop = visible[-1] if stop_time is None else stop_time
+        width = max(stop - start, np.finfo(np.float64).tiny) / max(pixels, 1)
+        column = np.floor((visible - start) / width)
+        keep = np.ones(len(visible), dtype=bool)
+        keep[1:] = column[1:] != column[:-1]
+        return visible[keep]
+
+    def segments(self, times):
+        """
+        Line segments of the spikes at the given event times and their baseline.
+
+        Equal to the polyline through (t0, h), (t0, 0), (t1, 0), (t1, h), ...
+        but Agg draws separate segments much faster than one path that
+        doubles back on itself at every spike.
+        """
+        segments = np.zeros((len(times) + 1, 2, 2))
+        segments[:-1, :, 0] = times[:, None]
+        segments[:-1, 1, 1] = self.height
+        if len(times):
+            segments[-1, :, 0] = times[0], times[-1]
+        return segments
+
+
+class BlockPyramid:
+    """
+    Plot view of a channel of a recording container, read on demand.
+
+    Drop-in for MinMaxPyramid that never holds the whole channel. Ranges
+    spanning more blocks than the reader caches, such as the overview right
+    after opening a recording, are drawn from the min and max the container
+    stores for every block without decompressing any samples; narrower
+    ones from only the rows in view.
+
+    Args:
+        reader: ContainerReader of the recording
+        channel: channel name or number
+        sample_rate: samples per second of the time axis
+    """
+
+    def __init__(self, reader, channel, sample_rate):
+        self.reader = reader
+        self.column = reader.channel_index(channel)
+        self.sample_rate = sample_rate
+
+    def __len__(self):
+        return len(self.reader)
+
+    @property
+    def nbytes(self):
+        """The block statistics belong to the reader, nothing is held here"""
+        return 0
+
+    def view(self, start_time=None, stop_time=None, pixels=1000):
+        """Polyline for the time range [start_time, stop_time], see MinMaxPyramid.view"""
+        length = len(self.reader)
+        first = 0 if start_time is None else int(start_time * self.sample_rate)
+        last = length if stop_time is None else int(stop_time * self.sample_rate) + 1
+        first, last = max(first, 0), min(last, length)
+        if last <= first:
+            return np.zeros(0), np.zeros(0)
+
+        block = self.reader.block_size
+        first_block, last_block = first // block, -(-last // block)
+        if last_block - first_block > CACHED_BLOCKS:
+            # One extra block on either side keeps the line continuous
+            lo = max(first_block - 1, 0)
+            hi = min(last_block + 1, self.reader.blocks)
+            times, mins, maxs = self.reader.overview(self.column)
+            times = times[lo:hi] * (self.reader.sample_rate / self.sample_rate)
+            values = np.column_stack((mins[lo:hi], maxs[lo:hi])).ravel()
+            return np.repeat(times, 2), values
+
+        lo, hi = max(first - 1, 0), min(last + 1, length)
+        rows = self.reader.read(lo, hi, columns=self.column)
+        times, values = MinMaxPyramid(rows, self.sample_rate, pixels).view(
+            pixels=pixels
+        )
+        return times + lo / self.sample_rate, values
+
+
+def _pairwise(values, reduce):
+    """Combine neighbouring buckets, keeping an odd last bucket as is"""
+    paired = reduce(values[0 : len(values) - 1 : 2], values[1::2])
+    if len(values) % 2:
+        paired = np.append(paired, values[-1])
+    return paired
+
+
+class ViewportLines:
+    """
+    Lines of an axis that are redrawn from their pyramid on zoom and pan.
+
+    The data of every line is pulled from the pyramid level matching the pixel
+    width of the visible x-range whenever the x-limits change, so redraws
+    stay fast regardless of the length of the recording. Event trains (see
+    plot_events) are culled to the visible range the same way. Create a new
+    instance after clearing the axis, and keep a reference to it as axes
+    only hold weak references to their callbacks.
+    """
+
+    def __init__(self, ax):
+        self.ax = ax
+        self.lines = []
+        self.events = []
+        ax.callbacks.connect("xlim_changed", self.update)
+
+    def pixels(self):
+        return max(int(self.ax.get_window_extent().width), 1)
+
+    def plot(self, pyramid, *args, **kwargs):
+        """Plot the whole pyramid as a line that follows the viewport"""
+        (line,) = self.ax.plot(*pyramid.view(pixels=self.pixels()), *args, **kwargs)
+        self.lines.append((line, pyramid))
+        return line
+
+    def set_pyramid(self, line, pyramid, whole=False):
+        """
+        Make an existing line of the axis follow the viewport through pyramid.
+
+        The line shows the visible x-range, or the whole pyramid if whole is
+        set (e.g. before the axis is autoscaled to it).
+
+        Returns:
+            False if the line already showed this pyramid
+        """
+        for position, (other, shown) in enumerate(self.lines):
+            if other is line:
+                if shown is pyramid:
+                    return False
+                self.lines[position] = (line, pyramid)
+                break
+        else:
+            self.lines.append((line, pyramid))
+
+        if whole:
+            line.set_data(*pyramid.view(pixels=self.pixels()))
+        else:
+            start_time, stop_time = self.ax.get_xlim()
+            line.set_data(*pyramid.view(start_time, stop_time, self.pixels()))
+        return True
+
+    def plot_events(self, train, color, marker, label=None, **kwargs):
+        """
+        Plot an EventTrain as spikes with a marker on every spike.
+
+        The spikes are a single LineCollection, the markers a line without
+        connecting segments; both are culled to the viewport.
+
+        Returns:
+            (collection, markers)
+        """
+        times = train.events(pixels=self.pixels())
+        collection = LineCollection(train.segments(times), colors=color, **kwargs)
+        self.ax.add_collection(collection)
+        (markers,) = self.ax.plot(
+            times,
+            np.full(len(times), train.height),
+            linestyle="none",
+            color=color,
+            marker=marker,
+            label=label,
+        )
+        self.events.append((collection, markers, train))
+        return collection, markers
+
+    def update(self, _ax=None):
+        start_time, stop_time = self.ax.get_xlim()
+        pixels = self.pixels()
+        for line, pyramid in self.lines:
+            line.set_data(*pyramid.view(start_time, stop_time, pixels))
+        for collection, markers, train in self.events:
+            times = train.events(start_time, stop_time, pixels)
+            collection.set_segments(train.segments(times))
+            markers.set_data(times, np.full(len(times), train.height))
@@ -0,0 +1,385 @@
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from filter_engine import savgol
+from signal_processing import detection_stages
+from tracing import NULL_TRACER, Tracer
+
+# Below this many samples (all channels together) the pool overhead outweighs
+# the gain and the analysis runs in the calling process
+PARALLEL_MIN_SAMPLES = 2_000_000
+
+# Samples per filtering task
+SEGMENT_LENGTH = 1_000_000
+
+# Seconds between checks of the cancel event while waiting for workers
+CANCEL_POLL_INTERVAL = 0.05
+
+# Workers are not forked: the GUI starts the pool from its analysis thread
+# while Tk runs, and a forked child could inherit locks held by other threads
+POOL_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+_pool = None
+_pool_workers = None
+
+
+class AnalysisCancelled(Exception):
+    """Raised when an analysis is cancelled through its cancel event"""
+
+
+def check_cancelled(cancel):
+    """Raise AnalysisCancelled if the (optional) cancel event is set"""
+    if cancel is not None and cancel.is_set():
+        raise AnalysisCancelled()
+
+
+def _wait(futures, cancel):
+    """Wait for futures, cancelling the pending ones if the cancel event is set"""
+    pending = set(futures)
+    while pending:
+        done, pending = wait(
+            pending, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_EXCEPTION
+        )
+        for future in done:
+            future.result()  # Propagate errors
+        if cancel is not None and cancel.is_set():
+            for future in pending:
+                future.cancel()
+            raise AnalysisCancelled()
+
+
+def get_pool(max_workers=None):
+    """Shared process pool, created on first use and reused between analyses"""
+    global _pool, _pool_workers
+    max_workers = max_workers or os.cpu_count() or 1
+    if _pool is None or _pool_workers != max_workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context(POOL_START_METHOD),
+        )
+        _pool_workers = max_workers
+    return _pool
+
+
+def _filtered_dtype(dtype):
+    """Output dtype of savgol (and savgol_filter) for an input dtype"""
+    return dtype if dtype in (np.float32, np.float64) else np.dtype(np.float64)
+
+
+def _share(array):
+    """Copy an array into a new shared memory block"""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=shm.buf)[:] = array
+    return shm
+
+
+def _attach(name):
+    """Attach to a shared memory block owned by the parent process"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    # Older versions register the block again on attach, which is harmless as
+    # pool workers share the resource tracker of the parent
+    return shared_memory.SharedMemory(name=name)
+
+
+def _filter_segment(
+    source, target, length, dtype, start, stop, window_length, poly_order
+):
+    """Filter samples [start, stop) of a shared signal into a shared output"""
+    shm_in, shm_out = _attach(source), _attach(target)
+    try:
+        signal = np.ndarray((length,), dtype, buffer=shm_in.buf)
+        filtered = np.ndarray((length,), _filtered_dtype(dtype), buffer=shm_out.buf)
+
+        # Half a window of context on both sides makes the segment boundaries exact
+        half = window_length // 2
+        lo, hi = max(start - half, 0), min(stop + half, length)
+        segment = savgol(signal[lo:hi], window_length, poly_order)
+        filtered[start:stop] = segment[start - lo : stop - lo]
+        del signal, filtered
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+
+def _detect_stages(source, target, length, dtype, params, trace_allocations=None):
+    """
+    Run the detection stages on a shared filtered signal.
+
+    The normalized signal of the prepare stage is written straight into the
+    shared target block instead of being returned. Stages are traced if
+    trace_allocations is not None, the spans are returned as dicts for
+    Tracer.merge in the parent process.
+    """
+    tracer = NULL_TRACER if trace_allocations is None else Tracer(trace_allocations)
+    shm_in, shm_out = _attach(source), _attach(target)
+    try:
+        signal = np.ndarray((length,), dtype, buffer=shm_in.buf)
+        normalized = np.ndarray((length,), _filtered_dtype(dtype), buffer=shm_out.buf)
+        stages = detection_stages(signal, params, tracer=tracer, out=normalized)
+        stages["prepare"] = (normalized.dtype, stages["prepare"][1])
+        del signal, normalized
+        spans = [span.to_dict() for span in tracer.spans]
+        return stages, spans
+    finally:
+        shm_in.close()
+        shm_out.close()
+        tracer.close()
+
+
+def _segments(length, window_length, segment_length):
+    """Split a signal into segments no shorter than the filter window"""
+    segment_length = max(segment_length, 2 * window_length)
+    starts = list(range(0, length, segment_length))
+    if len(starts) > 1 and length - starts[-1] < window_length:
+        starts.pop()  # Merge a too short tail into the previous segment
+    stops = starts[1:] + [length]
+    return list(zip(starts, stops))
+
+
+def _filter_shared(
+    pool, channels, window_length, poly_order, segment_length, cancel, blocks
+):
+    """
+    Filter all segments of all channels on the pool into shared memory.
+
+    Returns dict of channel name -> (shared memory block, dtype) of the
+    filtered signal, the created blocks are appended to blocks for the
+    caller to release.
+    """
+    filtered = {}
+    futures = []
+    for name, signal in channels.items():
+        source = _share(signal)
+        blocks.append(source)
+        if window_length is None:
+            filtered[name] = (source, signal.dtype)
+            continue
+
+        dtype = _filtered_dtype(signal.dtype)
+        target = shared_memory.SharedMemory(
+            create=True, size=max(len(signal) * dtype.itemsize, 1)
+        )
+        blocks.append(target)
+        filtered[name] = (target, dtype)
+        for start, stop in _segments(len(signal), window_length, segment_length):
+            futures.append(
+                pool.submit(
+                    _filter_segment,
+                    source.name,
+                    target.name,
+                    len(signal),
+                    signal.dtype,
+                    start,
+                    stop,
+                    window_length,
+                    poly_order,
+                )
+            )
+    _wait(futures, cancel)
+    return filtered
+
+
+def filter_channels(
+    channels,
+    window_length,
+    poly_order,
+    max_workers=None,
+    segment_length=SEGMENT_LENGTH,
+    cancel=None,
+    tracer=None,
+):
+    """
+    Savitzky-Golay filter several channels, in parallel for long signals.
+
+    Uses the same segmenting and shared memory as analyze_channels, the
+    results are identical to filter_engine.savgol on each channel.
+
+    Args:
+        channels: dict of channel name -> 1-D signal
+        window_length, poly_order: Savitzky-Golay parameters, or None for the
+            window length to return copies of the signals
+        cancel, tracer: as in analyze_channels
+
+    Returns:
+        dict of channel name -> filtered signal
+    """
+    tracer = tracer or NULL_TRACER
+    channels = {name: np.asarray(signal) for name, signal in channels.items()}
+    total_samples = sum(len(signal) for signal in channels.values())
+
+    serial = max_workers == 1 or total_samples < PARALLEL_MIN_SAMPLES
+    if serial or window_length is None:
+        results = {}
+        for name, signal in channels.items():
+            check_cancelled(cancel)
+            with tracer.span("filter", channel=name, samples=len(signal)):
+                if window_length is None:
+                    results[name] = np.array(signal)
+                else:
+                    results[name] = savgol(signal, window_length, poly_order)
+        return results
+
+    blocks = []
+    try:
+        with tracer.span("filter", channels=len(channels), samples=total_samples):
+            filtered = _filter_shared(
+                get_pool(max_workers),
+                channels,
+                window_length,
+                poly_order,
+                segment_length,
+                cancel,
+                blocks,
+            )
+            return {
+                name: np.ndarray((len(channels[name]),), dtype, buffer=shm.buf).copy()
+                for name, (shm, dtype) in filtered.items()
+            }
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def detect_stages(
+    channels, params, time=None, max_workers=None, cancel=None, tracer=None
+):
+    """
+    Run the peak detection stages of several channels in parallel.
+
+    Each channel is detected on its own worker process, reading the signal
+    from shared memory and writing its normalized signal back to shared
+    memory, so no signal is pickled. The results are identical to
+    signal_processing.detection_stages on each channel.
+
+    Args:
+        channels: dict of channel name -> filtered 1-D signal
+        params: peak detection parameters (see SignalAnalyzer.get_peak_params)
+        time: optional time vector used for the time column of the results
+        max_workers, cancel, tracer: as in analyze_channels
+
+    Returns:
+        dict of channel name -> dict of stage name -> value, see
+        signal_processing.DETECTION_STAGES
+    """
+    tracer = tracer or NULL_TRACER
+    channels = {name: np.asarray(signal) for name, signal in channels.items()}
+    total_samples = sum(len(signal) for signal in channels.values())
+
+    if max_workers == 1 or total_samples < PARALLEL_MIN_SAMPLES:
+        results = {}
+        for name, signal in channels.items():
+            check_cancelled(cancel)
+            with tracer.span("detect", channel=name, samples=len(signal)):
+                results[name] = detection_stages(signal, params, time, tracer)
+        return results
+
+    pool = get_pool(max_workers)
+    trace_allocations = None if tracer is NULL_TRACER else tracer.trace_allocations
+    blocks = []
+    try:
+        with tracer.span("detect", channels=len(channels), samples=total_samples):
+            futures = {}
+            targets = {}
+            for name, signal in channels.items():
+                source = _share(signal)
+                blocks.append(source)
+                target = shared_memory.SharedMemory(
+                    create=True, size=max(len(signal) * 8, 1)  # float64 at most
+                )
+                blocks.append(target)
+                targets[name] = target
+                futures[name] = pool.submit(
+                    _detect_stages,
+                    source.name,
+                    target.name,
+                    len(signal),
+                    signal.dtype,
+                    params,
+                    trace_allocations,
+                )
+            _wait(futures.values(), cancel)
+
+            # Merge in the order of the input channels
+            results = {}
+            for name, future in futures.items():
+                stages, spans = future.result()
+                tracer.merge(spans)
+                dtype, statistics = stages["prepare"]
+                normalized = np.ndarray(
+                    (len(channels[name]),), dtype, buffer=targets[name].buf
+                )
+                stages["prepare"] = (normalized.copy(), statistics)
+                if time is not None:
+                    result = stages["classified_peaks"][1]["result"]
+                    result.table["time"] = np.asarray(time)[result.index]
+                results[name] = stages
+        return results
+
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def analyze_channels(
+    channels,
+    window_length,
+    poly_order,
+    params,
+    time=None,
+    max_workers=None,
+    segment_length=SEGMENT_LENGTH,
+    cancel=None,
+    tracer=None,
+):
+    """
+    Filter and detect peaks on several channels in parallel.
+
+    Filtering is split into time segments of every channel, dispatched to a
+    process pool and written into shared memory, so signals are never pickled.
+    Peak detection then runs per channel on the pool, see detect_stages. The
+    results are identical to filtering and detecting each channel serially.
+
+    Args:
+        channels: dict of channel name -> 1-D signal
+        window_length, poly_order: Savitzky-Golay parameters, or None for the
+            window length to skip filtering
+        params: peak detection parameters (see SignalAnalyzer.get_peak_params)
+        time: optional time vector used for the time column of the results
+        max_workers: pool size, defaults to the number of CPUs
+        segment_length: samples per filtering task
+        cancel: optional threading.Event, when set the analysis stops with
+            AnalysisCancelled and pending tasks are dropped from the pool
+        tracer: optional tracing.Tracer timing the filtering and detection
+            stages, including those run in the worker processes
+
+    Returns:
+        dict of channel name -> (filtered signal, peaks, properties), in the
+        order of the input channels
+    """
+    filtered = filter_channels(
+        channels,
+        window_length,
+        poly_order,
+        max_workers,
+        segment_length,
+        cancel,
+        tracer,
+    )
+    stages = detect_stages(filtered, params, time, max_workers, cancel, tracer)
+    return {
+        name: (signal,) + stages[name]["classified_peaks"]
+        for name, signal in filtered.items()
+    }
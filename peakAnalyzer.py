@@ -1,12 +1,120 @@
 import numpy as np
-from scipy.signal import savgol_filter, find_peaks
+from scipy.signal import find_peaks
+import rolling_stats
+from filter_engine import savgol
+from periodicity import estimate_period
+from quantiles import OrderStatistics, QuantileSketch
+from tracing import NULL_TRACER
+
+# Classification codes stored in the class_code column of PeakResult
+PEAK_LOW = 0
+PEAK_MEDIUM = 1
+PEAK_HIGH = 2
+PEAK_CLASS_NAMES = ("low", "medium", "high")
+
+# Percentiles of the smoothed signal the detection thresholds are derived from:
+# baseline (20), noise floor (25, 50, 75) and signal range (1, 99)
+THRESHOLD_PERCENTILES = (1, 20, 25, 50, 75, 99)
+
+# Estimated periods with a lower autocorrelation are ignored by auto_period
+MIN_PERIOD_CONFIDENCE = 0.2
+
+PEAK_DTYPE = np.dtype(
+    [
+        ("index", np.int64),
+        ("time", np.float64),
+        ("amplitude", np.float64),
+        ("class_code", np.uint8),
+        ("accepted", np.bool_),
+    ]
+)
+
+
+class PeakResult:
+    """
+    Columnar table of detected peaks, sorted by sample index.
+
+    Every candidate peak, accepted or rejected, is one row of a numpy structured
+    array holding its sample index, time, amplitude (value of the analyzed
+    signal), classification code (PEAK_LOW/PEAK_MEDIUM/PEAK_HIGH) and an
+    accepted flag. Consumers select peaks with boolean masks instead of
+    building per-peak Python objects.
+    """
+
+    __slots__ = ("table",)
+
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0, dtype=PEAK_DTYPE))
+
+    @classmethod
+    def from_columns(cls, index, time, amplitude, class_code, accepted):
+        table = np.empty(len(index), dtype=PEAK_DTYPE)
+        table["index"] = index
+        table["time"] = time
+        table["amplitude"] = amplitude
+        table["class_code"] = class_code
+        table["accepted"] = accepted
+        return cls(table)
+
+    @classmethod
+    def concatenate(cls, results):
+        """Join results of consecutive chunks into one table"""
+        tables = [result.table for result in results]
+        if not tables:
+            return cls.empty()
+        return cls(np.concatenate(tables))
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def index(self):
+        return self.table["index"]
+
+    @property
+    def time(self):
+        return self.table["time"]
+
+    @property
+    def amplitude(self):
+        return self.table["amplitude"]
+
+    @property
+    def class_code(self):
+        return self.table["class_code"]
+
+    @property
+    def accepted(self):
+        return self.table["accepted"]
+
+    def class_mask(self, code):
+        """Mask of the accepted peaks with the given classification code"""
+        return self.accepted & (self.class_code == code)
 
 
 class PeakDetector:
-    def __init__(self, sample_rate=50000, target_frequency=2):
+    """
+    Peak detection and classification for the ADC signals.
+
+    The minimum distance between peaks is half the expected period, which is
+    sample_rate / target_frequency. With auto_period the period is instead
+    estimated from every analyzed signal (see estimate_period), falling back
+    to target_frequency when the signal shows no clear repetition.
+    """
+
+    def __init__(
+        self, sample_rate=50000, target_frequency=2, tracer=None, auto_period=False
+    ):
         self.sample_rate = sample_rate
         self.target_frequency = target_frequency
         self.expected_period = int(sample_rate / target_frequency)
+        self.auto_period = auto_period
+        self.period_estimate = None  # PeriodEstimate of the last analyzed signal
+        self.tracer = tracer or NULL_TRACER  # Times the stages, see tracing.Tracer
 
     def detect_peaks(
         self,
@@ -15,35 +123,246 @@ class PeakDetector:
         amplitude_tolerance=4.0,
         high_threshold=0.3,
         medium_threshold=0.09,
+        time=None,
     ):
         """
         Enhanced peak detection algorithm with peak classification based on amplitude thresholds.
-        """
-        normalized = self._prepare_signal(signal)
-        signal_median = np.median(normalized)
-        signal_iqr = np.percentile(normalized, 75) - np.percentile(normalized, 25)
-        noise_floor = signal_median + signal_iqr * 0.5
 
-        peaks = self._find_initial_peaks(normalized, min_prominence_pct, noise_floor)
-        peaks, rejected_peaks = self._filter_peaks(
+        The time vector of the signal is optional and only used for the time
+        column of the returned PeakResult (properties["result"]). Without it
+        times are derived from the sample rate.
+
+        Runs the stages prepare -> candidate_peaks -> filter_candidates ->
+        classify, which can also be called one by one to keep intermediate
+        results, e.g. so that a change of the classification thresholds only
+        repeats classify.
+        """
+        normalized, statistics = self.prepare(signal)
+        peaks = self.candidate_peaks(normalized, statistics, min_prominence_pct)
+        peaks, rejected_peaks = self.filter_candidates(
             normalized, peaks, amplitude_tolerance
         )
+        peaks, properties = self.classify(
+            signal,
+            normalized,
+            peaks,
+            rejected_peaks,
+            high_threshold,
+            medium_threshold,
+            time,
+        )
+        properties.update(self.period_properties())
+        return peaks, properties
+
+    def candidate_peaks(self, normalized, statistics, min_prominence_pct=0.1):
+        """
+        Peaks of the normalized signal above the dynamic prominence threshold.
+
+        Args:
+            normalized, statistics: the result of prepare
+            min_prominence_pct: prominence threshold in percent of the signal range
+        """
+        tracer = self.tracer
+        if self.auto_period:
+            with tracer.span("period", samples=len(normalized)) as span:
+                estimate = self.estimate_period(normalized)
+                span.info["period"] = self.expected_period
+                span.info["confidence"] = round(estimate.confidence, 3)
+
+        with tracer.span("noise_floor", samples=len(normalized)):
+            noise_floor = self._noise_floor(statistics)
+
+        with tracer.span("find_peaks", samples=len(normalized)) as span:
+            peaks = self._find_initial_peaks(
+                normalized, min_prominence_pct, noise_floor, statistics
+            )
+            span.info["peaks"] = len(peaks)
+        return peaks
+
+    def filter_candidates(self, normalized, peaks, amplitude_tolerance=4.0):
+        """Split candidate peaks into (accepted, rejected) by the amplitude filter"""
+        with self.tracer.span("filter_peaks", peaks=len(peaks)) as span:
+            peaks, rejected_peaks = self._filter_peaks(
+                normalized, peaks, amplitude_tolerance
+            )
+            span.info["rejected"] = len(rejected_peaks)
+        return peaks, rejected_peaks
+
+    def classify(
+        self,
+        signal,
+        normalized,
+        peaks,
+        rejected_peaks,
+        high_threshold=0.3,
+        medium_threshold=0.09,
+        time=None,
+    ):
+        """
+        Classify the accepted peaks and collect the detection properties.
 
+        Returns:
+            accepted peaks and the properties dict of detect_peaks, without the
+            period_properties
+        """
+        tracer = self.tracer
         # Classify peaks by amplitude
-        peak_classifications = self._classify_peaks(
-            normalized, peaks, high_threshold, medium_threshold
+        with tracer.span("classify", peaks=len(peaks)):
+            peak_classifications = self._classify_peaks(
+                normalized, peaks, high_threshold, medium_threshold
+            )
+
+        with tracer.span("properties", peaks=len(peaks) + len(rejected_peaks)):
+            properties = self._calculate_properties(signal, peaks)
+            properties["rejected_peaks"] = rejected_peaks
+            properties["peak_classifications"] = peak_classifications
+            properties["result"] = self._build_result(
+                signal, peaks, rejected_peaks, peak_classifications, time
+            )
+        return peaks, properties
+
+    def period_properties(self):
+        """Expected period and estimate confidence of the last auto_period estimate"""
+        if self.period_estimate is None:
+            return {}
+        return {
+            "expected_period": self.expected_period,
+            "period_confidence": self.period_estimate.confidence,
+        }
+
+    def detect_peaks_chunked(
+        self,
+        blocks,
+        min_prominence_pct=0.1,
+        amplitude_tolerance=4.0,
+        high_threshold=0.3,
+        medium_threshold=0.09,
+        warmup_samples=None,
+        context_periods=4,
+    ):
+        """
+        Detect peaks in a recording delivered as an iterator of 1-D blocks.
+
+        Blocks can have any length. A PeakResult is yielded as soon as the peaks
+        of a part of the recording are final, so memory stays flat regardless
+        of the length of the recording. The Savitzky-Golay edge context, the
+        find_peaks distance/prominence context and the rolling amplitude window
+        of _filter_peaks are carried across block boundaries.
+
+        Differences to detect_peaks on the whole signal (the tolerance):
+        - The filter window, baseline, noise floor and prominence threshold
+          are derived from the first warmup_samples samples (default 100
+          expected periods) instead of the whole signal. With thresholds
+          equal to the whole-signal ones (e.g. a warm-up covering the whole
+          recording) the detected peaks are identical, whatever the block
+          size. Otherwise only peaks whose prominence lies within the
+          estimation error of the threshold can differ.
+          With auto_period the period is also estimated from the warm-up.
+        - Prominences only see context_periods expected periods on either side
+          of a peak, so they can be slightly lower than in a whole-signal run
+          when the nearest deeper valley is further away than that.
+        - The 99th percentile of peak amplitudes in _filter_peaks and the
+          maximum amplitude used for classification are running values over
+          the peaks seen so far, the percentile is estimated by a
+          QuantileSketch once there are more than its capacity. Class codes
+          can therefore differ for early peaks if the largest peaks arrive
+          late; reclassify the concatenated result with _classify_peaks when
+          exact classes are needed.
+        """
+        if warmup_samples is None:
+            warmup_samples = 100 * self.expected_period
+        blocks = iter(blocks)
+
+        # Collect the warm-up part used to derive the detection thresholds
+        warmup = []
+        collected = 0
+        for block in blocks:
+            warmup.append(np.asarray(block))
+            collected += len(warmup[-1])
+            if collected >= warmup_samples:
+                break
+        if collected == 0:
+            return
+        head = np.concatenate(warmup)
+
+        window_length = self._smoothing_window(head)
+        smoothed = savgol(head, window_length, 2)
+        statistics = OrderStatistics(smoothed, THRESHOLD_PERCENTILES)
+        baseline = statistics.percentile(20)
+        normalized = smoothed - baseline
+        statistics = statistics.shifted(baseline)
+        min_prominence = self._min_prominence(
+            normalized, min_prominence_pct, self._noise_floor(statistics), statistics
         )
+        if self.auto_period:
+            self.estimate_period(normalized)
+        del smoothed, normalized
 
-        properties = self._calculate_properties(signal, peaks)
-        properties["rejected_peaks"] = rejected_peaks
-        properties["peak_classifications"] = peak_classifications
+        context = max(int(self.expected_period * context_periods), 1)
+        smoother = StreamingSavgol(window_length, 2)
+        finder = _ChunkPeakFinder(min_prominence, self._peak_distance(), context)
+        peak_filter = _ChunkPeakFilter(amplitude_tolerance)
+        max_amplitude = None
 
-        return peaks, properties
+        def process(block, final):
+            nonlocal max_amplitude
+            smoothed, raw = smoother.push(block, final)
+            index, amplitudes, raw_amplitudes = finder.push(
+                smoothed - baseline, raw, final
+            )
+            index, amplitudes, raw_amplitudes, accepted = peak_filter.push(
+                index, amplitudes, raw_amplitudes, final
+            )
+            if len(index) == 0:
+                return None
+
+            # Classify against the largest accepted peak seen so far
+            codes = np.full(len(index), PEAK_LOW, dtype=np.uint8)
+            if accepted.any():
+                batch_max = np.max(amplitudes[accepted])
+                if max_amplitude is None or batch_max > max_amplitude:
+                    max_amplitude = batch_max
+            if max_amplitude is not None:
+                relative = amplitudes / max_amplitude
+                codes[relative >= medium_threshold] = PEAK_MEDIUM
+                codes[relative >= high_threshold] = PEAK_HIGH
+                codes[~accepted] = PEAK_LOW
+
+            return PeakResult.from_columns(
+                index, index / self.sample_rate, raw_amplitudes, codes, accepted
+            )
+
+        pending = head
+        for block in blocks:
+            result = process(pending, final=False)
+            if result is not None:
+                yield result
+            pending = np.asarray(block)
+
+        result = process(pending, final=True)
+        if result is not None:
+            yield result
+
+    def estimate_period(self, signal):
+        """
+        Estimate the peak period of a normalized signal and use it as expected_period.
+
+        The estimate is kept in period_estimate. If its confidence is below
+        MIN_PERIOD_CONFIDENCE the period of target_frequency is used instead.
+        """
+        estimate = estimate_period(signal, min_period=2)
+        self.period_estimate = estimate
+        if estimate.period is not None and estimate.confidence >= MIN_PERIOD_CONFIDENCE:
+            self.expected_period = int(round(estimate.period))
+        else:
+            self.expected_period = int(self.sample_rate / self.target_frequency)
+        return estimate
 
     def _classify_peaks(self, signal, peaks, high_threshold, medium_threshold):
-        """Classify peaks based on amplitude thresholds"""
+        """Classify peaks based on amplitude thresholds, returns PEAK_* codes"""
+        codes = np.full(len(peaks), PEAK_LOW, dtype=np.uint8)
         if len(peaks) == 0:
-            return []
+            return codes
 
         peak_amplitudes = signal[peaks]
         max_amplitude = np.max(peak_amplitudes)
@@ -51,19 +370,30 @@ class PeakDetector:
         # Normalize amplitudes relative to maximum
         normalized_amplitudes = peak_amplitudes / max_amplitude
 
-        classifications = []
-        for amp in normalized_amplitudes:
-            if amp >= high_threshold:
-                classifications.append("high")
-            elif amp >= medium_threshold:
-                classifications.append("medium")
-            else:
-                classifications.append("low")
+        codes[normalized_amplitudes >= medium_threshold] = PEAK_MEDIUM
+        codes[normalized_amplitudes >= high_threshold] = PEAK_HIGH
+        return codes
 
-        return classifications
+    def _build_result(self, signal, peaks, rejected_peaks, class_codes, time=None):
+        """Merge accepted and rejected peaks into one PeakResult sorted by index"""
+        index = np.concatenate((peaks, rejected_peaks)).astype(np.int64)
+        accepted = np.arange(len(index)) < len(peaks)
+        codes = np.concatenate(
+            (class_codes, np.full(len(rejected_peaks), PEAK_LOW, dtype=np.uint8))
+        )
 
-    def _prepare_signal(self, signal):
-        """Prepare signal with improved baseline correction"""
+        order = np.argsort(index, kind="stable")
+        index = index[order]
+        times = (
+            np.asarray(time)[index] if time is not None else index / self.sample_rate
+        )
+
+        return PeakResult.from_columns(
+            index, times, np.asarray(signal)[index], codes[order], accepted[order]
+        )
+
+    def _smoothing_window(self, signal):
+        """Savitzky-Golay window length adapted to the noise level of the signal"""
         # Calculate noise level for adaptive window size
         noise_level = np.std(np.diff(signal))
 
@@ -72,68 +402,98 @@ class PeakDetector:
         window_length = min(base_window + int(noise_level * 10), len(signal) // 10)
         if window_length % 2 == 0:
             window_length += 1
+        return window_length
+
+    def _prepare_signal(self, signal):
+        """Prepare signal with improved baseline correction"""
+        return self.prepare(signal)[0]
+
+    def prepare(self, signal, out=None):
+        """
+        Smoothed, baseline corrected signal and its threshold percentiles.
+
+        Args:
+            out: optional array for the normalized signal, of the length of
+                signal and the float dtype of savgol_filter's result
 
-        # Apply Savitzky-Golay filter
-        smoothed = savgol_filter(signal, window_length, 2)
+        Returns:
+            normalized signal and the OrderStatistics of it holding the
+            THRESHOLD_PERCENTILES, selected in a single pass
+        """
+        with self.tracer.span("savgol", samples=len(signal)) as span:
+            window_length = self._smoothing_window(signal)
+            span.info["window_length"] = window_length
+
+            # Apply Savitzky-Golay filter
+            smoothed = savgol(signal, window_length, 2, out)
+
+        # Enhanced baseline correction, in place on the new smoothed array
+        with self.tracer.span("baseline", samples=len(smoothed)):
+            statistics = OrderStatistics(smoothed, THRESHOLD_PERCENTILES)
+            baseline = statistics.percentile(20)  # Use 20th percentile as baseline
+            smoothed -= baseline
+            return smoothed, statistics.shifted(baseline)
 
-        # Enhanced baseline correction
-        baseline = np.percentile(smoothed, 20)  # Use 20th percentile as baseline
-        return smoothed - baseline
+    def _noise_floor(self, statistics):
+        """Median plus half the interquartile range of the normalized signal"""
+        signal_iqr = statistics.percentile(75) - statistics.percentile(25)
+        return statistics.median() + signal_iqr * 0.5
 
     ## Muuta tätä jos signaalin arvot pienet
-    def _find_initial_peaks(self, signal, min_prominence_pct, noise_floor):
+    def _find_initial_peaks(
+        self, signal, min_prominence_pct, noise_floor, statistics=None
+    ):
         """Find initial peaks using dynamic thresholding"""
-        # Calculate signal range excluding outliers
-        signal_range = np.percentile(signal, 99) - np.percentile(signal, 1)
-
-        # Dynamic prominence threshold
-        min_prominence = max(
-            signal_range * (min_prominence_pct / 100),
-            noise_floor
-            * 2,  # Ensure minimum separation from noise, laita pienemmäksi jos signaalissä pieniä arvoeroja
+        min_prominence = self._min_prominence(
+            signal, min_prominence_pct, noise_floor, statistics
         )
 
         # Find peaks with adaptive parameters
         peaks, _ = find_peaks(
             signal,
             prominence=min_prominence,
-            distance=int(
-                self.expected_period * 0.5
-            ),  ## laita pienemmäksi jos signaalissa pieniä arvoeroja
+            distance=self._peak_distance(),
         )
 
         return peaks
 
+    def _min_prominence(self, signal, min_prominence_pct, noise_floor, statistics=None):
+        """
+        Dynamic prominence threshold for find_peaks.
+
+        statistics are the OrderStatistics of the signal from prepare, the
+        1st and 99th percentiles are selected from the signal without them.
+        """
+        if statistics is None:
+            statistics = OrderStatistics(signal, (1, 99))
+
+        # Calculate signal range excluding outliers
+        signal_range = statistics.percentile(99) - statistics.percentile(1)
+
+        return max(
+            signal_range * (min_prominence_pct / 100),
+            noise_floor
+            * 2,  # Ensure minimum separation from noise, laita pienemmäksi jos signaalissä pieniä arvoeroja
+        )
+
+    def _peak_distance(self):
+        """Minimum distance between peaks in samples"""
+        return int(
+            self.expected_period * 0.5
+        )  ## laita pienemmäksi jos signaalissa pieniä arvoeroja
+
     def _filter_peaks(self, signal, peaks, amplitude_tolerance):
         """Enhanced peak filtering with better handling of amplitude variations"""
         if len(peaks) < 2:
-            return peaks, []
+            return peaks, peaks[:0]
 
         # Calculate peak amplitudes
         amplitudes = signal[peaks]
 
         # Use rolling statistics for local amplitude variations
         window_size = min(20, len(amplitudes))
-        rolling_median = np.array(
-            [
-                np.median(
-                    amplitudes[
-                        max(0, i - window_size) : min(len(amplitudes), i + window_size)
-                    ]
-                )
-                for i in range(len(amplitudes))
-            ]
-        )
-        rolling_std = np.array(
-            [
-                np.std(
-                    amplitudes[
-                        max(0, i - window_size) : min(len(amplitudes), i + window_size)
-                    ]
-                )
-                for i in range(len(amplitudes))
-            ]
-        )
+        rolling_median = rolling_stats.rolling_median(amplitudes, window_size)
+        rolling_std = rolling_stats.rolling_std(amplitudes, window_size)
 
         # Calculate adaptive thresholds
         lower_bound = rolling_median - rolling_std * amplitude_tolerance
@@ -167,3 +527,148 @@ class PeakDetector:
             "actual_frequency": actual_frequency,
             "signal_quality": 1.0 - (np.std(intervals) / np.mean(intervals)),
         }
+
+
+class StreamingSavgol:
+    """Savitzky-Golay filter applied block by block with carried-over edge context"""
+
+    def __init__(self, window_length, polyorder):
+        self.window_length = window_length
+        self.polyorder = polyorder
+        self.half = window_length // 2
+        self._buffer = None
+        self._start = 0  # Sample index of the first buffered sample
+        self._emitted = 0  # Samples already returned
+
+    def push(self, block, final=False):
+        """Add a block and return the (smoothed, raw) samples that became final"""
+        block = np.asarray(block)
+        if self._buffer is None:
+            self._buffer = block
+        else:
+            self._buffer = np.concatenate((self._buffer, block))
+        end = self._start + len(self._buffer)
+
+        # The last half window still needs samples from the next block
+        stop = end if final else end - self.half
+        if stop <= self._emitted or (
+            not final and len(self._buffer) < self.window_length
+        ):
+            return self._buffer[:0], self._buffer[:0]
+
+        smoothed = savgol(self._buffer, self.window_length, self.polyorder)
+        first = self._emitted - self._start
+        last = stop - self._start
+        out_smoothed, out_raw = smoothed[first:last], self._buffer[first:last]
+        self._emitted = stop
+
+        # Keep the left context needed by the next samples
+        keep_from = max(self._emitted - self.half, self._start)
+        self._buffer = self._buffer[keep_from - self._start :].copy()
+        self._start = keep_from
+        return out_smoothed, out_raw
+
+
+class _ChunkPeakFinder:
+    """find_peaks over consecutive blocks with context on both sides of each block"""
+
+    def __init__(self, min_prominence, distance, context):
+        self.min_prominence = min_prominence
+        self.distance = distance
+        self.context = context
+        self._signal = None
+        self._raw = None
+        self._start = 0  # Sample index of the first buffered sample
+        self._final_from = 0  # Peaks before this index have been returned
+
+    def push(self, signal, raw, final=False):
+        """Add samples and return (index, amplitude, raw amplitude) of final peaks"""
+        if self._signal is None:
+            self._signal, self._raw = signal, raw
+        else:
+            self._signal = np.concatenate((self._signal, signal))
+            self._raw = np.concatenate((self._raw, raw))
+        end = self._start + len(self._signal)
+        final_to = end if final else end - self.context
+
+        if final_to <= self._final_from or len(self._signal) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, self._signal[:0], self._raw[:0]
+
+        peaks, _ = find_peaks(
+            self._signal, prominence=self.min_prominence, distance=self.distance
+        )
+        index = peaks + self._start
+        keep = (index >= self._final_from) & (index < final_to)
+        peaks, index = peaks[keep], index[keep].astype(np.int64)
+        amplitudes, raw_amplitudes = self._signal[peaks], self._raw[peaks]
+        self._final_from = final_to
+
+        # Keep the left context for the prominence and distance of later peaks
+        keep_from = max(final_to - self.context, self._start)
+        self._signal = self._signal[keep_from - self._start :].copy()
+        self._raw = self._raw[keep_from - self._start :].copy()
+        self._start = keep_from
+        return index, amplitudes, raw_amplitudes
+
+
+class _ChunkPeakFilter:
+    """The rolling amplitude filter of _filter_peaks applied to a stream of peaks"""
+
+    window_size = 20
+
+    def __init__(self, amplitude_tolerance):
+        self.amplitude_tolerance = amplitude_tolerance
+        self._index = np.zeros(0, dtype=np.int64)
+        self._amplitudes = np.zeros(0)
+        self._raw = np.zeros(0)
+        self._start = 0  # Peak number of the first buffered peak
+        self._decided = 0  # Peaks before this number have been returned
+        self._seen = QuantileSketch()  # For the running 99th percentile of amplitudes
+
+    def push(self, index, amplitudes, raw_amplitudes, final=False):
+        """Add peaks and return (index, amplitude, raw amplitude, accepted) of decided peaks"""
+        self._index = np.concatenate((self._index, index))
+        self._amplitudes = np.concatenate((self._amplitudes, amplitudes))
+        self._raw = np.concatenate((self._raw, raw_amplitudes))
+        self._seen.update(amplitudes)
+        end = self._start + len(self._index)
+
+        # A peak is decided once the peaks after it in its window are known
+        decide_to = end if final else end - self.window_size
+        first, last = self._decided - self._start, decide_to - self._start
+        if last <= first:
+            return (
+                self._index[:0],
+                self._amplitudes[:0],
+                self._raw[:0],
+                np.zeros(0, dtype=bool),
+            )
+
+        rolling_median = rolling_stats.rolling_median(
+            self._amplitudes, self.window_size
+        )[first:last]
+        rolling_std = rolling_stats.rolling_std(self._amplitudes, self.window_size)[
+            first:last
+        ]
+        decided = self._amplitudes[first:last]
+        valid = (decided >= rolling_median - rolling_std * self.amplitude_tolerance) & (
+            decided <= rolling_median + rolling_std * self.amplitude_tolerance
+        )
+        valid |= decided > self._seen.percentile(99)
+
+        result = (
+            self._index[first:last],
+            decided,
+            self._raw[first:last],
+            valid,
+        )
+        self._decided = decide_to
+
+        # Keep the peaks still inside the window of undecided peaks
+        keep_from = max(decide_to - self.window_size, self._start)
+        self._index = self._index[keep_from - self._start :]
+        self._amplitudes = self._amplitudes[keep_from - self._start :]
+        self._raw = self._raw[keep_from - self._start :]
+        self._start = keep_from
+        return result
@@ -0,0 +1,104 @@
+import numpy as np
+from scipy.fft import irfft, next_fast_len, rfft
+
+# Longest signal the autocorrelation is computed on, longer signals are
+# decimated to about this many samples first
+MAX_ESTIMATE_SAMPLES = 1 << 20
+
+# A later autocorrelation peak only wins over an earlier one if it is higher
+# than this fraction of it, so multiples of the period are not picked
+HARMONIC_RATIO = 0.8
+
+
+class PeriodEstimate:
+    """Dominant period of a signal in samples, with the autocorrelation at it"""
+
+    __slots__ = ("period", "confidence", "decimation")
+
+    def __init__(self, period, confidence, decimation):
+        self.period = period  # Samples of the analyzed signal, None if not found
+        self.confidence = confidence  # Normalized autocorrelation, 0 to 1
+        self.decimation = decimation  # Samples combined into one for the estimate
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def autocorrelation(signal):
+    """
+    Normalized autocorrelation of a 1-D signal for every lag, via FFT.
+
+    Every lag is divided by the number of overlapping samples, so lag 0 is 1
+    and a strictly periodic signal stays near 1 at all multiples of its
+    period. O(n log n) instead of the O(n^2) of np.correlate.
+    """
+    values = np.asarray(signal, dtype=np.float64)
+    values = values - values.mean()
+    length = len(values)
+    size = next_fast_len(2 * length - 1, real=True)
+    spectrum = rfft(values, size)
+    correlation = irfft(spectrum.real**2 + spectrum.imag**2, size)[:length]
+    if correlation[0] <= 0:  # Constant signal
+        return np.zeros(length)
+    correlation /= np.arange(length, 0, -1)
+    return correlation / correlation[0]
+
+
+def decimate_max(signal, factor):
+    """Maximum of every `factor` consecutive samples, keeps narrow peaks visible"""
+    signal = np.asarray(signal)
+    if factor <= 1:
+        return signal
+    usable = len(signal) // factor * factor
+    return signal[:usable].reshape(-1, factor).max(axis=1)
+
+
+def estimate_period(signal, min_period=2, max_period=None, max_samples=None):
+    """
+    Estimate the dominant repetition period of a signal, e.g. of its peaks.
+
+    The signal is decimated by block maxima to at most max_samples samples and
+    the first autocorrelation peak between min_period and max_period that is
+    at least HARMONIC_RATIO of the highest one is taken, refined by parabolic
+    interpolation.
+
+    Args:
+        signal: 1-D signal, best with the baseline removed
+        min_period, max_period: range of periods in samples, max_period
+            defaults to a third of the signal so at least three periods count
+        max_samples: decimation target, MAX_ESTIMATE_SAMPLES by default
+
+    Returns:
+        PeriodEstimate, with period None and confidence 0 if the signal shows
+        no repetition in the range
+    """
+    signal = np.asarray(signal)
+    max_samples = max_samples or MAX_ESTIMATE_SAMPLES
+    factor = max(1, -(-len(signal) // max_samples))
+    decimated = decimate_max(signal, factor)
+    if max_period is None:
+        max_period = len(signal) // 3
+
+    first = max(1, int(np.ceil(min_period / factor)))
+    last = min(int(max_period // factor), len(decimated) // 3)
+    if last - first < 2:
+        return PeriodEstimate(None, 0.0, factor)
+
+    correlation = autocorrelation(decimated)
+    window = correlation[first - 1 : last + 2]
+    middle = window[1:-1]
+    local_max = np.flatnonzero((middle > window[:-2]) & (middle >= window[2:]))
+    if len(local_max) == 0:
+        return PeriodEstimate(None, 0.0, factor)
+
+    heights = middle[local_max]
+    best = heights.max()
+    if best <= 0:
+        return PeriodEstimate(None, 0.0, factor)
+    lag = first + local_max[np.argmax(heights >= HARMONIC_RATIO * best)]
+
+    # Parabola through the peak and its neighbours for a sub-sample lag
+    before, peak, after = correlation[lag - 1 : lag + 2]
+    curvature = before - 2 * peak + after
+    offset = 0.5 * (before - after) / curvature if curvature < 0 else 0.0
+    return PeriodEstimate(float((lag + offset) * factor), float(min(peak, 1.0)), factor)
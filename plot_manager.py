@@ -0,0 +1,187 @@
+import numpy as np
+
+from lod import ViewportLines
+from peakAnalyzer import PEAK_HIGH, PEAK_LOW, PEAK_MEDIUM
+
+# Marker styles of the peak classes: (class code, label, color, marker size)
+PEAK_STYLES = (
+    (PEAK_HIGH, "High", "red", 10),
+    (PEAK_MEDIUM, "Medium", "yellow", 8),
+    (PEAK_LOW, "Low", "orange", 6),
+)
+
+# Marker style of rejected peaks: (label, color, marker size)
+REJECTED_STYLE = ("Rejected", "blue", 6)
+
+
+class ChannelPlot:
+    """
+    Artists of one channel of the analysis plot, created once.
+
+    Raw and filtered signal lines follow the viewport through their
+    pyramids (see ViewportLines), every peak class and the rejected peaks
+    are a marker line. Updates only replace the data of the artists. The
+    markers and the legend, whose labels hold the peak counts, are
+    animated: full redraws leave them out so they can be blitted onto the
+    background of the rest (see AnalysisPlot).
+    """
+
+    def __init__(self, ax, name, color):
+        self.ax = ax
+        self.viewport = ViewportLines(ax)
+        (self.raw,) = ax.plot([], [], f"{color}-", alpha=0.3, label=f"Raw {name}")
+        (self.filtered,) = ax.plot([], [], f"{color}-", label=f"Filtered {name}")
+
+        self.classes = []
+        for code, label, marker_color, size in PEAK_STYLES:
+            (markers,) = ax.plot(
+                [], [], "x", color=marker_color, markersize=size, animated=True
+            )
+            self.classes.append((code, f"{label} Peaks", markers))
+        _, marker_color, size = REJECTED_STYLE
+        (self.rejected,) = ax.plot(
+            [], [], "x", color=marker_color, markersize=size, animated=True
+        )
+
+        self.legend = None
+        ax.set_xlabel("Time (s)")
+        ax.set_ylabel("Amplitude")
+        ax.grid(True)
+
+    @property
+    def markers(self):
+        return [markers for _, _, markers in self.classes] + [self.rejected]
+
+    def overlays(self):
+        """Animated artists in drawing order"""
+        return self.markers + [self.legend]
+
+    def set_lines(self, raw, filtered, whole=False):
+        """
+        Show new raw and filtered pyramids.
+
+        Returns:
+            whether either line changed, which needs a full redraw
+        """
+        changed = self.viewport.set_pyramid(self.raw, raw, whole)
+        return self.viewport.set_pyramid(self.filtered, filtered, whole) or changed
+
+    def set_peaks(self, result):
+        """Show the classified and rejected peaks of a PeakResult"""
+        counts = []
+        for code, label, markers in self.classes:
+            mask = result.class_mask(code)
+            markers.set_data(result.time[mask], result.amplitude[mask])
+            counts.append((markers, label, np.count_nonzero(mask)))
+        rejected = ~result.accepted
+        self.rejected.set_data(result.time[rejected], result.amplitude[rejected])
+        counts.append((self.rejected, REJECTED_STYLE[0], np.count_nonzero(rejected)))
+
+        # Classes without peaks are left out of the legend
+        handles = [self.raw, self.filtered]
+        for markers, label, count in counts:
+            markers.set_label(f"{label} ({count})")
+            if count:
+                handles.append(markers)
+        self.legend = self.ax.legend(handles=handles, loc="upper right")
+        self.legend.set_animated(True)
+
+
+class AnalysisPlot:
+    """
+    Persistent plot of the analyzed channels, one axis each.
+
+    The artists of every channel are created on the first analysis after
+    clear() and reused by later ones, which only push new data into them,
+    so the view (zoom and pan) is kept while tuning settings. When the
+    signal lines are unchanged, e.g. after a new threshold or tolerance,
+    only the peak markers and legends are redrawn, blitted onto the
+    background saved at the last full draw.
+
+    Args:
+        fig: figure holding the axes, drawn through fig.canvas
+        axes: one axis per channel
+        names: channel names, in the order of axes
+        colors: line color of each channel
+    """
+
+    def __init__(self, fig, axes, names=("adc1", "adc2"), colors="bg"):
+        self.fig = fig
+        self.axes = tuple(axes)
+        self.names = tuple(names)
+        self.colors = tuple(colors)
+        self.channels = None
+        self.background = None
+        fig.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def clear(self):
+        """Clear the axes, the next show creates the artists again"""
+        for ax in self.axes:
+            ax.cla()
+        self.channels = None
+        self.background = None
+
+    def update(self, pyramids, results):
+        """
+        Push an analysis into the artists, creating them after clear().
+
+        Args:
+            pyramids: {channel: (raw pyramid, filtered pyramid)}
+            results: {channel: PeakResult}
+
+        Returns:
+            whether the figure needs a full redraw instead of a blit
+        """
+        fresh = self.channels is None
+        if fresh:
+            self.clear()
+            self.channels = {
+                name: ChannelPlot(ax, name.upper(), color)
+                for ax, name, color in zip(self.axes, self.names, self.colors)
+            }
+
+        full = fresh or self.background is None
+        for name, channel in self.channels.items():
+            full = channel.set_lines(*pyramids[name], whole=fresh) or full
+            channel.set_peaks(results[name])
+
+        if fresh:
+            for ax in self.axes:
+                ax.relim()
+                ax.autoscale_view()
+            self.fig.tight_layout()
+        return full
+
+    def draw(self, full=True):
+        """Draw the figure right away, or only blit the overlays if not full"""
+        if full or self.background is None:
+            self.fig.canvas.draw()
+        else:
+            self.blit()
+
+    def overlays(self):
+        if self.channels is None:
+            return []
+        return [
+            artist
+            for channel in self.channels.values()
+            for artist in channel.overlays()
+        ]
+
+    def blit(self):
+        """Redraw the overlays on the saved background"""
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        for artist in self.overlays():
+            self.fig.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+
+    def _on_draw(self, event):
+        """Save the background of a full draw, then draw the overlays on it"""
+        if self.channels is None:
+            return
+        canvas = self.fig.canvas
+        if not canvas.is_saving():
+            self.background = canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self.overlays():
+            artist.draw(event.renderer)
@@ -0,0 +1,186 @@
+import numpy as np
+
+# Items kept per level of a QuantileSketch. Sketches of at most this many
+# values are exact.
+DEFAULT_SKETCH_CAPACITY = 4096
+
+
+def _virtual_positions(length, percentiles):
+    """Fractional sorted positions of percentiles, computed as np.percentile does"""
+    quantiles = np.true_divide(percentiles, 100)
+    virtual = (length - 1) * quantiles
+    below = np.clip(np.floor(virtual), 0, length - 1).astype(np.intp)
+    above = np.minimum(below + 1, length - 1)
+    fraction = virtual - below
+    if type(percentiles) in (int, float):
+        # A Python number keeps the dtype of the values, as in np.percentile
+        fraction = float(fraction)
+    return fraction, below, above
+
+
+def _lerp(a, b, t):
+    """Linear interpolation rounded the same way as np.percentile"""
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+class OrderStatistics:
+    """
+    Several percentiles of one array from a single selection pass.
+
+    Every np.percentile or np.median call copies and partitions the whole
+    array. This partitions one copy at all the sorted positions the requested
+    percentiles need at once and keeps only the values found there, so any of
+    those percentiles and the median are then read off in O(1). Results are
+    equal to np.percentile (linear interpolation) and np.median.
+
+    Args:
+        values: 1-D array
+        percentiles: percentiles in [0, 100] that will be asked for
+    """
+
+    def __init__(self, values, percentiles):
+        values = np.asarray(values).ravel()
+        if len(values) == 0:
+            raise ValueError("Percentiles of an empty array")
+        self.length = len(values)
+
+        _, below, above = _virtual_positions(self.length, percentiles)
+        middle = [(self.length - 1) // 2, self.length // 2]
+        ranks = np.unique(np.concatenate((below, above, middle)))
+        if values.dtype.kind == "f":  # NaNs sort to the end, as in np.percentile
+            ranks = np.union1d(ranks, [self.length - 1])
+        selected = np.partition(values, ranks)[ranks]
+        self._ranks = ranks
+        self._values = selected if values.dtype.kind == "f" else selected / 1.0
+        self._nan = bool(np.isnan(self._values[-1]))
+
+    def shifted(self, offset):
+        """Statistics of the array minus offset, without another pass"""
+        shifted = object.__new__(OrderStatistics)
+        shifted.length = self.length
+        shifted._ranks = self._ranks
+        shifted._values = self._values - offset
+        shifted._nan = self._nan
+        return shifted
+
+    def _at(self, ranks):
+        index = np.searchsorted(self._ranks, ranks)
+        if np.any(index >= len(self._ranks)) or np.any(self._ranks[index] != ranks):
+            raise ValueError("Percentile was not requested when selecting")
+        return self._values[index]
+
+    def percentile(self, q):
+        """Percentile or array of percentiles, equal to np.percentile(values, q)"""
+        t, below, above = _virtual_positions(self.length, q)
+        if self._nan:
+            return np.full(np.shape(q), np.nan)[()]
+        return _lerp(self._at(below), self._at(above), t)[()]
+
+    def median(self):
+        """Equal to np.median(values)"""
+        if self._nan:
+            return np.nan
+        lower, upper = self._at([(self.length - 1) // 2, self.length // 2])
+        return lower if self.length % 2 else (lower + upper) / 2
+
+
+def percentiles(values, q):
+    """np.percentile(values, q) for a sequence q, from one selection pass"""
+    return OrderStatistics(values, q).percentile(q)
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming estimate of the percentiles of a sequence of values.
+
+    Values are added in pieces with update(), and sketches of different parts
+    of a signal, e.g. of chunks analyzed on worker processes, are combined
+    with merge(). Memory stays at a few times `capacity` items however many
+    values are added.
+
+    The sketch keeps levels of sorted items where an item of level h stands
+    for 2**h values (the KLL/MRL compactor scheme). A level that grows past
+    capacity keeps every other item, alternating the kept half between
+    compactions, and hands them on to the next level. Until the first
+    compaction the percentiles are exact; after it the rank of an estimate is
+    off by a small fraction of the count that shrinks as capacity grows.
+    """
+
+    def __init__(self, capacity=DEFAULT_SKETCH_CAPACITY):
+        if capacity < 2:
+            raise ValueError("Sketch capacity must be at least 2")
+        self.capacity = capacity
+        self.count = 0
+        self._levels = [np.zeros(0)]
+        self._flips = [0]  # Half kept by the next compaction of every level
+
+    def __len__(self):
+        return self.count
+
+    def update(self, values):
+        """Add an array of values"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self._levels[0] = np.concatenate((self._levels[0], values))
+        self._compress()
+
+    def merge(self, other):
+        """Add the values summarized by another sketch"""
+        for level, items in enumerate(other._levels):
+            if level == len(self._levels):
+                self._levels.append(np.zeros(0))
+                self._flips.append(0)
+            self._levels[level] = np.concatenate((self._levels[level], items))
+        self.count += other.count
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if len(items) > self.capacity:
+                items = np.sort(items)
+                flip = self._flips[level]
+                self._flips[level] ^= 1
+
+                # An odd item out stays on its level, so the weights still add
+                # up to the count
+                if len(items) % 2 and flip:
+                    kept, items = items[-1:], items[:-1]
+                elif len(items) % 2:
+                    kept, items = items[:1], items[1:]
+                else:
+                    kept = items[:0]
+
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.zeros(0))
+                    self._flips.append(0)
+                self._levels[level] = kept
+                self._levels[level + 1] = np.concatenate(
+                    (self._levels[level + 1], items[flip::2])
+                )
+            level += 1
+
+    def percentile(self, q):
+        """Estimated percentile or array of percentiles of all added values"""
+        if self.count == 0:
+            raise ValueError("Percentiles of an empty sketch")
+        if len(self._levels) == 1:
+            return np.percentile(self._levels[0], q)
+
+        items = np.concatenate(self._levels)
+        weights = np.concatenate(
+            [np.full(len(level), 2.0**h) for h, level in enumerate(self._levels)]
+        )
+        order = np.argsort(items, kind="stable")
+        items = items[order]
+        # Sorted rank of the last value every item stands for
+        last_rank = np.cumsum(weights[order]) - 1
+
+        t, below, above = _virtual_positions(self.count, q)
+        lower = items[np.searchsorted(last_rank, below)]
+        upper = items[np.searchsorted(last_rank, above)]
+        return _lerp(lower, upper, t)[()]
@@ -0,0 +1,314 @@
+import json
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+from numpy.lib import format as npy_format
+
+CONTAINER_EXTENSION = ".adcz"
+FORMAT_NAME = "adc-recording"
+FORMAT_VERSION = 1
+
+# Samples per block, about 1.3 s at 50 kHz
+DEFAULT_BLOCK_SIZE = 1 << 16
+
+# Quantiles stored for every block and channel, every percent from min to max
+SKETCH_QUANTILES = np.linspace(0.0, 1.0, 101)
+
+# Decompressed blocks kept per open container
+CACHED_BLOCKS = 16
+
+
+def _block_name(number):
+    return f"blocks/{number:08d}"
+
+
+class ContainerWriter:
+    """
+    Writes a chunk-indexed recording container.
+
+    The container is a zip file holding the samples in fixed-size blocks of
+    rows, each deflate-compressed on its own, so any range of rows can be read
+    by decompressing only the blocks it overlaps. Alongside the blocks it
+    stores the sample rate, channel names and, per block and channel, the
+    min, max, mean and SKETCH_QUANTILES, which give overview plots and
+    percentiles of the whole recording without touching the samples.
+
+    Rows are appended with write() in pieces of any length, e.g. straight
+    from a chunked CSV reader. Use as a context manager, or call close().
+    """
+
+    def __init__(
+        self,
+        path,
+        sample_rate,
+        channels=("adc1", "adc2"),
+        block_size=DEFAULT_BLOCK_SIZE,
+        dtype="int16",
+        compresslevel=1,
+    ):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = list(channels)
+        self.block_size = block_size
+        self.dtype = np.dtype(dtype)
+        self.compresslevel = compresslevel
+        self.length = 0
+
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+        self._buffer = np.empty((block_size, len(self.channels)), dtype=self.dtype)
+        self._buffered = 0
+        self._blocks = 0
+        self._stats = {"min": [], "max": [], "mean": [], "quantiles": []}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:  # Don't leave a truncated container behind
+            self._zip.close()
+            os.remove(self.path)
+
+    def write(self, rows):
+        """Append rows, an array of shape (n, channels) in the container dtype"""
+        rows = np.asarray(rows)
+        if rows.ndim != 2 or rows.shape[1] != len(self.channels):
+            raise ValueError(
+                f"Expected rows with {len(self.channels)} columns, got shape {rows.shape}"
+            )
+
+        start = 0
+        while start < len(rows):
+            count = min(self.block_size - self._buffered, len(rows) - start)
+            self._buffer[self._buffered : self._buffered + count] = rows[
+                start : start + count
+            ]
+            self._buffered += count
+            start += count
+            if self._buffered == self.block_size:
+                self._write_block(self._buffer)
+                self._buffered = 0
+
+    def _write_block(self, block):
+        self._zip.writestr(
+            _block_name(self._blocks),
+            np.ascontiguousarray(block).tobytes(),
+            compresslevel=self.compresslevel,
+        )
+        self._stats["min"].append(block.min(axis=0))
+        self._stats["max"].append(block.max(axis=0))
+        self._stats["mean"].append(block.mean(axis=0, dtype=np.float64))
+        self._stats["quantiles"].append(
+            np.quantile(block, SKETCH_QUANTILES, axis=0).T.astype(np.float32)
+        )
+        self._blocks += 1
+        self.length += len(block)
+
+    def _write_array(self, name, array):
+        with self._zip.open(name, "w") as f:
+            npy_format.write_array(f, np.ascontiguousarray(array))
+
+    def close(self):
+        """Write the last partial block, the block statistics and the metadata"""
+        if self._zip.fp is None:
+            return
+        if self._buffered:
+            self._write_block(self._buffer[: self._buffered])
+            self._buffered = 0
+
+        channels = len(self.channels)
+        empty = {
+            "min": np.zeros((0, channels), self.dtype),
+            "max": np.zeros((0, channels), self.dtype),
+            "mean": np.zeros((0, channels)),
+            "quantiles": np.zeros((0, channels, len(SKETCH_QUANTILES)), np.float32),
+        }
+        for name, values in self._stats.items():
+            array = np.stack(values) if values else empty[name]
+            self._write_array(f"stats/{name}.npy", array)
+        self._write_array("stats/sketch_quantiles.npy", SKETCH_QUANTILES)
+
+        metadata = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+            "dtype": self.dtype.str,
+            "length": self.length,
+            "block_size": self.block_size,
+            "blocks": self._blocks,
+        }
+        self._zip.writestr("metadata.json", json.dumps(metadata, indent=2))
+        self._zip.close()
+
+
+class ContainerReader:
+    """
+    Read access to a recording container written by ContainerWriter.
+
+    Behaves like a read-only 2-D array of shape (length, channels) for row
+    slicing (reader[start:stop:step] or reader[start:stop, column]), so it can
+    back a MappedRecording. Only the blocks overlapping the requested rows are
+    decompressed, and the most recently used ones are cached.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        try:
+            metadata = json.loads(self._zip.read("metadata.json"))
+        except KeyError:
+            self._zip.close()
+            raise ValueError(f"{path} is not a recording container")
+        if (
+            metadata.get("format") != FORMAT_NAME
+            or metadata["version"] > FORMAT_VERSION
+        ):
+            self._zip.close()
+            raise ValueError(f"Unsupported recording container: {path}")
+
+        self.metadata = metadata
+        self.sample_rate = metadata["sample_rate"]
+        self.channels = list(metadata["channels"])
+        self.dtype = np.dtype(metadata["dtype"])
+        self.block_size = metadata["block_size"]
+        self.blocks = metadata["blocks"]
+        self.shape = (metadata["length"], len(self.channels))
+        self.ndim = 2
+
+        # Per block statistics, arrays of shape (blocks, channels[, quantiles])
+        self.block_min = self._read_array("stats/min.npy")
+        self.block_max = self._read_array("stats/max.npy")
+        self.block_mean = self._read_array("stats/mean.npy")
+        self.block_quantiles = self._read_array("stats/quantiles.npy")
+        self.sketch_quantiles = self._read_array("stats/sketch_quantiles.npy")
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    def _read_array(self, name):
+        with self._zip.open(name) as f:
+            return npy_format.read_array(f)
+
+    def channel_index(self, channel):
+        """Column number of a channel given by name or number"""
+        return self.channels.index(channel) if isinstance(channel, str) else channel
+
+    def block_rows(self, number):
+        """First row and number of rows of a block"""
+        start = number * self.block_size
+        return start, min(self.block_size, len(self) - start)
+
+    def block(self, number):
+        """Decompressed rows of one block"""
+        with self._lock:
+            block = self._cache.get(number)
+            if block is not None:
+                self._cache.move_to_end(number)
+                return block
+
+            _, rows = self.block_rows(number)
+            data = self._zip.read(_block_name(number))
+            block = np.frombuffer(data, dtype=self.dtype).reshape(rows, -1)
+            self._cache[number] = block
+            if len(self._cache) > CACHED_BLOCKS:
+                self._cache.popitem(last=False)
+            return block
+
+    def read(self, start=None, stop=None, step=None, columns=slice(None)):
+        """Rows [start:stop:step] of the given columns, decompressing only the needed blocks"""
+        start, stop, step = slice(start, stop, step).indices(len(self))
+        if step < 0:
+            return self.read()[start:stop:step, columns]
+
+        count = len(range(start, stop, step))
+        sample = np.zeros((0, self.shape[1]), self.dtype)[:, columns]
+        out = np.empty((count,) + sample.shape[1:], dtype=self.dtype)
+        filled = 0
+        first_block = start // self.block_size
+        last_block = (stop - 1) // self.block_size if count else first_block - 1
+        for number in range(first_block, last_block + 1):
+            block_start, rows = self.block_rows(number)
+            # First wanted row inside this block, keeping the global step
+            first = max(start, block_start)
+            first += (start - first) % step
+            last = min(stop, block_start + rows)
+            if first >= last:
+                continue
+            part = self.block(number)[first - block_start : last - block_start : step]
+            out[filled : filled + len(part)] = part[:, columns]
+            filled += len(part)
+        return out
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        rows, columns = key
+        if isinstance(rows, (int, np.integer)):
+            index = range(len(self))[rows]
+            return self.read(index, index + 1, columns=columns)[0]
+        if not isinstance(rows, slice):
+            raise TypeError("Recording containers only support slicing rows")
+        return self.read(rows.start, rows.stop, rows.step, columns)
+
+    def overview(self, channel):
+        """
+        Block start times with the min and max of a channel in every block.
+
+        Reads only the block statistics, for plotting an overview of the
+        whole recording right after opening it.
+        """
+        column = self.channel_index(channel)
+        times = np.arange(self.blocks) * self.block_size / self.sample_rate
+        return times, self.block_min[:, column], self.block_max[:, column]
+
+    def percentile(self, channel, q, start=None, stop=None):
+        """
+        Approximate percentile(s) of a channel from the block sketches.
+
+        The quantiles stored for every block are pooled, weighted by the block
+        sizes, so the result is within about one percentile rank of the exact
+        value. Every block overlapping the [start, stop) row range is used,
+        including partial blocks at either end.
+
+        Args:
+            channel: channel name or number
+            q: percentile or sequence of percentiles in [0, 100]
+        """
+        column = self.channel_index(channel)
+        first = 0 if start is None else start // self.block_size
+        last = self.blocks if stop is None else -(-stop // self.block_size)
+        values = self.block_quantiles[first:last, column].astype(np.float64)
+        if values.size == 0:
+            raise ValueError("No blocks in the requested range")
+
+        # Every sketch point stands for the samples halfway to its neighbours
+        spacing = np.diff(self.sketch_quantiles)
+        share = np.concatenate(([0.0], spacing / 2)) + np.concatenate(
+            (spacing / 2, [0.0])
+        )
+        rows = np.array([self.block_rows(n)[1] for n in range(first, last)])
+        weights = (rows[:, None] * share[None, :]).ravel()
+
+        # Pooled CDF, evaluated at the middle of the weight of every point
+        order = np.argsort(values, axis=None)
+        sorted_values = values.ravel()[order]
+        cumulative = np.cumsum(weights[order]) - weights[order] / 2
+        cumulative /= weights.sum()
+        return np.interp(np.asarray(q) / 100, cumulative, sorted_values)
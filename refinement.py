@@ -0,0 +1,131 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import resample_poly
+
+from filter_engine import savgol_kernel
+from peakAnalyzer import PeakResult
+
+# Full-rate samples decimated at a time, bounds the float copy of the input
+DECIMATE_BLOCK = 1 << 22
+
+# Half length of the anti-alias filter of resample_poly, in decimation factors
+_FILTER_HALF = 10
+
+
+def decimate(signal, factor, block_size=DECIMATE_BLOCK):
+    """
+    Low-pass filter a signal and keep every factor-th sample.
+
+    Unlike signal[::factor] nothing above the new Nyquist frequency folds
+    back into the result, and narrow peaks are kept as smaller bumps
+    instead of being hit or missed depending on where the samples fall.
+    Sample i of the result is centered on sample i * factor of the input,
+    so times stay those of signal[::factor]. The input is read in blocks,
+    e.g. from a memory-mapped column, and only one block is converted to
+    float at a time.
+
+    Returns:
+        float64 array of ceil(len(signal) / factor) samples
+    """
+    length = len(signal)
+    if factor <= 1:
+        return np.asarray(signal, dtype=np.float64).copy()
+
+    out = np.empty(-(-length // factor))
+    context = _FILTER_HALF * factor
+    step = max(block_size // factor, 1) * factor
+    for start in range(0, length, step):
+        stop = min(start + step, length)
+        lo, hi = start - context, stop + context
+        block = np.asarray(signal[max(lo, 0) : min(hi, length)], dtype=np.float64)
+        # Beyond the ends of the signal the block is extended point-symmetrically
+        # about the end samples, which continues lines and constants; the zero
+        # padding of resample_poly would make the first and last samples ring
+        padding = (max(-lo, 0), max(hi - length, 0))
+        if any(padding):
+            if len(block) > 1:
+                block = np.pad(block, padding, mode="reflect", reflect_type="odd")
+            else:
+                block = np.pad(block, padding, mode="edge")
+        block = resample_poly(block, 1, factor)
+        first, last = start // factor, -(-stop // factor)
+        offset = context // factor
+        out[first:last] = block[offset : offset + last - first]
+    return out
+
+
+def _smoothing_kernel(window_length, poly_order, factor):
+    """Full-rate kernel spanning the time of the decimated Savitzky-Golay window"""
+    if window_length is None:
+        return np.ones(1)
+    return savgol_kernel(window_length * factor | 1, poly_order)
+
+
+def refine_peaks(signal, index, factor, window_length=None, poly_order=2, radius=None):
+    """
+    Locate peaks found on a decimated signal in the full-rate signal.
+
+    Only small windows of the full-rate signal around each peak are read.
+    They are smoothed with a Savitzky-Golay filter of the same duration as
+    the one applied to the decimated signal, the maximum within radius
+    samples of the coarse position is taken and refined by a parabola
+    through it and its neighbours.
+
+    Args:
+        signal: full-rate 1-D signal, e.g. a memory-mapped column
+        index: peak positions in samples of the decimated signal
+        factor: decimation factor of the decimated signal
+        window_length, poly_order: Savitzky-Golay setting used on the
+            decimated signal, window_length None for an unfiltered signal
+        radius: full-rate samples searched on either side, default factor
+
+    Returns:
+        (positions, amplitudes): fractional full-rate sample positions of the
+        peaks and the smoothed signal interpolated at them
+    """
+    index = np.asarray(index, dtype=np.int64)
+    if len(index) == 0:
+        return np.zeros(0), np.zeros(0)
+    signal = np.asarray(signal)
+    radius = factor if radius is None else radius
+    kernel = _smoothing_kernel(window_length, poly_order, factor)
+    half = len(kernel) // 2
+
+    # Samples of every window, searched range plus a neighbour on either side
+    # for the parabola and half a kernel for the smoothing; clamped at the ends
+    reach = radius + 1 + half
+    centers = index * factor
+    positions = np.clip(
+        centers[:, None] + np.arange(-reach, reach + 1), 0, len(signal) - 1
+    )
+    windows = signal[positions].astype(np.float64)
+    smoothed = sliding_window_view(windows, len(kernel), axis=1) @ kernel[::-1]
+
+    # smoothed[:, j] is centered on full-rate sample center - radius - 1 + j
+    best = 1 + np.argmax(smoothed[:, 1:-1], axis=1)
+    rows = np.arange(len(index))
+    before, peak, after = (smoothed[rows, best + shift] for shift in (-1, 0, 1))
+    curvature = before - 2 * peak + after
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = np.where(curvature < 0, 0.5 * (before - after) / curvature, 0.0)
+    refined = centers - radius - 1 + best + offset
+    amplitudes = peak - 0.25 * (before - after) * offset
+    return np.clip(refined, 0, len(signal) - 1), amplitudes
+
+
+def refine_result(
+    result, signal, factor, sample_rate, window_length=None, poly_order=2
+):
+    """
+    PeakResult with the times and amplitudes of its peaks refined at full rate.
+
+    The index column keeps the positions in the decimated signal, time is
+    the refined full-rate position in seconds. See refine_peaks.
+    """
+    positions, amplitudes = refine_peaks(
+        signal, result.index, factor, window_length, poly_order
+    )
+    refined = PeakResult(result.table.copy())
+    refined.table["time"] = positions / sample_rate
+    refined.table["amplitude"] = amplitudes
+    return refined
@@ -0,0 +1,149 @@
+import heapq
+import numpy as np
+
+
+def centered_window_bounds(length, half_window):
+    """
+    Start (inclusive) and stop (exclusive) of the window around every position.
+
+    The window of position i is [i - half_window, i + half_window), clipped to
+    the array, which is the window PeakDetector._filter_peaks has always used.
+    """
+    positions = np.arange(length)
+    starts = np.maximum(positions - half_window, 0)
+    stops = np.minimum(positions + half_window, length)
+    return starts, stops
+
+
+class RunningMedian:
+    """
+    Median of a sliding window over an array, kept in two heaps.
+
+    The lower half of the window lives in a max-heap and the upper half in a
+    min-heap. Values leaving the window are deleted lazily: they are only
+    popped once they reach the top of a heap, so both adding and removing a
+    value cost O(log w).
+
+    Both ends of the window may only move forward, which is always the case
+    for the centered windows returned by centered_window_bounds.
+    """
+
+    def __init__(self, values):
+        self.values = values.tolist() if isinstance(values, np.ndarray) else values
+        self._low = []  # Max-heap of (-value, -position)
+        self._high = []  # Min-heap of (value, position)
+        self._low_size = 0
+        self._high_size = 0
+        self._in_low = bytearray(len(values))
+        self._start = 0  # Positions below this have left the window
+        self._stop = 0  # Next position to enter the window
+
+    def __len__(self):
+        return self._low_size + self._high_size
+
+    def _prune(self):
+        """Drop expired values from the tops of both heaps"""
+        while self._low and -self._low[0][1] < self._start:
+            heapq.heappop(self._low)
+        while self._high and self._high[0][1] < self._start:
+            heapq.heappop(self._high)
+
+    def _rebalance(self):
+        """Keep the lower half equal in size to, or one larger than, the upper half"""
+        self._prune()
+        while self._low_size > self._high_size + 1:
+            value, position = heapq.heappop(self._low)
+            heapq.heappush(self._high, (-value, -position))
+            self._in_low[-position] = False
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune()
+        while self._high_size > self._low_size:
+            value, position = heapq.heappop(self._high)
+            heapq.heappush(self._low, (-value, -position))
+            self._in_low[position] = True
+            self._high_size -= 1
+            self._low_size += 1
+            self._prune()
+
+    def move_to(self, start, stop):
+        """Slide the window to cover positions [start, stop)"""
+        while self._stop < stop:
+            position = self._stop
+            value = self.values[position]
+            self._prune()
+            if self._low_size == 0 or value <= -self._low[0][0]:
+                heapq.heappush(self._low, (-value, -position))
+                self._in_low[position] = True
+                self._low_size += 1
+            else:
+                heapq.heappush(self._high, (value, position))
+                self._high_size += 1
+            self._stop += 1
+            self._rebalance()
+
+        while self._start < start:
+            if self._in_low[self._start]:
+                self._low_size -= 1
+            else:
+                self._high_size -= 1
+            self._start += 1
+        self._rebalance()
+
+    def middle(self):
+        """The lower and upper middle values of the window (equal for odd sizes)"""
+        lower = -self._low[0][0]
+        if len(self) % 2 == 1:
+            return lower, lower
+        return lower, self._high[0][0]
+
+
+def rolling_median(values, half_window):
+    """
+    Median of the centered window around every value.
+
+    Gives the same results as calling np.median on every window, in
+    O(n log w) instead of O(n * w).
+    """
+    values = np.asarray(values)
+    if values.dtype.kind not in "f":
+        values = values.astype(np.float64)
+    if len(values) == 0:
+        return values.copy()
+
+    starts, stops = centered_window_bounds(len(values), half_window)
+    lower = np.empty_like(values)
+    upper = np.empty_like(values)
+
+    running = RunningMedian(values)
+    for i, (start, stop) in enumerate(zip(starts.tolist(), stops.tolist())):
+        running.move_to(start, stop)
+        lower[i], upper[i] = running.middle()
+
+    # Even sized windows average the two middle values, as np.median does
+    odd = (stops - starts) % 2 == 1
+    return np.where(odd, lower, (lower + upper) / 2)
+
+
+def rolling_std(values, half_window):
+    """
+    Population standard deviation of the centered window around every value.
+
+    Uses cumulative sums of the values and their squares, shifted by the
+    overall mean to limit cancellation, so every window costs O(1). Results
+    agree with np.std on every window up to floating point rounding.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values.copy()
+
+    starts, stops = centered_window_bounds(len(values), half_window)
+    shifted = values - values.mean()
+
+    sums = np.concatenate(([0.0], np.cumsum(shifted)))
+    square_sums = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+
+    counts = stops - starts
+    window_mean = (sums[stops] - sums[starts]) / counts
+    variance = (square_sums[stops] - square_sums[starts]) / counts - window_mean**2
+    return np.sqrt(np.maximum(variance, 0.0))
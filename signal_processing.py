@@ -1,39 +1,287 @@
-from scipy.signal import savgol_filter
-from tkinter import messagebox
-from peakAnalyzer import PeakDetector
+from filter_engine import savgol, savgol_kernel
+from peakAnalyzer import PeakDetector, PeakResult, StreamingSavgol
+from sweep import sweep_peaks
+
+# tkinter is imported by the functions showing errors only, see file_operations
+
+# Stages of peak detection in the order they run, see add_detection_stages
+DETECTION_STAGES = ("prepare", "candidate_peaks", "accepted_peaks", "classified_peaks")
 
 
 def process_signal(signal_data, window_length, poly_order):
+    from tkinter import messagebox
     try:
-        return savgol_filter(signal_data, window_length, poly_order)
+        return savgol(signal_data, window_length, poly_order)
     except ValueError as e:
         messagebox.showerror("Error", f"Invalid filter parameters: {str(e)}")
         return signal_data
 
 
-def find_signal_peaks(signal_data, params):
-    try:
-        # Create detector instance
-        detector = PeakDetector(sample_rate=50000, target_frequency=50)
+def filter_blocks(blocks, window_length, poly_order):
+    """
+    Savitzky-Golay filter a signal delivered as an iterator of blocks.
+
+    Yields filtered blocks that join up to the same result as process_signal on
+    the whole signal, while only holding one block plus the filter edge context.
+    """
+    smoother = StreamingSavgol(window_length, poly_order)
+    pending = None
+    for block in blocks:
+        if pending is not None:
+            filtered, _ = smoother.push(pending)
+            if len(filtered):
+                yield filtered
+        pending = block
+
+    if pending is not None:
+        filtered, _ = smoother.push(pending, final=True)
+        if len(filtered):
+            yield filtered
+
+
+def check_filter_params(window_length, poly_order):
+    """Raise ValueError if savgol_filter would reject the filter parameters"""
+    savgol_kernel(window_length, poly_order)
+
+
+def _detector(tracer=None, auto_period=False):
+    return PeakDetector(
+        sample_rate=50000,
+        target_frequency=50,
+        tracer=tracer,
+        auto_period=auto_period,
+    )
+
+
+def detect_signal_peaks(signal_data, params, time=None, tracer=None):
+    """
+    Run the peak detector with the GUI parameters, raising on errors.
+
+    With params["auto_period"] the peak distance follows the period estimated
+    from the signal instead of the fixed target frequency.
+    """
+    # Create detector instance
+    detector = _detector(tracer, params.get("auto_period", False))
 
-        # Detect peaks with the provided parameters
-        peaks, properties = detector.detect_peaks(
-            signal_data,
+    # Detect peaks with the provided parameters
+    return detector.detect_peaks(
+        signal_data,
+        min_prominence_pct=params["prominence_threshold"],
+        amplitude_tolerance=params["amplitude_tolerance"],
+        high_threshold=params["high_threshold"],
+        medium_threshold=params["medium_threshold"],
+        time=time,
+    )
+
+
+def detect_signal_peaks_chunked(blocks, params, sample_rate=None, tracer=None):
+    """
+    Run the chunked peak detector on a signal delivered as blocks.
+
+    Takes the parameters of detect_signal_peaks, see
+    PeakDetector.detect_peaks_chunked for how the peaks can differ from a
+    run on the whole signal.
+
+    Args:
+        sample_rate: rate of the blocks for the peak times, by default the
+            rate of the detector
+
+    Returns:
+        properties of the accepted peaks as from detect_signal_peaks, with
+        the PeakResult of the whole signal under "result"
+    """
+    detector = _detector(tracer, params.get("auto_period", False))
+    result = PeakResult.concatenate(
+        detector.detect_peaks_chunked(
+            blocks,
             min_prominence_pct=params["prominence_threshold"],
             amplitude_tolerance=params["amplitude_tolerance"],
             high_threshold=params["high_threshold"],
             medium_threshold=params["medium_threshold"],
         )
+    )
+    if sample_rate is not None:
+        result.table["time"] = result.index / sample_rate
+
+    properties = detector._calculate_properties(None, result.index[result.accepted])
+    properties.update(detector.period_properties())
+    properties["result"] = result
+    return properties
+
+
+def _candidate_peaks(prepared, prominence_threshold, auto_period, tracer=None):
+    detector = _detector(tracer, auto_period)
+    peaks = detector.candidate_peaks(*prepared, prominence_threshold)
+    return peaks, detector.period_properties()
+
+
+def _accepted_peaks(prepared, candidates, amplitude_tolerance, tracer=None):
+    return _detector(tracer).filter_candidates(
+        prepared[0], candidates[0], amplitude_tolerance
+    )
+
+
+def _classified_peaks(
+    signal,
+    prepared,
+    candidates,
+    accepted,
+    high_threshold,
+    medium_threshold,
+    time=None,
+    tracer=None,
+):
+    peaks, properties = _detector(tracer).classify(
+        signal, prepared[0], *accepted, high_threshold, medium_threshold, time
+    )
+    properties.update(candidates[1])
+    return peaks, properties
+
+
+def detection_stages(signal, params, time=None, tracer=None, out=None):
+    """
+    Run detect_signal_peaks stage by stage and keep every intermediate result.
+
+    out is an optional array for the normalized signal of the prepare stage,
+    see PeakDetector.prepare.
+
+    Returns:
+        dict of DETECTION_STAGES name -> value, as add_detection_stages would
+        compute them; "classified_peaks" is (peaks, properties)
+    """
+    prepared = _detector(tracer).prepare(signal, out)
+    candidates = _candidate_peaks(
+        prepared,
+        params["prominence_threshold"],
+        params.get("auto_period", False),
+        tracer,
+    )
+    accepted = _accepted_peaks(
+        prepared, candidates, params["amplitude_tolerance"], tracer
+    )
+    classified = _classified_peaks(
+        signal,
+        prepared,
+        candidates,
+        accepted,
+        params["high_threshold"],
+        params["medium_threshold"],
+        time,
+        tracer,
+    )
+    return dict(zip(DETECTION_STAGES, (prepared, candidates, accepted, classified)))
+
+
+def add_detection_stages(graph, signals, time=None, tracer=None):
+    """
+    Add the stages of detect_signal_peaks to a StageGraph.
+
+    The DETECTION_STAGES each depend on the channel parameter and only on the
+    detection parameters they use: prepare (smoothing and baseline) on none,
+    candidate_peaks on prominence_threshold and auto_period, accepted_peaks on
+    amplitude_tolerance and classified_peaks on high_threshold and
+    medium_threshold. A new classification threshold thus only repeats the
+    classification.
+
+    Args:
+        graph: stage_graph.StageGraph
+        signals: name of the stage producing a dict of channel name -> signal
+        time: optional name of a stage producing the time vector of the signals
+        tracer: optional tracing.Tracer for the detector steps
+
+    classified_peaks evaluates to (peaks, properties) of detect_signal_peaks.
+    """
+
+    def prepare(signals, channel):
+        return _detector(tracer).prepare(signals[channel])
+
+    def classified(signals, *inputs, channel, high_threshold, medium_threshold):
+        prepared, candidates, accepted = inputs[:3]
+        return _classified_peaks(
+            signals[channel],
+            prepared,
+            candidates,
+            accepted,
+            high_threshold,
+            medium_threshold,
+            inputs[3] if time else None,
+            tracer,
+        )
+
+    graph.add_stage("prepare", prepare, inputs=(signals,), params=("channel",))
+    graph.add_stage(
+        "candidate_peaks",
+        lambda prepared, **params: _candidate_peaks(prepared, tracer=tracer, **params),
+        inputs=("prepare",),
+        params=("prominence_threshold", "auto_period"),
+    )
+    graph.add_stage(
+        "accepted_peaks",
+        lambda *inputs, **params: _accepted_peaks(*inputs, tracer=tracer, **params),
+        inputs=("prepare", "candidate_peaks"),
+        params=("amplitude_tolerance",),
+    )
+    graph.add_stage(
+        "classified_peaks",
+        classified,
+        inputs=(signals, "prepare", "candidate_peaks", "accepted_peaks")
+        + ((time,) if time else ()),
+        params=("channel", "high_threshold", "medium_threshold"),
+    )
+
+
+def sweep_signal_peaks(prepared, grid, auto_period=False):
+    """
+    Evaluate a grid of detection parameters on a prepared signal, see sweep_peaks.
+
+    Args:
+        prepared: the value of the prepare stage, (normalized, statistics)
+        grid: dict of lists of prominence_threshold, amplitude_tolerance,
+            high_threshold and medium_threshold values, as used by
+            detect_signal_peaks
+
+    Returns:
+        DataFrame of sweep_peaks with the setting columns named as in grid
+    """
+    table = sweep_peaks(
+        _detector(auto_period=auto_period),
+        *prepared,
+        grid["prominence_threshold"],
+        grid["amplitude_tolerance"],
+        grid["high_threshold"],
+        grid["medium_threshold"],
+    )
+    return table.rename(columns={"min_prominence_pct": "prominence_threshold"})
+
+
+def print_peak_summary(properties):
+    """Print analysis results of a detection run"""
+    print("\nPeak Analysis Results:")
+    print(f"Number of peaks detected: {properties['peak_count']}")
+    print(f"Detected frequency: {properties['actual_frequency']:.2f} Hz")
+    print(f"Mean peak interval: {properties['mean_interval']:.2f} samples")
+    print(f"Signal quality score: {properties['signal_quality']:.3f}")
+    if "period_confidence" in properties:
+        print(
+            f"Expected period: {properties['expected_period']} samples "
+            f"(estimate confidence {properties['period_confidence']:.2f})"
+        )
+
+
+def find_signal_peaks(signal_data, params, time=None):
+    from tkinter import messagebox
+    try:
+        peaks, properties = detect_signal_peaks(signal_data, params, time)
 
         # Print analysis results
-        print("\nPeak Analysis Results:")
-        print(f"Number of peaks detected: {properties['peak_count']}")
-        print(f"Detected frequency: {properties['actual_frequency']:.2f} Hz")
-        print(f"Mean peak interval: {properties['mean_interval']:.2f} samples")
-        print(f"Signal quality score: {properties['signal_quality']:.3f}")
+        print_peak_summary(properties)
 
         return peaks, properties
 
     except Exception as e:
         messagebox.showerror("Error", f"Error in peak detection: {str(e)}")
-        return [], {"rejected_peaks": [], "peak_classifications": []}
+        return [], {
+            "rejected_peaks": [],
+            "peak_classifications": [],
+            "result": PeakResult.empty(),
+        }
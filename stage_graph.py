@@ -0,0 +1,107 @@
+from parallel_analysis import check_cancelled
+from tracing import NULL_TRACER
+
+
+class Stage:
+    """One step of a StageGraph: its compute function, upstream stages and parameters"""
+
+    __slots__ = ("name", "compute", "inputs", "params")
+
+    def __init__(self, name, compute, inputs, params):
+        self.name = name
+        self.compute = compute
+        self.inputs = tuple(inputs)
+        self.params = tuple(params)
+
+
+class StageGraph:
+    """
+    Analysis pipeline as a graph of stages whose results live in a StageCache.
+
+    Every stage names the stages it consumes and the parameters it depends on
+    directly. Its cache key is built from the values of those parameters and
+    the keys of its inputs, so it covers everything upstream of it too. When
+    a parameter changes only the stages downstream of it get new keys, and
+    evaluating a stage recomputes exactly those, reusing the cached results
+    of everything else.
+
+    A graph is cheap to build: compute functions may close over the
+    recording and tracer of one analysis, while the cache outlives it.
+
+    Args:
+        cache: StageCache holding the stage results
+        scope: first element of every key, the recording the results belong
+            to (see StageCache.discard)
+        cancel: optional threading.Event checked before computing each stage
+        tracer: optional tracing.Tracer, every computed stage gets a span of
+            its name, stages found in the cache none
+    """
+
+    def __init__(self, cache, scope, cancel=None, tracer=None):
+        self.cache = cache
+        self.scope = scope
+        self.cancel = cancel
+        self.tracer = tracer or NULL_TRACER
+        self.stages = {}
+
+    def add_stage(self, name, compute, inputs=(), params=()):
+        """
+        Add a stage computed as compute(*input values, **parameters).
+
+        Inputs must be added before the stages that consume them.
+        """
+        missing = [stage for stage in inputs if stage not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {name} uses unknown stages: {missing}")
+        self.stages[name] = Stage(name, compute, inputs, params)
+
+    def key(self, name, params):
+        """Cache key of a stage for the given parameters"""
+        return (self.scope,) + self._key(name, params)
+
+    def _key(self, name, params):
+        stage = self.stages[name]
+        return (
+            name,
+            tuple((param, params[param]) for param in stage.params),
+            tuple(self._key(upstream, params) for upstream in stage.inputs),
+        )
+
+    def dependencies(self, name):
+        """Parameters a stage depends on, directly or through its inputs"""
+        stage = self.stages[name]
+        params = set(stage.params)
+        for upstream in stage.inputs:
+            params |= self.dependencies(upstream)
+        return params
+
+    def invalidated_by(self, changed_params):
+        """Stages whose results change when the given parameters change"""
+        changed = set(changed_params)
+        return [name for name in self.stages if self.dependencies(name) & changed]
+
+    def cached(self, name, params):
+        """Whether the result of a stage is in the cache"""
+        return self.key(name, params) in self.cache
+
+    def put(self, name, params, value):
+        """Store a stage result computed outside the graph, e.g. on worker processes"""
+        self.cache.put(self.key(name, params), value)
+
+    def evaluate(self, name, params):
+        """Result of a stage, computing it and its missing inputs if needed"""
+        missing = object()
+        key = self.key(name, params)
+        value = self.cache.get(key, missing)
+        if value is not missing:
+            return value
+
+        stage = self.stages[name]
+        inputs = [self.evaluate(upstream, params) for upstream in stage.inputs]
+        check_cancelled(self.cancel)
+        with self.tracer.span(name):
+            value = stage.compute(
+                *inputs, **{param: params[param] for param in stage.params}
+            )
+        self.cache.put(key, value)
+        return value
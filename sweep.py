@@ -0,0 +1,239 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks, peak_prominences
+
+import rolling_stats
+from filter_engine import savgol, savgol_kernel
+
+# Columns of the table returned by sweep_peaks and sweep_signal. The setting
+# columns use the units of PeakDetector.detect_peaks.
+SWEEP_SETTINGS = (
+    "min_prominence_pct",
+    "amplitude_tolerance",
+    "high_threshold",
+    "medium_threshold",
+)
+SWEEP_RESULTS = (
+    "peak_count",
+    "rejected_count",
+    "high_count",
+    "medium_count",
+    "low_count",
+    "actual_frequency",
+    "signal_quality",
+)
+
+
+def parse_values(text, dtype=float):
+    """
+    Values of one sweep setting from text.
+
+    Accepts a comma separated list ("10, 20, 40"), an inclusive range with a
+    step ("10:50:10") or a mix of both.
+    """
+    values = []
+    for part in text.replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ":" in part:
+            start, stop, step = (float(value) for value in part.split(":"))
+            if step <= 0:
+                raise ValueError(f"Step of {part} must be positive")
+            count = int(np.floor((stop - start) / step + 1e-9)) + 1
+            values.extend(start + step * np.arange(max(count, 0)))
+        else:
+            values.append(float(part))
+    if not values:
+        raise ValueError("No values given")
+    return list(dict.fromkeys(dtype(round(value, 9)) for value in values))
+
+
+def _candidates(detector, normalized, statistics, min_prominence_pcts):
+    """
+    Candidate peaks for every prominence setting from one find_peaks run.
+
+    find_peaks applies the distance before the prominence condition, so the
+    peaks at any prominence threshold are those of the distance-only run
+    whose prominence reaches the threshold.
+
+    Returns:
+        list of (candidate peaks, positions in min_prominence_pcts using them)
+    """
+    noise_floor = detector._noise_floor(statistics)
+    peaks, _ = find_peaks(normalized, distance=detector._peak_distance())
+    prominences = peak_prominences(normalized, peaks)[0]
+
+    thresholds = np.array(
+        [
+            detector._min_prominence(normalized, pct, noise_floor, statistics)
+            for pct in min_prominence_pcts
+        ]
+    )
+    keep = prominences[None, :] >= thresholds[:, None]
+
+    # Thresholds keeping the same number of peaks keep the same peaks
+    groups = {}
+    for position, count in enumerate(np.count_nonzero(keep, axis=1)):
+        groups.setdefault(count, []).append(position)
+    return [(peaks[keep[positions[0]]], positions) for positions in groups.values()]
+
+
+def _accepted_masks(normalized, peaks, amplitude_tolerances):
+    """Accepted mask of _filter_peaks for every tolerance, shape (tolerances, peaks)"""
+    tolerances = np.asarray(amplitude_tolerances, dtype=np.float64)[:, None]
+    if len(peaks) < 2:
+        return np.ones((len(tolerances), len(peaks)), dtype=bool)
+
+    amplitudes = normalized[peaks]
+    window_size = min(20, len(amplitudes))
+    rolling_median = rolling_stats.rolling_median(amplitudes, window_size)
+    rolling_std = rolling_stats.rolling_std(amplitudes, window_size)
+
+    lower_bound = rolling_median - rolling_std * tolerances
+    upper_bound = rolling_median + rolling_std * tolerances
+    valid = (amplitudes >= lower_bound) & (amplitudes <= upper_bound)
+    return valid | (amplitudes > np.percentile(amplitudes, 99))
+
+
+def _at_least(sorted_values, thresholds):
+    """Number of sorted_values >= each threshold"""
+    return len(sorted_values) - np.searchsorted(sorted_values, thresholds, "left")
+
+
+def sweep_peaks(
+    detector,
+    normalized,
+    statistics,
+    min_prominence_pcts,
+    amplitude_tolerances,
+    high_thresholds,
+    medium_thresholds,
+):
+    """
+    Peak counts and quality of detect_peaks for every combination of settings.
+
+    The candidate peaks and their prominences are found once, then every
+    prominence threshold is a mask over them, every amplitude tolerance a row
+    of one broadcast comparison and the classification thresholds are
+    counted with a binary search over the sorted relative amplitudes. The
+    results equal those of detect_peaks run with each combination, at about
+    the cost of a single run.
+
+    Args:
+        detector: PeakDetector, with auto_period the period is estimated
+            from normalized first
+        normalized, statistics: the result of detector.prepare(signal)
+        min_prominence_pcts, amplitude_tolerances, high_thresholds,
+        medium_thresholds: values of each setting, as in detect_peaks
+
+    Returns:
+        DataFrame with one row per combination, the SWEEP_SETTINGS and
+        SWEEP_RESULTS columns; frequency and quality are NaN with fewer than
+        two accepted peaks
+    """
+    if detector.auto_period:
+        detector.estimate_period(normalized)
+
+    high = np.asarray(high_thresholds, dtype=np.float64)
+    medium = np.asarray(medium_thresholds, dtype=np.float64)
+    # Combinations of the classification thresholds, high varying slowest
+    high_grid = np.repeat(high, len(medium))
+    medium_grid = np.tile(medium, len(high))
+    medium_upper = np.maximum(medium_grid, high_grid)
+    classes = len(high_grid)
+
+    shape = (len(min_prominence_pcts), len(amplitude_tolerances), classes)
+    results = {name: np.zeros(shape, dtype=np.int64) for name in SWEEP_RESULTS[:5]}
+    results["actual_frequency"] = np.full(shape, np.nan)
+    results["signal_quality"] = np.full(shape, np.nan)
+
+    for candidates, positions in _candidates(
+        detector, normalized, statistics, min_prominence_pcts
+    ):
+        accepted_masks = _accepted_masks(normalized, candidates, amplitude_tolerances)
+        for tolerance, accepted_mask in enumerate(accepted_masks):
+            peaks = candidates[accepted_mask]
+            count = len(peaks)
+            results["peak_count"][positions, tolerance] = count
+            results["rejected_count"][positions, tolerance] = len(candidates) - count
+
+            properties = detector._calculate_properties(normalized, peaks)
+            if properties:
+                for name in ("actual_frequency", "signal_quality"):
+                    results[name][positions, tolerance] = properties[name]
+
+            if count == 0:
+                continue
+            amplitudes = normalized[peaks]
+            relative = np.sort(amplitudes / np.max(amplitudes))
+            high_count = _at_least(relative, high_grid)
+            medium_count = _at_least(relative, medium_grid) - _at_least(
+                relative, medium_upper
+            )
+            results["high_count"][positions, tolerance] = high_count
+            results["medium_count"][positions, tolerance] = medium_count
+            results["low_count"][positions, tolerance] = (
+                count - high_count - medium_count
+            )
+
+    settings = np.meshgrid(
+        np.asarray(min_prominence_pcts, dtype=np.float64),
+        np.asarray(amplitude_tolerances, dtype=np.float64),
+        np.arange(classes),
+        indexing="ij",
+    )
+    table = {
+        "min_prominence_pct": settings[0].ravel(),
+        "amplitude_tolerance": settings[1].ravel(),
+        "high_threshold": high_grid[settings[2].ravel()],
+        "medium_threshold": medium_grid[settings[2].ravel()],
+    }
+    table.update((name, values.ravel()) for name, values in results.items())
+    return pd.DataFrame(table)
+
+
+def sweep_signal(
+    detector,
+    signal,
+    window_lengths,
+    poly_orders,
+    min_prominence_pcts,
+    amplitude_tolerances,
+    high_thresholds,
+    medium_thresholds,
+):
+    """
+    sweep_peaks over a grid of Savitzky-Golay settings as well.
+
+    The signal is filtered and prepared once per window length and
+    polynomial order, the remaining settings are evaluated by sweep_peaks.
+    Invalid filter combinations (poly_order >= window_length) are skipped.
+
+    Returns:
+        DataFrame like sweep_peaks with leading window_length and poly_order
+        columns
+    """
+    tables = []
+    for window_length, poly_order in itertools.product(window_lengths, poly_orders):
+        try:
+            savgol_kernel(window_length, poly_order)
+        except ValueError:
+            continue
+        filtered = savgol(signal, window_length, poly_order)
+        table = sweep_peaks(
+            detector,
+            *detector.prepare(filtered),
+            min_prominence_pcts,
+            amplitude_tolerances,
+            high_thresholds,
+            medium_thresholds,
+        )
+        table.insert(0, "poly_order", poly_order)
+        table.insert(0, "window_length", window_length)
+        tables.append(table)
+    if not tables:
+        raise ValueError("No valid filter settings in the sweep")
+    return pd.concat(tables, ignore_index=True)
@@ -0,0 +1,203 @@
+import numpy as np
+from numpy.lib.format import open_memmap
+import pandas as pd
+
+from file_operations import ADC_COLUMNS
+
+# Samples generated per block. Noise is seeded per block, so the data only
+# depends on the parameters and never on how the caller consumes it.
+GENERATE_BLOCK = 1 << 20
+
+EVENT_DTYPE = np.dtype(
+    [
+        ("index", np.int64),
+        ("amplitude", np.float64),  # Amplitude on adc1, adc2 is scaled by gain
+        ("width", np.float64),  # Gaussian sigma in samples
+        ("water", np.bool_),
+    ]
+)
+
+
+class SyntheticRecording:
+    """
+    Deterministic two-channel recording resembling the captures of the device.
+
+    Both channels share a slowly drifting baseline with independent Gaussian
+    noise. Particles passing the sensor show up as Gaussian peaks on both
+    channels, adc2 slightly delayed and attenuated. Peaks come from two
+    populations: low "water" peaks and a broad log-normal "tissue" population
+    that spans the medium and high classes of the detector.
+
+    Args:
+        duration: length of the recording in seconds
+        sample_rate: samples per second and channel
+        noise: standard deviation of the noise in ADC counts
+        peak_rate: mean number of peaks per second
+        water_fraction: fraction of peaks belonging to the water population
+        seed: seed of all random draws, equal arguments give equal recordings
+    """
+
+    def __init__(
+        self,
+        duration,
+        sample_rate=50000,
+        noise=3.0,
+        peak_rate=3.0,
+        water_fraction=0.5,
+        seed=0,
+        baseline=2048,
+        water_amplitude=22.0,
+        tissue_amplitude=180.0,
+        peak_width=0.001,
+        channel_delay=0.0002,
+        channel_gain=0.85,
+    ):
+        self.duration = duration
+        self.sample_rate = sample_rate
+        self.noise = noise
+        self.peak_rate = peak_rate
+        self.water_fraction = water_fraction
+        self.seed = seed
+        self.baseline = baseline
+        self.water_amplitude = water_amplitude
+        self.tissue_amplitude = tissue_amplitude
+        self.peak_width = peak_width
+        self.channel_delay = channel_delay
+        self.channel_gain = channel_gain
+        self.length = int(round(duration * sample_rate))
+        self._events = None
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def nbytes(self):
+        """Size of the int16 recording in memory"""
+        return self.length * len(ADC_COLUMNS) * np.dtype(np.int16).itemsize
+
+    @property
+    def events(self):
+        """Ground truth peaks as an EVENT_DTYPE array sorted by index"""
+        if self._events is None:
+            self._events = self._generate_events()
+        return self._events
+
+    def _generate_events(self):
+        rng = np.random.default_rng([self.seed, 0])
+
+        # Intervals vary around the mean so peaks neither collide nor form a grid
+        mean_interval = self.sample_rate / self.peak_rate
+        count = int(self.duration * self.peak_rate * 1.5) + 2
+        intervals = rng.uniform(0.6, 1.4, count) * mean_interval
+        positions = np.cumsum(intervals)
+        margin = 5 * self.peak_width * self.sample_rate
+        positions = positions[positions < self.length - margin]
+
+        events = np.zeros(len(positions), dtype=EVENT_DTYPE)
+        events["index"] = positions.astype(np.int64)
+        events["water"] = rng.random(len(positions)) < self.water_fraction
+        water = events["water"]
+        events["amplitude"] = np.where(
+            water,
+            self.water_amplitude * rng.uniform(0.8, 1.2, len(positions)),
+            self.tissue_amplitude * rng.lognormal(0.0, 0.3, len(positions)),
+        )
+        events["width"] = (
+            self.peak_width * self.sample_rate * rng.uniform(0.8, 1.25, len(positions))
+        )
+        return events
+
+    def block(self, number):
+        """Samples of block `number` as an (n, 2) int16 array"""
+        start = number * GENERATE_BLOCK
+        stop = min(start + GENERATE_BLOCK, self.length)
+        rng = np.random.default_rng([self.seed, 1, number])
+        positions = np.arange(start, stop, dtype=np.float64)
+
+        # Slow baseline wander shared by both channels
+        drift = 4.0 * np.sin(2 * np.pi * 0.05 * positions / self.sample_rate)
+        signal = np.empty((stop - start, 2), dtype=np.float64)
+        for channel in range(2):
+            signal[:, channel] = self.baseline + drift
+            signal[:, channel] += rng.normal(0.0, self.noise, stop - start)
+
+        # Add every peak whose support overlaps the block
+        delay = self.channel_delay * self.sample_rate
+        events = self.events
+        reach = 5 * events["width"].max() if len(events) else 0
+        first, last = np.searchsorted(
+            events["index"], [start - reach - delay, stop + reach]
+        )
+        for event in events[first:last]:
+            half = int(5 * event["width"])
+            for channel, shift, gain in ((0, 0.0, 1.0), (1, delay, self.channel_gain)):
+                center = event["index"] + shift
+                lo = max(int(center) - half, start)
+                hi = min(int(center) + half + 1, stop)
+                if hi <= lo:
+                    continue
+                offsets = (np.arange(lo, hi) - center) / event["width"]
+                signal[lo - start : hi - start, channel] += (
+                    gain * event["amplitude"] * np.exp(-0.5 * offsets**2)
+                )
+
+        info = np.iinfo(np.int16)
+        return np.clip(np.rint(signal), info.min, info.max).astype(np.int16)
+
+    def blocks(self):
+        """Yield the recording as consecutive (n, 2) int16 blocks"""
+        for number in range(-(-self.length // GENERATE_BLOCK)):
+            yield self.block(number)
+
+    def array(self):
+        """The whole recording as an (n, 2) int16 array, as saved by convert_to_npy"""
+        data = np.empty((self.length, 2), dtype=np.int16)
+        start = 0
+        for block in self.blocks():
+            data[start : start + len(block)] = block
+            start += len(block)
+        return data
+
+    def dataframe(self):
+        """The whole recording as a float32 DataFrame, as returned by the loaders"""
+        return pd.DataFrame(self.array(), columns=list(ADC_COLUMNS)).astype(
+            {column: "float32" for column in ADC_COLUMNS}
+        )
+
+    def write_npy(self, path):
+        """Write the recording as an int16 .npy file, one block at a time"""
+        data = open_memmap(path, mode="w+", dtype=np.int16, shape=(self.length, 2))
+        start = 0
+        for block in self.blocks():
+            data[start : start + len(block)] = block
+            start += len(block)
+        data.flush()
+        del data
+
+    def write_csv(self, path):
+        """Write the recording as an adc1,adc2 CSV file, one chunk at a time"""
+        with open(path, "w", newline="") as f:
+            f.write(",".join(ADC_COLUMNS) + "\n")
+            for block in self.blocks():
+                pd.DataFrame(block).to_csv(f, header=False, index=False)
+
+    def expected_peaks(self, downsample_rate=1):
+        """
+        Ground truth in the startTime,endTime,label format of exported peaks.
+
+        Times are those of the peak samples after downsampling by
+        downsample_rate, as in the analysis of the GUI.
+        """
+        events = self.events
+        times = (
+            np.round(events["index"] / downsample_rate)
+            * downsample_rate
+            / self.sample_rate
+        )
+        return pd.DataFrame(
+            {
+                "startTime": times,
+                "endTime": times,
+                "label": np.where(events["water"], "water", "tissue"),
+            }
+        )
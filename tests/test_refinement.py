@@ -0,0 +1,24 @@
+import numpy as np
+
+from refinement import decimate
+
+
+def test_decimate_constant_signal_has_no_edge_overshoot():
+    signal = np.full(100_000, 2048, dtype=np.int16)
+    decimated = decimate(signal, 10)
+    assert len(decimated) == 10_000
+    np.testing.assert_allclose(decimated, 2048, atol=1e-6)
+
+
+def test_decimate_slow_ramp_follows_the_ramp_at_the_ends():
+    signal = np.linspace(0.0, 1000.0, 100_000)
+    decimated = decimate(signal, 10)
+    np.testing.assert_allclose(decimated, signal[::10], atol=1e-6)
+
+
+def test_decimate_blocks_match_a_single_pass():
+    rng = np.random.default_rng(0)
+    signal = np.cumsum(rng.normal(size=50_003)) + 500
+    whole = decimate(signal, 10, block_size=len(signal))
+    blocks = decimate(signal, 10, block_size=4_000)
+    np.testing.assert_allclose(blocks, whole, atol=1e-9)
@@ -0,0 +1,241 @@
+import json
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+
+# Tracers measuring allocations, tracemalloc runs while there is at least one
+_allocation_tracers = 0
+_allocation_lock = threading.Lock()
+_owns_tracemalloc = False  # Whether tracemalloc was started here
+
+# Span info that is added up over calls in Tracer.summary, other info keeps
+# the value of the last call
+SUMMED_INFO = ("samples", "peaks", "rejected", "channels")
+
+
+class Span:
+    """One timed stage: wall time, nesting depth, sizes and allocations"""
+
+    __slots__ = (
+        "name",
+        "start",
+        "duration",
+        "depth",
+        "pid",
+        "thread",
+        "info",
+        "allocated",
+        "peak_allocated",
+    )
+
+    def __init__(self, name, start, depth, info):
+        self.name = name
+        self.start = start  # perf_counter() seconds
+        self.duration = 0.0
+        self.depth = depth
+        self.pid = os.getpid()
+        self.thread = threading.get_ident()
+        self.info = info  # Input sizes and other details, JSON serializable
+        self.allocated = None  # Net bytes still allocated at the end of the span
+        self.peak_allocated = None  # Peak bytes allocated during the span
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        span = cls(values["name"], values["start"], values["depth"], values["info"])
+        for name in cls.__slots__:
+            setattr(span, name, values[name])
+        return span
+
+
+class Tracer:
+    """
+    Records the wall time of nested pipeline stages.
+
+    Stages are wrapped in `with tracer.span("name", samples=len(signal)):`,
+    the yielded Span accepts further details in its info dict. Every finished
+    span is passed to the hooks added with add_hook.
+
+    With trace_allocations, memory allocated inside each span is measured with
+    tracemalloc. This slows allocations down noticeably, and the numbers are
+    process wide, so spans of other threads running at the same time count too.
+    """
+
+    def __init__(self, trace_allocations=False):
+        self.trace_allocations = trace_allocations
+        self.spans = []
+        self.hooks = []
+        self.origin = perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tracing_allocations = False
+
+    def add_hook(self, hook):
+        """Call hook(span) whenever a span finishes"""
+        self.hooks.append(hook)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _start_tracemalloc(self):
+        global _allocation_tracers, _owns_tracemalloc
+        with _allocation_lock:
+            if self._tracing_allocations:
+                return
+            if _allocation_tracers == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _owns_tracemalloc = True
+            _allocation_tracers += 1
+            self._tracing_allocations = True
+
+    def close(self):
+        """Stop tracemalloc once no other tracer measures allocations"""
+        global _allocation_tracers, _owns_tracemalloc
+        with _allocation_lock:
+            if not self._tracing_allocations:
+                return
+            self._tracing_allocations = False
+            _allocation_tracers -= 1
+            if _allocation_tracers == 0 and _owns_tracemalloc:
+                tracemalloc.stop()
+                _owns_tracemalloc = False
+
+    @contextmanager
+    def span(self, name, **info):
+        stack = self._stack()
+        span = Span(name, perf_counter(), len(stack), info)
+        if self.trace_allocations:
+            self._start_tracemalloc()
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:  # Keep the peak reached so far for the enclosing span
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            entry = [span, current, current]  # span, peak so far, start memory
+        else:
+            entry = [span, None, None]
+        stack.append(entry)
+
+        try:
+            yield span
+        finally:
+            stack.pop()
+            span.duration = perf_counter() - span.start
+            if self.trace_allocations and tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(entry[1], peak)
+                span.allocated = current - entry[2]
+                span.peak_allocated = peak - entry[2]
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], peak)
+                tracemalloc.reset_peak()
+            self._record(span)
+
+    def _record(self, span):
+        with self._lock:
+            self.spans.append(span)
+        for hook in self.hooks:
+            hook(span)
+
+    def merge(self, spans):
+        """
+        Add spans recorded by another tracer, e.g. in a worker process.
+
+        The spans are nested below the currently open span of this thread.
+        Span.to_dict/from_dict can be used to send them between processes.
+        """
+        depth = len(self._stack())
+        for span in spans:
+            if isinstance(span, dict):
+                span = Span.from_dict(span)
+            span.depth += depth
+            self._record(span)
+
+    def summary(self):
+        """
+        Time per stage name, in order of first appearance.
+
+        Returns:
+            list of dicts with name, depth, calls, total duration, info (with
+            the SUMMED_INFO values added up over all calls) and the largest
+            peak allocation
+        """
+        rows = {}
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        for span in spans:
+            row = rows.get(span.name)
+            if row is None:
+                row = rows[span.name] = {
+                    "name": span.name,
+                    "depth": span.depth,
+                    "calls": 0,
+                    "duration": 0.0,
+                    "info": {},
+                    "peak_allocated": None,
+                }
+            row["calls"] += 1
+            row["duration"] += span.duration
+            for key, value in span.info.items():
+                if key in SUMMED_INFO:
+                    value += row["info"].get(key, 0)
+                row["info"][key] = value
+            if span.peak_allocated is not None:
+                row["peak_allocated"] = max(
+                    row["peak_allocated"] or 0, span.peak_allocated
+                )
+        return list(rows.values())
+
+    def to_chrome_trace(self):
+        """Spans in the Chrome trace event format (chrome://tracing, Perfetto)"""
+        with self._lock:
+            spans = list(self.spans)
+        events = []
+        for span in spans:
+            args = dict(span.info)
+            if span.allocated is not None:
+                args["allocated_bytes"] = span.allocated
+                args["peak_allocated_bytes"] = span.peak_allocated
+            events.append(
+                {
+                    "name": span.name,
+                    "ph": "X",
+                    "ts": (span.start - self.origin) * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": span.pid,
+                    "tid": span.thread,
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_json(self, path):
+        """Write the spans as a Chrome trace JSON file"""
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+
+class NullTracer:
+    """Tracer that records nothing, the default of the instrumented functions"""
+
+    trace_allocations = False
+    spans = ()
+
+    @contextmanager
+    def span(self, name, **info):
+        yield Span(name, 0.0, 0, info)
+
+    def merge(self, spans):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_TRACER = NullTracer()
@@ -0,0 +1,213 @@
+import contextlib
+import itertools
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+from analysis_cache import estimate_nbytes
+from file_operations import CSV_CHUNK_ROWS, MappedRecording
+
+# Default memory budget of the recordings kept in RAM by a workspace
+DEFAULT_WORKSPACE_BYTES = 2 << 30  # 2 GiB
+
+
+class WorkspaceRecording:
+    """One open recording of a Workspace"""
+
+    __slots__ = ("name", "data", "source", "path")
+
+    def __init__(self, name, data, source=None):
+        self.name = name
+        self.data = data
+        self.source = source  # Normalized path of the file it was read from
+        self.path = None  # Backing file, once the recording has been evicted
+
+    @property
+    def nbytes(self):
+        """
+        RAM held by the recording data.
+
+        Measured on every call: columns a container decompresses while the
+        recording is analyzed count once they have been read.
+        """
+        if isinstance(self.data, pd.DataFrame):
+            return estimate_nbytes(self.data)
+        return self.data.nbytes
+
+    @property
+    def resident(self):
+        return self.nbytes > 0
+
+
+class Workspace:
+    """
+    Recordings open at the same time, kept in RAM up to a memory budget.
+
+    Every recording gets an id that stays the same while it is open, so
+    stage results cached under it (see StageCache) remain valid when
+    switching between recordings. Recordings held in RAM, e.g. loaded from
+    CSV, are evicted least recently used first once together they exceed
+    max_bytes: their samples are written to a memory-mapped .npy backing
+    file and the recording is replaced by a MappedRecording of it. Getting
+    an evicted recording pages it back into RAM if it fits the budget,
+    otherwise it keeps being read from its backing file. Memory-mapped
+    recordings cost nothing against the budget, except the whole columns a
+    container decompresses (see MappedRecording), which eviction drops.
+
+    Args:
+        max_bytes: budget of the recordings held in RAM
+        spill_dir: directory for backing files, a temporary directory
+            removed with the workspace by default
+        on_release: optional callback(recording_id) when the RAM data of a
+            recording is dropped or the recording is removed, to drop
+            results that still reference it
+    """
+
+    def __init__(
+        self, max_bytes=DEFAULT_WORKSPACE_BYTES, spill_dir=None, on_release=None
+    ):
+        self.max_bytes = max_bytes
+        self.on_release = on_release
+        self._recordings = OrderedDict()  # recording id -> WorkspaceRecording
+        self._ids = itertools.count()
+        self._lock = threading.RLock()
+        if spill_dir is None:
+            self._spill = tempfile.TemporaryDirectory(
+                prefix="workspace-", ignore_cleanup_errors=True
+            )
+            spill_dir = self._spill.name
+        self.spill_dir = spill_dir
+
+    def __len__(self):
+        return len(self._recordings)
+
+    def __contains__(self, recording_id):
+        return recording_id in self._recordings
+
+    @property
+    def resident_bytes(self):
+        """RAM held by the recordings in the workspace"""
+        with self._lock:
+            return sum(entry.nbytes for entry in self._recordings.values())
+
+    def recordings(self):
+        """(recording id, name, resident) of every recording, in opening order"""
+        with self._lock:
+            entries = sorted(self._recordings.items())
+            return [(key, entry.name, entry.resident) for key, entry in entries]
+
+    def trim(self):
+        """Evict recordings until the budget is kept again, e.g. after an analysis"""
+        with self._lock:
+            self._fit()
+
+    def add(self, name, data, source=None):
+        """
+        Open a recording, evicting others if it does not fit the budget.
+
+        Args:
+            source: optional path of the file the recording was read from,
+                see find
+
+        Returns:
+            id of the recording, get it with get(id)
+        """
+        with self._lock:
+            recording_id = next(self._ids)
+            if source is not None:
+                source = _normalized_path(source)
+            self._recordings[recording_id] = WorkspaceRecording(name, data, source)
+            self._fit()
+            return recording_id
+
+    def find(self, source):
+        """Id of the open recording read from the file source, None if none is"""
+        source = _normalized_path(source)
+        with self._lock:
+            for recording_id, entry in self._recordings.items():
+                if entry.source == source:
+                    return recording_id
+        return None
+
+    def get(self, recording_id):
+        """Data of a recording, marked as most recently used"""
+        with self._lock:
+            entry = self._recordings[recording_id]
+            self._recordings.move_to_end(recording_id)
+            if entry.path is not None and not entry.resident:
+                self._page_in(entry)
+                self._fit()
+            return entry.data
+
+    def name(self, recording_id):
+        return self._recordings[recording_id].name
+
+    def remove(self, recording_id):
+        """Close a recording and delete its backing file"""
+        with self._lock:
+            entry = self._recordings.pop(recording_id)
+        self._release(recording_id)
+        if entry.path is not None:
+            entry.data = None
+            with contextlib.suppress(OSError):  # Still mapped elsewhere
+                os.remove(entry.path)
+
+    def _fit(self):
+        """Evict least recently used recordings until the budget is kept"""
+        total = sum(entry.nbytes for entry in self._recordings.values())
+        for recording_id, entry in list(self._recordings.items()):
+            if total <= self.max_bytes:
+                break
+            if entry.resident:
+                total -= entry.nbytes
+                self._evict(recording_id, entry)
+
+    def _evict(self, recording_id, entry):
+        """Replace the RAM data of a recording with a mapping of its backing file"""
+        if isinstance(entry.data, MappedRecording):  # Decompressed columns
+            entry.data.release()
+            self._release(recording_id)
+            return
+        if entry.path is None:  # Data never changes, a backing file stays valid
+            entry.path = os.path.join(self.spill_dir, f"recording-{recording_id}.npy")
+            _write_backing_file(entry.path, entry.data)
+        entry.data = MappedRecording(
+            np.load(entry.path, mmap_mode="r"), list(entry.data.columns)
+        )
+        self._release(recording_id)
+
+    def _page_in(self, entry):
+        """Read an evicted recording back into RAM if it fits the budget"""
+        size = os.path.getsize(entry.path)
+        if size > self.max_bytes:
+            return
+        entry.data = entry.data.window(dtype=entry.data.array.dtype)
+
+    def _release(self, recording_id):
+        if self.on_release is not None:
+            self.on_release(recording_id)
+
+
+def _normalized_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _write_backing_file(path, data, chunk_rows=CSV_CHUNK_ROWS):
+    """Write the columns of a DataFrame as one 2-D .npy file, chunk by chunk"""
+    columns = [data[column].to_numpy() for column in data.columns]
+    dtype = np.result_type(*columns)
+    output = open_memmap(path, mode="w+", dtype=dtype, shape=(len(data), len(columns)))
+    try:
+        for start in range(0, len(data), chunk_rows):
+            for i, values in enumerate(columns):
+                output[start : start + chunk_rows, i] = values[
+                    start : start + chunk_rows
+                ]
+        output.flush()
+    finally:
+        del output